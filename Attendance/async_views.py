@@ -0,0 +1,261 @@
+"""
+Native async versions of the hot attendance endpoints, routed only under ASGI
+(see ATTENDANCE_ASYNC_VIEWS).
+
+DRF function views are sync, so under ASGI every request takes a thread hop
+and holds a worker thread while it waits on the database. These views run on
+the event loop instead: JWT validation is CPU only, the employee, presence and
+QR lookups use the async ORM, and absorbed auto_attend pings never leave the
+loop. Only the locked write path (record_attendance) runs in a thread through
+sync_to_async, because it needs a transaction.
+
+Payloads and status codes are produced by the same helpers as the sync views
+in views.py, so clients cannot tell the two stacks apart.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from . import geofence, ping_tracker, principals, qr_codes, revocation
+from .idempotency import aidempotent
+from .models import EmployeePresence
+from .views import _absorbed_ping_payload, _escalate_ping, _presence_payload, _record_scan
+
+jwt_authentication = JWTAuthentication()
+
+
+def _response(payload, status_code=status.HTTP_200_OK):
+    return JsonResponse(payload, status=status_code, encoder=DjangoJSONEncoder, safe=False)
+
+
+def _request_data(request):
+    """
+    JSON body, falling back to form data like DRF's parsers. None when the
+    body is not a JSON object, so the view answers 400 instead of failing on
+    ``data.get``.
+    """
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+    return request.POST
+
+
+async def _authenticate(request):
+    """
+    Async equivalent of RevocableJWTAuthentication.authenticate(). Returns the
+    Employee, or raises AuthenticationFailed/InvalidToken. The Employee is kept
+    on the request, so the idempotency check and the view authenticate once.
+    """
+    user = getattr(request, '_jwt_user', None)
+    if user is not None:
+        return user
+
+    header = jwt_authentication.get_header(request)
+    raw_token = jwt_authentication.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        raise AuthenticationFailed('Authentication credentials were not provided.')
+
+    validated_token = jwt_authentication.get_validated_token(raw_token)
+    jti = validated_token.get(api_settings.JTI_CLAIM)
+    if jti is not None and await revocation.ais_revoked(jti):
+        raise InvalidToken({'detail': 'Token is blacklisted', 'code': 'token_not_valid'})
+    try:
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken('Token contained no recognizable user identification')
+
+    user = await principals.aget(user_id)
+    if user is None:
+        raise AuthenticationFailed('User not found', code='user_not_found')
+    if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+        raise AuthenticationFailed('User is inactive', code='user_inactive')
+    request._jwt_user = user
+    return user
+
+
+async def _authenticated_employee(request, data):
+    """
+    Employee ID of the authenticated bearer, None when authentication fails:
+    the view then answers 401, and a revoked token or an inactive employee
+    never gets a stored response replayed
+    """
+    try:
+        user = await _authenticate(request)
+    except (AuthenticationFailed, InvalidToken):
+        return None
+    return user.employee_id
+
+
+async def _body_employee(request, data):
+    return data.get('employee_id') if isinstance(data, dict) else None
+
+
+def _unauthorized(exc):
+    return _response({'detail': exc.detail}, status.HTTP_401_UNAUTHORIZED)
+
+
+@csrf_exempt
+@require_POST
+@aidempotent('mark_attendance', _body_employee)
+async def mark_attendance(request):
+    """
+    Async mark_attendance, see views.mark_attendance.
+
+    Methods:
+        POST
+
+    Returns:
+        - Success (200): Attendance details with timestamp
+        - Error (400): Validation error details
+    """
+    try:
+        code = request.GET.get('code')
+        usage_type = request.GET.get('type')
+
+        data = _request_data(request)
+        if data is None:
+            return _response({'error': 'Malformed JSON body'}, status.HTTP_400_BAD_REQUEST)
+        employee_id = data.get('employee_id')
+        current_latitude = data.get('latitude')
+        current_longitude = data.get('longitude')
+
+        if not all([code, usage_type, employee_id, current_latitude, current_longitude]):
+            return _response({
+                'error': 'Missing required fields',
+                'required': {
+                    'code': bool(code),
+                    'type': bool(usage_type),
+                    'employee_id': bool(employee_id),
+                    'latitude': bool(current_latitude),
+                    'longitude': bool(current_longitude)
+                }
+            }, status.HTTP_400_BAD_REQUEST)
+
+        match = await geofence.alocate(current_latitude, current_longitude)
+        if match is None:
+            return _response({
+                'error': 'No valid office location found'
+            }, status.HTTP_400_BAD_REQUEST)
+
+        if not match.inside:
+            return _response({
+                'error': 'You are too far from the office location',
+                'distance': f'{match.distance:.2f} meters',
+                'max_allowed': f'{match.office.radius_meters} meters'
+            }, status.HTTP_400_BAD_REQUEST)
+
+        if not await qr_codes.ais_valid_code(code, usage_type):
+            return _response({
+                'error': 'Invalid or expired QR code'
+            }, status.HTTP_400_BAD_REQUEST)
+
+        payload, status_code = await sync_to_async(_record_scan)(employee_id, usage_type, match.distance)
+        return _response(payload, status_code)
+
+    except Exception as e:
+        return _response({
+            'error': str(e)
+        }, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@csrf_exempt
+@require_POST
+@aidempotent('auto_attend', _authenticated_employee)
+async def auto_attend(request):
+    """
+    Async auto_attend, see views.auto_attend.
+
+    Methods:
+        POST
+
+    Features:
+        - Absorbed pings are answered on the event loop without a thread hop
+        - Escalated pings write through record_attendance in a thread
+
+    Returns:
+        - Success (200): Attendance status and details
+        - Error (400): Location/validation errors
+        - Error (401): Missing or invalid token
+    """
+    try:
+        user = await _authenticate(request)
+    except (AuthenticationFailed, InvalidToken) as e:
+        return _unauthorized(e)
+
+    try:
+        data = _request_data(request)
+        if data is None:
+            return _response({'error': 'Malformed JSON body'}, status.HTTP_400_BAD_REQUEST)
+        current_latitude = data.get('latitude')
+        current_longitude = data.get('longitude')
+        employee_id = user.employee_id
+
+        if not all([current_latitude, current_longitude]):
+            return _response({
+                'error': 'Location coordinates are required',
+                'required': {
+                    'latitude': bool(current_latitude),
+                    'longitude': bool(current_longitude)
+                }
+            }, status.HTTP_400_BAD_REQUEST)
+
+        match = await geofence.alocate(current_latitude, current_longitude)
+        if match is None:
+            return _response({
+                'error': 'No valid office location found'
+            }, status.HTTP_400_BAD_REQUEST)
+
+        decision = await ping_tracker.tracker.adecide(employee_id, match)
+        if decision.action is None:
+            return _response(_absorbed_ping_payload(decision, match))
+
+        payload, status_code = await sync_to_async(_escalate_ping)(employee_id, decision.action, match)
+        return _response(payload, status_code)
+
+    except Exception as e:
+        return _response({
+            'error': str(e)
+        }, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@require_GET
+async def presence_status(request):
+    """
+    Async presence_status, see views.presence_status.
+
+    Methods:
+        GET
+
+    Returns:
+        - Success (200): Current state, open session start and today's minutes
+        - Error (401): Missing or invalid token
+        - Error (404): Employee not found
+    """
+    try:
+        user = await _authenticate(request)
+    except (AuthenticationFailed, InvalidToken) as e:
+        return _unauthorized(e)
+
+    employee_id = user.employee_id
+    if user.is_superuser or user.is_staff:
+        employee_id = request.GET.get('employee', employee_id)
+
+    presence = await EmployeePresence.objects.filter(employee_id=employee_id).afirst()
+    if presence is None:
+        # Rare: no presence row yet, rebuilt from history in a thread
+        payload, status_code = await sync_to_async(_presence_payload)(employee_id, None)
+    else:
+        payload, status_code = _presence_payload(employee_id, presence)
+    return _response(payload, status_code)
@@ -0,0 +1,41 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from . import principals, revocation
+
+
+class RevocableJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that also rejects blacklisted tokens. The JTI is checked
+    against the in-memory revocation list (see revocation.py), so requests
+    with valid tokens do not query the blacklist tables, and the Employee
+    comes from the principal cache (see principals.py) instead of the
+    employee table.
+    """
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        jti = validated_token.get(api_settings.JTI_CLAIM)
+        if jti is not None and revocation.is_revoked(jti):
+            raise InvalidToken({'detail': 'Token is blacklisted', 'code': 'token_not_valid'})
+        return validated_token
+
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            # Needs the password hash, which the principal cache does not hold
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_('Token contained no recognizable user identification')) from e
+
+        user = principals.get(user_id)
+        if user is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return user
@@ -0,0 +1,106 @@
+"""
+Typed columnar encoding (Apache Arrow IPC streams and Parquet files) of
+export chunks, for payroll and BI.
+
+pyarrow is optional: it is imported on first use, and only the Arrow and
+Parquet exports need it. Columns are typed from the exports.Dataset
+descriptions:
+
+    - ids as int64, minutes as int32, work dates as date32
+    - timestamps as Arrow timestamp[us, UTC] (int64 microseconds since the epoch)
+    - employee_id, username and activity dictionary-encoded strings
+
+Every chunk of rows becomes one record batch (one Parquet row group), so
+memory is bounded by the chunk size rather than by the export size.
+"""
+from io import BytesIO
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+
+def arrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImproperlyConfigured('Arrow and Parquet exports require pyarrow (pip install pyarrow)')
+    return pyarrow
+
+
+def parquet():
+    arrow()
+    import pyarrow.parquet
+    return pyarrow.parquet
+
+
+def available():
+    try:
+        arrow()
+    except ImproperlyConfigured:
+        return False
+    return True
+
+
+def arrow_type(kind):
+    pa = arrow()
+    return {
+        'int32': pa.int32(),
+        'int64': pa.int64(),
+        'date': pa.date32(),
+        'timestamp': pa.timestamp('us', tz='UTC'),
+        'dictionary': pa.dictionary(pa.int32(), pa.string()),
+    }[kind]
+
+
+def schema(columns):
+    pa = arrow()
+    return pa.schema([pa.field(name, arrow_type(kind)) for name, _, kind in columns])
+
+
+def record_batch(columns, rows):
+    """One RecordBatch from a list of value tuples ordered like ``columns``"""
+    pa = arrow()
+    arrays = []
+    for (name, _, kind), values in zip(columns, zip(*rows)):
+        if kind == 'dictionary':
+            arrays.append(pa.array(values, pa.string()).dictionary_encode())
+        else:
+            arrays.append(pa.array(values, arrow_type(kind)))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema(columns))
+
+
+def arrow_stream(columns, chunks):
+    """Yield the bytes of an Arrow IPC stream, one record batch per chunk of rows"""
+    pa = arrow()
+    sink = BytesIO()
+
+    def drain():
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    # The stream format allows each batch to carry its own dictionaries
+    with pa.ipc.new_stream(sink, schema(columns)) as writer:
+        yield drain()
+        for rows in chunks:
+            writer.write_batch(record_batch(columns, rows))
+            yield drain()
+    yield drain()
+
+
+def write_parquet(path, columns, chunks):
+    """
+    Write chunks of rows to a Parquet file, one row group per chunk. The file
+    is written next to ``path`` and renamed into place, so readers never see
+    a partial file. Returns the number of rows written.
+    """
+    pq = parquet()
+    temporary = f'{path}.tmp'
+    rows_written = 0
+    with pq.ParquetWriter(temporary, schema(columns), compression='zstd') as writer:
+        for rows in chunks:
+            writer.write_batch(record_batch(columns, rows))
+            rows_written += len(rows)
+    os.replace(temporary, path)
+    return rows_written
@@ -0,0 +1,83 @@
+"""
+Index-friendly date and hour filters.
+
+``timestamp__date__gte`` and ``timestamp__hour`` wrap the column in a
+function (DATE(CONVERT_TZ(timestamp, ...)), EXTRACT(HOUR ...)), so MySQL
+cannot use an index on ``timestamp`` and scans the table. The helpers here
+filter on the bare column instead:
+
+    - a date range becomes a half-open range of timestamps, from the start of
+      the first day to the start of the day after the last one, in the
+      current time zone (TIME_ZONE)
+    - the hour of day is matched against the stored ``local_hour`` generated
+      column, which is indexed (see queries.write)
+
+Query parameters are validated here; malformed values raise a DRF
+ValidationError (400) instead of a database error.
+"""
+from datetime import date, datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import ValidationError
+
+
+def day_start(day):
+    """Aware start of ``day`` in the current time zone"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def parse_day(value, name='date'):
+    """``date`` from a YYYY-MM-DD query parameter (or a date, or None)"""
+    if value is None or value == '' or isinstance(value, date):
+        return value or None
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        raise ValidationError({name: 'Enter a valid date (YYYY-MM-DD).'})
+    return day
+
+
+def parse_hour(value, name='hour'):
+    """Hour of day 0-23 from a query parameter (or None)"""
+    if value is None or value == '':
+        return None
+    try:
+        hour = int(value)
+    except (TypeError, ValueError):
+        hour = -1
+    if not 0 <= hour <= 23:
+        raise ValidationError({name: 'Enter an hour between 0 and 23.'})
+    return hour
+
+
+def timestamp_range(queryset, start_date=None, end_date=None, field='timestamp'):
+    """Rows whose ``field`` falls on ``start_date`` .. ``end_date`` (inclusive local days)"""
+    start_date = parse_day(start_date, 'start_date')
+    end_date = parse_day(end_date, 'end_date')
+    if start_date:
+        queryset = queryset.filter(**{f'{field}__gte': day_start(start_date)})
+    if end_date:
+        queryset = queryset.filter(**{f'{field}__lt': day_start(end_date + timedelta(days=1))})
+    return queryset
+
+
+def date_range(queryset, start_date=None, end_date=None, field='work_date'):
+    """Rows whose DateField ``field`` is within ``start_date`` .. ``end_date``"""
+    start_date = parse_day(start_date, 'start_date')
+    end_date = parse_day(end_date, 'end_date')
+    if start_date:
+        queryset = queryset.filter(**{f'{field}__gte': start_date})
+    if end_date:
+        queryset = queryset.filter(**{f'{field}__lte': end_date})
+    return queryset
+
+
+def hour_of_day(queryset, hour, field='local_hour'):
+    """Rows recorded during local ``hour`` (0-23), through the indexed generated column"""
+    hour = parse_hour(hour)
+    if hour is None:
+        return queryset
+    return queryset.filter(**{field: hour})
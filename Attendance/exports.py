@@ -0,0 +1,168 @@
+"""
+Streaming CSV/NDJSON/Arrow exports for payroll and BI.
+
+The JSON list endpoints build the whole result before rendering it. Exports
+are written to the client row by row from a generator through
+StreamingHttpResponse instead:
+
+    - rows are read with ``values_list`` in keyset chunks (``WHERE key > last
+      ORDER BY key LIMIT chunk``). ``.iterator()`` alone does not bound memory
+      on MySQL, whose driver buffers the full result set client side.
+    - each chunk is encoded and, when the client sends ``Accept-Encoding:
+      gzip``, compressed on the fly, so memory stays flat whatever the row count
+
+A ``Dataset`` describes what is exported from a table: the columns, their
+Arrow types (used by columnar.py) and the unique keyset ordering.
+"""
+import csv
+import zlib
+from dataclasses import dataclass
+from io import StringIO
+from itertools import chain
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.text import slugify
+
+from . import columnar
+from .pagination import keyset_after
+
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),  # Needs pyarrow
+}
+CHUNK_SIZE = 2000
+
+
+@dataclass(frozen=True)
+class Dataset:
+    columns: tuple  # (name, values_list path, arrow type: see columnar.TYPES)
+    ordering: tuple  # Unique keyset ordering, the leading columns
+
+    @property
+    def header(self):
+        return tuple(name for name, _, _ in self.columns)
+
+    @property
+    def paths(self):
+        return tuple(path for _, path, _ in self.columns)
+
+
+ACTIVITY = Dataset(
+    columns=(
+        ('timestamp', 'timestamp', 'timestamp'),
+        ('id', 'id', 'int64'),
+        ('employee_id', 'emp_id', 'dictionary'),
+        ('username', 'emp__username', 'dictionary'),
+        ('activity', 'activity', 'dictionary'),
+    ),
+    ordering=('timestamp', 'id'),
+)
+
+WORKED_HOURS = Dataset(
+    columns=(
+        ('work_date', 'work_date', 'date'),
+        ('id', 'id', 'int64'),
+        ('employee_id', 'emp_id', 'dictionary'),
+        ('username', 'emp__username', 'dictionary'),
+        ('worked_minutes', 'worked_minutes', 'int32'),
+    ),
+    ordering=('work_date', 'id'),
+)
+
+
+def available_formats():
+    return [name for name in FORMATS if name != 'arrow' or columnar.available()]
+
+
+def keyset_chunks(queryset, columns, ordering, chunk_size=CHUNK_SIZE):
+    """
+    Yield lists of ``values_list(*columns)`` tuples of ``queryset`` in
+    ``ordering`` order, one LIMIT query per chunk. ``ordering`` must be
+    unique and its fields must come first in ``columns``.
+    """
+    queryset = queryset.order_by(*ordering).values_list(*columns)
+    keys = len(ordering)
+    position = None
+    while True:
+        chunk = queryset if position is None else queryset.filter(keyset_after(ordering, position))
+        rows = list(chunk[:chunk_size])
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        position = rows[-1][:keys]
+
+
+def keyset_rows(queryset, columns, ordering, chunk_size=CHUNK_SIZE):
+    """Rows of keyset_chunks() one by one"""
+    return chain.from_iterable(keyset_chunks(queryset, columns, ordering, chunk_size))
+
+
+def csv_lines(header, rows):
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    for row in chain([header], rows):
+        writer.writerow([value.isoformat() if hasattr(value, 'isoformat') else value for value in row])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def ndjson_lines(header, rows):
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(dict(zip(header, row))) + '\n'
+
+
+def batched(lines, size=64 * 1024):
+    """Join encoded lines into pieces of about ``size`` bytes"""
+    pending, length = [], 0
+    for line in lines:
+        data = line.encode()
+        pending.append(data)
+        length += len(data)
+        if length >= size:
+            yield b''.join(pending)
+            pending, length = [], 0
+    if pending:
+        yield b''.join(pending)
+
+
+def gzipped(pieces):
+    """Compress a byte stream into a gzip stream as it is produced"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for piece in pieces:
+        data = compressor.compress(piece)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def accepts_gzip(request):
+    return 'gzip' in request.headers.get('Accept-Encoding', '').lower()
+
+
+def export_response(request, name, export_format, dataset, queryset):
+    """
+    StreamingHttpResponse with the ``dataset`` columns of ``queryset`` as
+    CSV, NDJSON or an Arrow IPC stream, gzipped when the client accepts it.
+    """
+    if export_format == 'arrow':
+        content = columnar.arrow_stream(dataset.columns, keyset_chunks(queryset, dataset.paths, dataset.ordering))
+    else:
+        rows = keyset_rows(queryset, dataset.paths, dataset.ordering)
+        lines = csv_lines(dataset.header, rows) if export_format == 'csv' else ndjson_lines(dataset.header, rows)
+        content = batched(lines)
+    if accepts_gzip(request):
+        content = gzipped(content)
+
+    content_type, extension = FORMATS[export_format]
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{slugify(name)}.{extension}"'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if accepts_gzip(request):
+        response['Content-Encoding'] = 'gzip'
+    return response
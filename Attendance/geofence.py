@@ -0,0 +1,203 @@
+"""
+Office geofence matching.
+
+All valid office locations are loaded into a ``GeofenceIndex``: a lat/lon grid
+whose cells are at least as large as the biggest site radius, so a point only
+has to be compared against the sites registered in its own cell. Those
+candidates are checked with a NumPy-vectorized haversine.
+
+The index is kept in a process-local cache because office locations change very
+rarely. Staleness is bounded in two ways:
+    - every GEOFENCE_CHECK_SECONDS the worker compares its version stamp with
+      the one in the shared Django cache; ``invalidate`` bumps that stamp, so
+      with a shared cache backend all workers reload within that interval
+    - every GEOFENCE_MAX_AGE_SECONDS the worker reloads unconditionally, which
+      bounds staleness even when the cache backend is process-local
+"""
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from math import atan2, cos, floor, radians, sin, sqrt
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import OfficeLocation
+
+VERSION_KEY = 'attendance:geofence:version'
+EARTH_RADIUS = 6371000  # Earth's radius in meters
+METERS_PER_DEGREE = 111320
+
+
+def calculate_distance(lat1, lon1, lat2, lon2):
+    """
+    Calculate distance between two points using Haversine formula
+    Returns distance in meters
+    """
+    lat1, lon1, lat2, lon2 = map(radians, [float(lat1), float(lon1), float(lat2), float(lon2)])
+
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+    c = 2 * atan2(sqrt(a), sqrt(1-a))
+    return EARTH_RADIUS * c
+
+
+def haversine(lat, lon, lats, lons):
+    """Distances in meters from one point to arrays of points, all in radians"""
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+@dataclass
+class GeofenceMatch:
+    office: OfficeLocation  # Matched office, or the nearest one when outside all sites
+    distance: float         # Meters to that office
+    inside: bool
+
+
+class GeofenceIndex:
+    """Grid index over office sites, each with its own radius"""
+
+    def __init__(self, offices):
+        self.offices = list(offices)
+        self.lats = np.radians(np.array([float(o.latitude) for o in self.offices], dtype=np.float64))
+        self.lons = np.radians(np.array([float(o.longitude) for o in self.offices], dtype=np.float64))
+        self.radii = np.array([o.radius_meters for o in self.offices], dtype=np.float64)
+
+        max_radius = float(self.radii.max()) if self.offices else 0.0
+        self.cell_degrees = max(max_radius / METERS_PER_DEGREE, 0.001)
+        # Longitude cells tile the full circle exactly, so cells wrap cleanly
+        # across the antimeridian
+        self.lon_cells = max(int(360 / self.cell_degrees), 1)
+        self.lon_cell_degrees = 360 / self.lon_cells
+
+        cells = {}
+        for index, office in enumerate(self.offices):
+            lat, lon = float(office.latitude), float(office.longitude)
+            lat_span = self.radii[index] / METERS_PER_DEGREE
+            lon_span = lat_span / max(cos(radians(lat)), 0.01)
+            for lat_cell in range(self._cell(lat - lat_span), self._cell(lat + lat_span) + 1):
+                for lon_cell in range(self._lon_cell(lon - lon_span), self._lon_cell(lon + lon_span) + 1):
+                    cells.setdefault((lat_cell, lon_cell % self.lon_cells), []).append(index)
+        self.cells = {key: np.array(value, dtype=np.intp) for key, value in cells.items()}
+
+    def __len__(self):
+        return len(self.offices)
+
+    def _cell(self, degrees):
+        return floor(degrees / self.cell_degrees)
+
+    def _lon_cell(self, longitude):
+        return floor((longitude + 180) / self.lon_cell_degrees)
+
+    def locate(self, latitude, longitude):
+        """
+        Return the GeofenceMatch for a point: the nearest site whose radius
+        contains it, or the nearest site overall when outside every radius.
+        Returns None when there are no sites.
+        """
+        if not self.offices:
+            return None
+
+        latitude, longitude = float(latitude), float(longitude)
+        lat, lon = radians(latitude), radians(longitude)
+
+        candidates = self.cells.get(
+            (self._cell(latitude), self._lon_cell(longitude) % self.lon_cells)
+        )
+        if candidates is not None:
+            distances = haversine(lat, lon, self.lats[candidates], self.lons[candidates])
+            inside = distances <= self.radii[candidates]
+            if inside.any():
+                best = np.flatnonzero(inside)[np.argmin(distances[inside])]
+                return GeofenceMatch(self.offices[candidates[best]], float(distances[best]), True)
+
+        # Outside every site: report the nearest one
+        distances = haversine(lat, lon, self.lats, self.lons)
+        best = int(np.argmin(distances))
+        return GeofenceMatch(self.offices[best], float(distances[best]), False)
+
+    def locate_linear(self, latitude, longitude):
+        """Reference implementation: scalar haversine against every site"""
+        best = None
+        for office in self.offices:
+            distance = calculate_distance(latitude, longitude, office.latitude, office.longitude)
+            inside = distance <= office.radius_meters
+            if best is None or (inside, -distance) > (best.inside, -best.distance):
+                best = GeofenceMatch(office, distance, inside)
+        return best
+
+
+class GeofenceCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._version = None
+        self._loaded_at = None
+        self._checked_at = None
+
+    def _load(self, version, now):
+        self._index = GeofenceIndex(OfficeLocation.objects.filter(is_valid=True))
+        self._version = version
+        self._loaded_at = now
+        self._checked_at = now
+
+    def _fresh(self, now):
+        check_seconds = getattr(settings, 'GEOFENCE_CHECK_SECONDS', 5)
+        return self._loaded_at is not None and now - self._checked_at < check_seconds
+
+    def index(self):
+        """Return the GeofenceIndex of valid offices without querying the database when fresh"""
+        now = time.monotonic()
+        if self._fresh(now):
+            return self._index
+
+        with self._lock:
+            version = cache.get(VERSION_KEY)
+            max_age = getattr(settings, 'GEOFENCE_MAX_AGE_SECONDS', 300)
+            if (self._loaded_at is None or version != self._version
+                    or now - self._loaded_at >= max_age):
+                self._load(version, now)
+            else:
+                self._checked_at = now
+            return self._index
+
+    async def aindex(self):
+        """Async variant of index(); only hops to a thread when a reload is due"""
+        if self._fresh(time.monotonic()):
+            return self._index
+        return await sync_to_async(self.index)()
+
+    def clear(self):
+        """Drop the local copy so the next read reloads"""
+        with self._lock:
+            self._loaded_at = None
+
+    def invalidate(self):
+        """Bump the shared version stamp and drop the local copy"""
+        cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+        self.clear()
+
+
+geofence_cache = GeofenceCache()
+
+
+def locate(latitude, longitude):
+    """Match a point against the cached valid offices, see GeofenceIndex.locate"""
+    return geofence_cache.index().locate(latitude, longitude)
+
+
+async def alocate(latitude, longitude):
+    """Async variant of locate()"""
+    return (await geofence_cache.aindex()).locate(latitude, longitude)
+
+
+def invalidate():
+    """Invalidate the geofence once the current transaction commits"""
+    transaction.on_commit(geofence_cache.invalidate)
@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class ConfiguredPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2-SHA256 with the iteration count of PASSWORD_PBKDF2_ITERATIONS
+    (Django's default when unset). Passwords stored with another count still
+    verify and report must_update, so they are rehashed on the next login.
+    """
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_PBKDF2_ITERATIONS', PBKDF2PasswordHasher.iterations)
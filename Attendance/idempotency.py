@@ -0,0 +1,168 @@
+"""
+Idempotency-Key support for retried mutations.
+
+Mobile clients on flaky networks retry POSTs whose response they never saw.
+When a request carries an ``Idempotency-Key`` header, the first response is
+stored in the Django cache for IDEMPOTENCY_KEY_TTL_SECONDS, keyed by endpoint,
+employee and key. A retry with the same key gets that response back from one
+cache read, without running the endpoint again, and is marked with an
+``Idempotent-Replayed: true`` header.
+
+    - keys are scoped per employee, so two employees can use the same key
+    - reusing a key for a different request body is rejected with 422
+    - a retry that arrives while the first request is still running gets 409
+    - server errors (5xx) are not stored, so they can be retried for real
+
+Point CACHES at a shared backend (Redis/Memcached) when running several
+workers, otherwise a retry that lands on another worker runs again.
+"""
+import hashlib
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+KEY_PREFIX = 'attendance:idempotency'
+MAX_KEY_LENGTH = 255
+LOCK_SECONDS = 60  # Bounds how long a crashed request can block its retries
+
+
+def ttl():
+    return getattr(settings, 'IDEMPOTENCY_KEY_TTL_SECONDS', 24 * 60 * 60)
+
+
+def cache_key(endpoint, employee_id, key):
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return f'{KEY_PREFIX}:{endpoint}:{employee_id}:{digest}'
+
+
+def fingerprint(request, data):
+    """Digest of what the client asked for; a reused key must match it"""
+    body = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder, default=str)
+    return hashlib.sha256(f'{request.method}:{request.get_full_path()}:{body}'.encode()).hexdigest()
+
+
+def _invalid_key():
+    return {'error': f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters'}, status.HTTP_400_BAD_REQUEST
+
+
+def _mismatch():
+    return {'error': f'{HEADER} was already used for a different request'}, status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def _in_progress():
+    return {'error': f'A request with this {HEADER} is still being processed'}, status.HTTP_409_CONFLICT
+
+
+def _replay(stored, request_fingerprint):
+    """(payload, status) for a stored entry, or the mismatch error"""
+    if stored['fingerprint'] != request_fingerprint:
+        return _mismatch()
+    return stored['data'], stored['status']
+
+
+def _entry(request_fingerprint, data, status_code):
+    return {'fingerprint': request_fingerprint, 'data': data, 'status': status_code}
+
+
+def idempotent(endpoint, employee=None):
+    """
+    Decorator for DRF views and viewset actions (place it below ``api_view``
+    and ``permission_classes``). ``employee(request)`` returns the employee
+    ID the key is scoped to; by default the authenticated user's. Requests
+    without the header, or without an employee, run normally.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Function views get (request, ...), viewset methods (self, request, ...)
+            request = args[0] if isinstance(args[0], Request) else args[1]
+            key = request.headers.get(HEADER)
+            employee_id = employee(request) if employee else getattr(request.user, 'employee_id', None)
+            if key is None or not employee_id:
+                return view(*args, **kwargs)
+            if not key or len(key) > MAX_KEY_LENGTH:
+                return Response(*_invalid_key())
+
+            stored_key = cache_key(endpoint, employee_id, key)
+            request_fingerprint = fingerprint(request, request.data)
+            stored = cache.get(stored_key)
+            if stored is not None:
+                response = Response(*_replay(stored, request_fingerprint))
+                response[REPLAYED_HEADER] = 'true'
+                return response
+
+            lock_key = f'{stored_key}:lock'
+            if not cache.add(lock_key, True, LOCK_SECONDS):
+                return Response(*_in_progress())
+            try:
+                response = view(*args, **kwargs)
+                if response.status_code < 500:
+                    cache.set(stored_key, _entry(request_fingerprint, response.data, response.status_code), ttl())
+                return response
+            finally:
+                cache.delete(lock_key)
+        return wrapper
+    return decorator
+
+
+def aidempotent(endpoint, employee):
+    """
+    Async counterpart of ``idempotent`` for the views in async_views.
+    ``employee(request, data)`` returns the employee ID (awaitable) or None.
+    For authenticated views it must authenticate the request, as DRF does
+    before ``idempotent`` runs: stored responses are replayed to whoever it
+    returns an ID for.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            if key is None:
+                return await view(request, *args, **kwargs)
+            if not key or len(key) > MAX_KEY_LENGTH:
+                payload, status_code = _invalid_key()
+                return JsonResponse(payload, status=status_code)
+
+            try:
+                data = json.loads(request.body or b'{}')
+            except ValueError:
+                data = request.body.decode(errors='replace')
+            employee_id = await employee(request, data)
+            if not employee_id:
+                return await view(request, *args, **kwargs)
+
+            stored_key = cache_key(endpoint, employee_id, key)
+            request_fingerprint = fingerprint(request, data)
+            stored = await cache.aget(stored_key)
+            if stored is not None:
+                payload, status_code = _replay(stored, request_fingerprint)
+                response = JsonResponse(payload, status=status_code, encoder=DjangoJSONEncoder, safe=False)
+                response[REPLAYED_HEADER] = 'true'
+                return response
+
+            lock_key = f'{stored_key}:lock'
+            if not await cache.aadd(lock_key, True, LOCK_SECONDS):
+                payload, status_code = _in_progress()
+                return JsonResponse(payload, status=status_code)
+            try:
+                response = await view(request, *args, **kwargs)
+                if response.status_code < 500:
+                    await cache.aset(
+                        stored_key,
+                        _entry(request_fingerprint, json.loads(response.content), response.status_code),
+                        ttl()
+                    )
+                return response
+            finally:
+                await cache.adelete(lock_key)
+        return wrapper
+    return decorator
@@ -0,0 +1,424 @@
+"""
+Write-behind attendance journal (optional, ``ATTENDANCE_JOURNAL_DIR``).
+
+In write-behind mode an accepted scan is not written to the database in the
+request. Instead it is:
+
+    1. validated against the employee's presence, overlaid with the events of
+       this process that are still waiting to be flushed
+    2. appended as one JSON line to this process's journal file
+    3. fsynced; concurrent requests share one fsync (group commit), the first
+       one to reach the sync lock syncs everything written so far
+    4. acknowledged to the client
+
+A background flusher thread hands the durable events to
+``record_attendance_batch`` every ATTENDANCE_JOURNAL_FLUSH_SECONDS (or as soon
+as ATTENDANCE_JOURNAL_BATCH_SIZE are waiting) and then advances a checkpoint
+file holding the journal offset up to which events are in the database.
+
+Each process writes its own ``journal-<host>-<pid>.jsonl`` and holds an
+exclusive flock on it. When a process starts, journals in the directory that
+are not locked belong to dead processes, and their tail after the checkpoint
+is replayed before the new journal is opened (``manage.py replay_journal`` does
+the same on demand). Replay is safe to repeat: ``record_attendance_batch``
+rejects scans that are not newer than the employee's last recorded activity,
+so events already in the database are skipped.
+
+Trade-offs: the database, ``presence`` and ``worked_hours`` lag by up to one
+flush interval, and the rare sequence conflicts between two processes are only
+detected at flush time, after the client was acknowledged (they are logged).
+"""
+import atexit
+import json
+import logging
+import os
+import socket
+import threading
+from datetime import datetime
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import Employee, EmployeeActivity, EmployeePresence
+from .presence import apply_activity, presence_from_history, session_minutes
+from .services import (
+    ACTIVITY_TYPES,
+    AttendanceError,
+    AttendanceResult,
+    Scan,
+    _last_activity_details,
+    record_attendance_batch,
+    validate_sequence,
+)
+from . import services
+
+try:
+    import fcntl
+except ImportError:  # Not POSIX: a single worker per journal directory is assumed
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_PATTERN = 'journal-{name}.jsonl'
+CHECKPOINT_SUFFIX = '.checkpoint'
+
+
+def enabled():
+    return bool(getattr(settings, 'ATTENDANCE_JOURNAL_DIR', None))
+
+
+def encode(scan):
+    return json.dumps({
+        'employee_id': scan.employee_id,
+        'usage_type': scan.usage_type,
+        'at': scan.at.isoformat(),
+    }, separators=(',', ':')).encode() + b'\n'
+
+
+def decode(line):
+    data = json.loads(line)
+    return Scan(data['employee_id'], data['usage_type'], datetime.fromisoformat(data['at']))
+
+
+def load_presence(employee_id):
+    """Current presence of ``employee_id`` from the database (no lock)"""
+    presence = EmployeePresence.objects.filter(employee_id=employee_id).first()
+    if presence is None:
+        if not Employee.objects.filter(employee_id=employee_id).exists():
+            raise AttendanceError('unknown-employee', f'Employee with ID {employee_id} not found')
+        presence = presence_from_history(employee_id)
+    return presence
+
+
+class AttendanceJournal:
+    """
+    One append-only journal file plus its checkpoint.
+
+    ``sink`` persists a list of Scans and returns one ScanOutcome per scan
+    (``record_attendance_batch``); ``presence_loader`` returns the committed
+    presence of an employee. Both can be replaced in tests.
+    """
+
+    def __init__(self, path, sink=record_attendance_batch, presence_loader=load_presence):
+        self.path = path
+        self.checkpoint_path = path + CHECKPOINT_SUFFIX
+        self.sink = sink
+        self.presence_loader = presence_loader
+
+        self._lock = threading.Lock()        # File appends, pending events, overlay
+        self._sync_lock = threading.Lock()   # One fsync at a time
+        self._flush_lock = threading.Lock()  # One flush at a time
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._file = None
+
+        self._written = 0     # Bytes appended and flushed to the OS
+        self._synced = 0      # Bytes known to be on disk
+        self._checkpoint = 0  # Bytes whose events are in the database
+        self._pending = []    # [(end offset, Scan)] in journal order
+        self._overlay = {}    # employee_id -> (presence including pending events, end offset)
+        self._generation = 0  # Bumped whenever flushed events leave the overlay
+
+    # -- file handling -------------------------------------------------
+
+    def open(self, blocking=True):
+        """
+        Open and lock the journal and load its unflushed tail. A torn last
+        line (crash during a write) is cut off. Returns False when another
+        live process holds the journal and ``blocking`` is False.
+        """
+        self._file = open(self.path, 'a+b')
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                self._file.close()
+                self._file = None
+                return False
+
+        self._file.seek(0)
+        content = self._file.read()
+        complete = content.rfind(b'\n') + 1
+        if complete < len(content):
+            self._file.truncate(complete)
+            os.fsync(self._file.fileno())
+
+        checkpoint = self._read_checkpoint()
+        if checkpoint > complete:  # Journal was compacted after the checkpoint was written
+            checkpoint = 0
+
+        offset = checkpoint
+        for line in content[checkpoint:complete].splitlines(keepends=True):
+            offset += len(line)
+            try:
+                self._pending.append((offset, decode(line)))
+            except (ValueError, KeyError):
+                logger.error('Skipping unreadable journal line in %s at offset %d', self.path, offset - len(line))
+
+        self._written = self._synced = complete
+        self._checkpoint = checkpoint
+        return True
+
+    def close(self):
+        self.stop()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        """Delete a fully flushed journal; the caller must hold it open"""
+        for path in (self.path, self.checkpoint_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self.close()
+
+    def _read_checkpoint(self):
+        try:
+            with open(self.checkpoint_path) as checkpoint_file:
+                return int(checkpoint_file.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _write_checkpoint(self, offset):
+        temporary = self.checkpoint_path + '.tmp'
+        with open(temporary, 'w') as checkpoint_file:
+            checkpoint_file.write(str(offset))
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(temporary, self.checkpoint_path)
+        self._checkpoint = offset
+
+    def _compact(self):
+        """Truncate the journal once everything in it is in the database"""
+        compact_bytes = getattr(settings, 'ATTENDANCE_JOURNAL_COMPACT_BYTES', 1024 * 1024)
+        with self._lock, self._sync_lock:
+            if self._pending or self._checkpoint != self._written or self._written < compact_bytes:
+                return
+            self._file.truncate(0)
+            os.fsync(self._file.fileno())
+            self._written = self._synced = 0
+            self._write_checkpoint(0)
+
+    # -- write path ----------------------------------------------------
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def append(self, scan):
+        """Append one event (not yet durable); returns its end offset"""
+        with self._lock:
+            return self._append(scan)
+
+    def _append(self, scan):
+        self._file.write(encode(scan))
+        self._file.flush()
+        self._written = self._file.tell()
+        self._pending.append((self._written, scan))
+        return self._written
+
+    def sync(self, offset):
+        """Make the journal durable up to ``offset``, sharing fsyncs between callers"""
+        with self._sync_lock:
+            if self._synced >= offset:
+                return
+            written = self._written
+            os.fsync(self._file.fileno())
+            self._synced = written
+
+    def submit(self, employee_id, usage_type, at=None):
+        """
+        Validate and journal one attendance event; returns an AttendanceResult
+        once the event is durable. ``employee`` and ``total_minutes`` are
+        not known until the flush and are left as None.
+
+        Raises AttendanceError on rejection, like record_attendance.
+        """
+        if usage_type not in ACTIVITY_TYPES:
+            raise AttendanceError('invalid-type', 'Invalid usage type. Must be check-in or check-out')
+
+        at = at or timezone.now()
+        with self._lock:
+            overlay, generation = self._overlay.get(employee_id), self._generation
+        # Read the committed state outside the lock; re-read if a flush raced us
+        committed = None if overlay else self.presence_loader(employee_id)
+
+        with self._lock:
+            overlay = self._overlay.get(employee_id)
+            if overlay is not None:
+                presence = overlay[0]
+            elif generation == self._generation:
+                presence = committed
+            else:
+                presence = self.presence_loader(employee_id)
+
+            if presence.last_activity_at is not None and at <= presence.last_activity_at:
+                raise AttendanceError(
+                    'out-of-order',
+                    'Scan is older than the last recorded activity',
+                    last_activity=_last_activity_details(presence)
+                )
+            validate_sequence(usage_type, presence, timezone.localdate(at))
+
+            result = AttendanceResult(
+                employee=None,
+                activity=EmployeeActivity(emp_id=employee_id, activity=usage_type, timestamp=at)
+            )
+            if usage_type == 'check-out':
+                result.session_minutes = session_minutes(presence.session_started_at, at)
+
+            offset = self._append(Scan(employee_id, usage_type, at))
+            apply_activity(presence, usage_type, at)
+            self._overlay[employee_id] = (presence, offset)
+
+        self.sync(offset)
+        if len(self._pending) >= getattr(settings, 'ATTENDANCE_JOURNAL_BATCH_SIZE', 500):
+            self._wakeup.set()
+        return result
+
+    # -- flushing ------------------------------------------------------
+
+    def flush(self):
+        """
+        Write durable pending events to the database in one batch and advance
+        the checkpoint. Returns the number of events flushed. On a database
+        error the events stay pending and are retried by the next flush.
+        """
+        with self._flush_lock:
+            batch_size = getattr(settings, 'ATTENDANCE_JOURNAL_BATCH_SIZE', 500)
+            with self._lock:
+                synced = self._synced
+                batch = [entry for entry in self._pending[:batch_size] if entry[0] <= synced]
+            if not batch:
+                return 0
+
+            outcomes = self.sink([scan for _, scan in batch])
+            for scan, outcome in zip((scan for _, scan in batch), outcomes):
+                if outcome.error is not None and outcome.error.code != 'out-of-order':
+                    logger.warning(
+                        'Journaled %s for %s at %s rejected on flush: %s',
+                        scan.usage_type, scan.employee_id, scan.at.isoformat(), outcome.error
+                    )
+
+            end = batch[-1][0]
+            self._write_checkpoint(end)
+            with self._lock:
+                del self._pending[:len(batch)]
+                self._overlay = {
+                    employee_id: entry for employee_id, entry in self._overlay.items() if entry[1] > end
+                }
+                self._generation += 1
+
+        self._compact()
+        return len(batch)
+
+    def drain(self):
+        """Flush until nothing durable is pending"""
+        flushed = 0
+        while True:
+            count = self.flush()
+            if not count:
+                return flushed
+            flushed += count
+
+    def _run(self):
+        interval = getattr(settings, 'ATTENDANCE_JOURNAL_FLUSH_SECONDS', 1)
+        while not self._stopped.is_set():
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+            try:
+                self.drain()
+            except Exception:
+                logger.exception('Attendance journal flush failed, will retry')
+            finally:
+                close_old_connections()
+
+    def start(self):
+        """Start the background flusher thread"""
+        self._thread = threading.Thread(target=self._run, name='attendance-journal', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flusher and flush what is left"""
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+        try:
+            self.drain()
+        except Exception:
+            logger.exception('Final attendance journal flush failed; the tail will be replayed on restart')
+
+
+def journal_paths(directory):
+    prefix, suffix = JOURNAL_PATTERN.split('{name}')
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.startswith(prefix) and name.endswith(suffix)
+    )
+
+
+def replay_orphans(directory, sink=record_attendance_batch, exclude=None):
+    """
+    Replay the unflushed tail of every journal in ``directory`` that no live
+    process holds, then delete it. Returns the number of events replayed.
+    """
+    replayed = 0
+    for path in journal_paths(directory):
+        if path == exclude:
+            continue
+        journal = AttendanceJournal(path, sink=sink)
+        if not journal.open(blocking=False):
+            continue  # Owned by a live process
+        try:
+            if os.fstat(journal._file.fileno()).st_nlink == 0:
+                continue  # Replayed and removed by another process meanwhile
+            replayed += journal.drain()
+            journal.remove()
+        finally:
+            journal.close()
+    return replayed
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_journal():
+    """
+    This process's journal, opened on first use: orphaned journals are
+    replayed, then a new journal is opened and its flusher started.
+    """
+    global _journal
+    if _journal is not None:
+        return _journal
+    with _journal_lock:
+        if _journal is None:
+            directory = settings.ATTENDANCE_JOURNAL_DIR
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(
+                directory, JOURNAL_PATTERN.format(name=f'{socket.gethostname()}-{os.getpid()}')
+            )
+            replay_orphans(directory, exclude=path)
+            journal = AttendanceJournal(path)
+            journal.open()
+            journal.start()
+            atexit.register(journal.close)
+            _journal = journal
+    return _journal
+
+
+def record_attendance(employee_id, usage_type, at=None):
+    """
+    record_attendance honouring write-behind mode: journals the event when
+    ATTENDANCE_JOURNAL_DIR is set, writes it through otherwise.
+    """
+    if enabled():
+        return get_journal().submit(employee_id, usage_type, at)
+    return services.record_attendance(employee_id, usage_type, at)
@@ -0,0 +1,83 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from Attendance.models import Employee, EmployeeActivity, EmployeePresence, WorkedHours
+from Attendance.presence import session_minutes
+from Attendance.services import record_attendance
+import time
+
+
+def legacy_scan(employee_id, usage_type):
+    """Query sequence of the original per-scan implementation of mark_attendance"""
+    employee = Employee.objects.get(employee_id=employee_id)
+    employee.last_login = timezone.now()
+    employee.save(update_fields=['last_login'])
+
+    last_activity = EmployeeActivity.objects.filter(emp=employee).order_by('-timestamp').first()
+    if usage_type == 'check-out':
+        today = timezone.localdate()
+        check_in = EmployeeActivity.objects.filter(
+            emp=employee,
+            activity='check-in',
+            timestamp__date=today
+        ).order_by('-timestamp').first()
+        current_time = timezone.now()
+        record, created = WorkedHours.objects.get_or_create(
+            emp=employee,
+            work_date=today,
+            defaults={'worked_minutes': 0}
+        )
+        record.worked_minutes += session_minutes(check_in.timestamp, current_time)
+        record.save()
+    return EmployeeActivity.objects.create(emp=employee, activity=usage_type, timestamp=timezone.now())
+
+
+class Command(BaseCommand):
+    help = 'Benchmark queries per scan and scans per second of the attendance write path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=200, help='Number of synthetic employees')
+
+    def run(self, label, scan, employee_ids):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for usage_type in ('check-in', 'check-out'):
+                for employee_id in employee_ids:
+                    scan(employee_id, usage_type)
+            elapsed = time.perf_counter() - started
+
+        # Savepoints only exist because the benchmark runs inside a rolled back transaction
+        statements = [q for q in queries.captured_queries if 'SAVEPOINT' not in q['sql'].upper()]
+        scans = len(employee_ids) * 2
+        self.stdout.write(
+            f'{label:<8} {len(statements) / scans:6.2f} queries/scan  {scans / elapsed:10.1f} scans/s'
+        )
+
+    def handle(self, *args, **options):
+        count = options['employees']
+
+        # Everything runs inside one transaction that is rolled back at the end,
+        # so the benchmark never leaves rows behind
+        with transaction.atomic():
+            employees = Employee.objects.bulk_create([
+                Employee(
+                    employee_id=f'B{index:05d}',
+                    email=f'bench{index}@example.com',
+                    username=f'bench{index}',
+                    password='!'
+                )
+                for index in range(count)
+            ])
+            employee_ids = [employee.employee_id for employee in employees]
+            # Steady state: presence rows already exist for every employee
+            EmployeePresence.objects.bulk_create([
+                EmployeePresence(employee_id=employee_id, minutes_today=0) for employee_id in employee_ids
+            ])
+
+            self.run('before', legacy_scan, employee_ids)
+            self.run('after', record_attendance, employee_ids)
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS('Benchmark finished, all rows rolled back'))
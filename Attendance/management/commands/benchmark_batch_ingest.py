@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from Attendance.models import Employee, EmployeePresence
+from Attendance.services import Scan, record_attendance, record_attendance_batch
+from datetime import timedelta
+import time
+
+
+class Command(BaseCommand):
+    help = 'Benchmark offline scan ingestion: sequential record_attendance vs one batch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=250, help='Number of synthetic employees')
+
+    def make_employees(self, prefix, count):
+        employees = Employee.objects.bulk_create([
+            Employee(
+                employee_id=f'{prefix}{index:05d}',
+                email=f'{prefix.lower()}{index}@example.com',
+                username=f'{prefix.lower()}{index}',
+                password='!'
+            )
+            for index in range(count)
+        ])
+        EmployeePresence.objects.bulk_create([
+            EmployeePresence(employee_id=employee.employee_id, minutes_today=0) for employee in employees
+        ])
+        return [employee.employee_id for employee in employees]
+
+    def make_scans(self, employee_ids):
+        # A morning of replayed kiosk traffic: everyone checks in, then out
+        start = timezone.now() - timedelta(hours=2)
+        scans = [Scan(employee_id, 'check-in', start + timedelta(seconds=i)) for i, employee_id in enumerate(employee_ids)]
+        scans += [Scan(employee_id, 'check-out', start + timedelta(hours=1, seconds=i)) for i, employee_id in enumerate(employee_ids)]
+        return scans
+
+    def report(self, label, queries, scans, elapsed):
+        statements = [q for q in queries.captured_queries if 'SAVEPOINT' not in q['sql'].upper()]
+        self.stdout.write(
+            f'{label:<10} {len(statements):6d} queries  {len(scans) / elapsed:10.1f} scans/s'
+        )
+
+    def handle(self, *args, **options):
+        count = options['employees']
+
+        # Rolled back at the end so the benchmark never leaves rows behind
+        with transaction.atomic():
+            scans = self.make_scans(self.make_employees('Q', count))
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                for scan in scans:
+                    record_attendance(scan.employee_id, scan.usage_type, at=scan.at)
+                elapsed = time.perf_counter() - started
+            self.report('sequential', queries, scans, elapsed)
+
+            scans = self.make_scans(self.make_employees('R', count))
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                outcomes = record_attendance_batch(scans)
+                elapsed = time.perf_counter() - started
+            self.report('batch', queries, scans, elapsed)
+
+            rejected = sum(1 for outcome in outcomes if outcome.error is not None)
+            if rejected:
+                self.stdout.write(self.style.ERROR(f'{rejected} batch scans were rejected'))
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS('Benchmark finished, all rows rolled back'))
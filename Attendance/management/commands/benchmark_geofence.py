@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from Attendance.geofence import GeofenceIndex
+from Attendance.models import OfficeLocation
+from decimal import Decimal
+import random
+import time
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark geofence lookups: grid index with vectorized haversine vs linear scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sites', type=int, default=5000, help='Number of synthetic office sites')
+        parser.add_argument('--lookups', type=int, default=2000, help='Number of points to match')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def time_lookups(self, locate, points):
+        started = time.perf_counter()
+        matches = [locate(lat, lon) for lat, lon in points]
+        elapsed = time.perf_counter() - started
+        return matches, elapsed * 1e6 / len(points)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        # Sites spread over a country-sized box; nothing touches the database
+        offices = [
+            OfficeLocation(
+                id=index,
+                latitude=Decimal(f'{rng.uniform(8.0, 30.0):.6f}'),
+                longitude=Decimal(f'{rng.uniform(70.0, 90.0):.6f}'),
+                radius_meters=rng.choice([100, 200, 300, 500]),
+            )
+            for index in range(options['sites'])
+        ]
+        index = GeofenceIndex(offices)
+
+        # Half the points near a site, half random
+        points = []
+        for _ in range(options['lookups']):
+            if rng.random() < 0.5:
+                office = rng.choice(offices)
+                points.append((float(office.latitude) + rng.uniform(-0.002, 0.002),
+                               float(office.longitude) + rng.uniform(-0.002, 0.002)))
+            else:
+                points.append((rng.uniform(8.0, 30.0), rng.uniform(70.0, 90.0)))
+
+        indexed, indexed_us = self.time_lookups(index.locate, points)
+        linear, linear_us = self.time_lookups(index.locate_linear, points)
+
+        mismatches = sum(
+            1 for a, b in zip(indexed, linear)
+            if a.inside != b.inside or (a.inside and abs(a.distance - b.distance) > 0.01)
+        )
+
+        self.stdout.write(f'sites={len(offices)} lookups={len(points)} cells={len(index.cells)}')
+        self.stdout.write(f'grid index  {indexed_us:10.1f} us/lookup')
+        self.stdout.write(f'linear scan {linear_us:10.1f} us/lookup')
+        self.stdout.write(f'speedup     {linear_us / indexed_us:10.1f}x')
+        if mismatches:
+            self.stdout.write(self.style.ERROR(f'{mismatches} lookups disagree with the linear scan'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Index results match the linear scan'))
@@ -0,0 +1,82 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth.hashers import make_password, verify_password
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from Attendance.hashers import ConfiguredPBKDF2PasswordHasher
+from Attendance.password_pool import PasswordPool, PasswordPoolBusy
+import os
+import time
+
+
+class Command(BaseCommand):
+    help = 'Benchmark login password verification: logins per second per core, inline vs the process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=200, help='Logins in the simulated burst')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Pool processes')
+        parser.add_argument('--clients', type=int, default=64, help='Concurrent logins (request threads)')
+        parser.add_argument('--max-pending', type=int, default=64, help='LOGIN_PASSWORD_POOL_MAX_PENDING')
+
+    def handle(self, *args, **options):
+        logins, workers = options['logins'], options['workers']
+        password = 'correct horse battery staple'
+        # Nothing touches the database: every login checks the same stored hash
+        encoded = make_password(password)
+
+        started = time.perf_counter()
+        for _ in range(logins):
+            verify_password(password, encoded)
+        inline_rate = logins / (time.perf_counter() - started)
+
+        with override_settings(
+            LOGIN_PASSWORD_POOL_WORKERS=workers, LOGIN_PASSWORD_POOL_MAX_PENDING=options['max_pending']
+        ):
+            pool = PasswordPool()
+            try:
+                # Start the workers before timing, as a long-running server would have
+                with ThreadPoolExecutor(workers) as warmup:
+                    list(warmup.map(lambda _: pool.verify(password, encoded), range(workers)))
+                pool.counters.clear()
+                pool._queued.clear()
+                pool._verifying.clear()
+
+                def login(_):
+                    try:
+                        return pool.verify(password, encoded)[0]
+                    except PasswordPoolBusy:
+                        return None
+
+                started = time.perf_counter()
+                with ThreadPoolExecutor(options['clients']) as clients:
+                    results = list(clients.map(login, range(logins)))
+                elapsed = time.perf_counter() - started
+
+                # A hash from an older iteration count is verified and rehashed in the worker
+                old = ConfiguredPBKDF2PasswordHasher().encode(
+                    password, ConfiguredPBKDF2PasswordHasher().salt(), iterations=100000
+                )
+                rehashed = pool.verify(password, old)[1]
+                stats = pool.stats()
+            finally:
+                pool.close()
+
+        accepted = sum(1 for result in results if result)
+        pool_rate = accepted / elapsed
+        self.stdout.write(f'logins={logins} workers={workers} clients={options["clients"]} cores={os.cpu_count()}')
+        self.stdout.write(f'inline      {inline_rate:8.1f} logins/s  {inline_rate:8.1f} logins/s/core')
+        self.stdout.write(f'pool        {pool_rate:8.1f} logins/s  {pool_rate / workers:8.1f} logins/s/core')
+        self.stdout.write(
+            f'rejected    {logins - accepted:8d} (503, max pending {options["max_pending"]})'
+        )
+        self.stdout.write(
+            f'queued ms   p50={stats["queued_ms"]["p50"]} p95={stats["queued_ms"]["p95"]} '
+            f'max={stats["queued_ms"]["max"]}'
+        )
+        self.stdout.write(
+            f'verify ms   p50={stats["verifying_ms"]["p50"]} p95={stats["verifying_ms"]["p95"]} '
+            f'max={stats["verifying_ms"]["max"]}'
+        )
+        if rehashed and verify_password(password, rehashed) == (True, False):
+            self.stdout.write(self.style.SUCCESS('Outdated hash verified and rehashed to the current policy'))
+        else:
+            self.stdout.write(self.style.ERROR('Outdated hash was not rehashed'))
@@ -0,0 +1,145 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.test import AsyncRequestFactory, RequestFactory
+from Attendance import async_views, ping_tracker, views
+from Attendance.models import Employee, EmployeeActivity, EmployeePresence, OfficeLocation
+from Attendance.tokens import CustomRefreshToken
+from asgiref.sync import sync_to_async
+from concurrent.futures import ThreadPoolExecutor
+from django.utils import timezone
+import asyncio
+import json
+import statistics
+import time
+
+
+class Command(BaseCommand):
+    help = 'Load comparison of the auto_attend ping workload: sync views (WSGI) vs native async views (ASGI)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=200, help='Number of synthetic employees')
+        parser.add_argument('--requests', type=int, default=4000, help='Pings per run')
+        parser.add_argument('--concurrency', type=int, default=200, help='Pings in flight at once')
+
+    def make_employees(self, count):
+        # Committed (not rolled back) so the worker threads can see them; removed in cleanup()
+        now = timezone.now()
+        employees = Employee.objects.bulk_create([
+            Employee(
+                employee_id=f'PL{index:05d}',
+                email=f'pl{index}@example.com',
+                username=f'pl{index}',
+                password='!'
+            )
+            for index in range(count)
+        ])
+        EmployeePresence.objects.bulk_create([
+            EmployeePresence(
+                employee_id=employee.employee_id,
+                state='check-in',
+                last_activity_at=now,
+                session_started_at=now,
+                work_date=timezone.localdate(now),
+                minutes_today=0
+            )
+            for employee in employees
+        ])
+        return [employee.employee_id for employee in employees]
+
+    def cleanup(self, employee_ids):
+        for employee_id in employee_ids:
+            ping_tracker.tracker.forget(employee_id)
+        EmployeeActivity.objects.filter(emp_id__in=employee_ids).delete()
+        EmployeePresence.objects.filter(employee_id__in=employee_ids).delete()
+        # Raw delete: the ORM cascade would also visit simplejwt's token tables,
+        # whose columns do not match the employee_id schema in queries.write
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM employee WHERE employee_id LIKE %s', ['PL%'])
+
+    def token_for(self, employee_id):
+        token = CustomRefreshToken()
+        token['employee_id'] = employee_id
+        return f'Bearer {token}'
+
+    def report(self, label, latencies, elapsed, errors):
+        latencies = sorted(latencies)
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        self.stdout.write(
+            f'{label:<22} {len(latencies) / elapsed:9.1f} req/s  '
+            f'p50 {statistics.median(latencies) * 1000:7.2f} ms  p95 {p95 * 1000:7.2f} ms'
+            + (f'  {errors} errors' if errors else '')
+        )
+
+    def run_sync(self, pings, body, concurrency):
+        """WSGI: one worker thread per request in flight, each blocking on the database"""
+        factory = RequestFactory()
+
+        def ping(authorization):
+            request = factory.post(
+                '/api/auto-attend/', body, content_type='application/json',
+                headers={'Authorization': authorization}
+            )
+            started = time.perf_counter()
+            response = views.auto_attend(request)
+            elapsed = time.perf_counter() - started
+            close_old_connections()
+            return elapsed, response.status_code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(ping, pings))
+        return results, time.perf_counter() - started
+
+    def run_async(self, pings, body, concurrency, view):
+        """ASGI: requests as tasks on one event loop, at most ``concurrency`` in flight"""
+        factory = AsyncRequestFactory()
+
+        async def ping(semaphore, authorization):
+            async with semaphore:
+                request = factory.post(
+                    '/api/auto-attend/', body, content_type='application/json',
+                    headers={'Authorization': authorization}
+                )
+                started = time.perf_counter()
+                response = await view(request)
+                return time.perf_counter() - started, response.status_code
+
+        async def run():
+            semaphore = asyncio.Semaphore(concurrency)
+            started = time.perf_counter()
+            results = await asyncio.gather(*(ping(semaphore, authorization) for authorization in pings))
+            return results, time.perf_counter() - started
+
+        return asyncio.run(run())
+
+    def handle(self, *args, **options):
+        office = OfficeLocation.objects.filter(is_valid=True).first()
+        if office is None:
+            raise CommandError('No valid office location found; add one before benchmarking')
+        if Employee.objects.filter(employee_id__startswith='PL').exists():
+            raise CommandError('Employees with the PL prefix already exist; remove them first')
+
+        body = json.dumps({'latitude': str(office.latitude), 'longitude': str(office.longitude)})
+        employee_ids = self.make_employees(options['employees'])
+        try:
+            tokens = [self.token_for(employee_id) for employee_id in employee_ids]
+            pings = [tokens[index % len(tokens)] for index in range(options['requests'])]
+            concurrency = options['concurrency']
+
+            # The sync view as ASGI runs it without async_views: a thread hop per request
+            thread_hop = sync_to_async(views.auto_attend, thread_sensitive=False)
+            runs = [
+                ('sync (WSGI threads)', lambda: self.run_sync(pings, body, concurrency)),
+                ('sync view under ASGI', lambda: self.run_async(pings, body, concurrency, thread_hop)),
+                ('async (ASGI)', lambda: self.run_async(pings, body, concurrency, async_views.auto_attend)),
+            ]
+            for label, run in runs:
+                for employee_id in employee_ids:
+                    ping_tracker.tracker.forget(employee_id)
+                results, elapsed = run()
+                errors = sum(1 for _, status_code in results if status_code != 200)
+                self.report(label, [latency for latency, _ in results], elapsed, errors)
+        finally:
+            self.cleanup(employee_ids)
+
+        self.stdout.write(self.style.SUCCESS('Benchmark finished, synthetic employees removed'))
@@ -0,0 +1,100 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.db.models.functions import Length
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from Attendance.models import Employee, OutstandingTokenModel
+from Attendance.tokens import CustomRefreshToken
+from datetime import datetime
+import time
+import uuid
+
+
+def legacy_login(employee):
+    """Write sequence of the original login: last_login UPDATE, then one INSERT per token"""
+    employee.last_login = timezone.now()
+    employee.save(update_fields=['last_login'])
+
+    now = timezone.now()
+    exp = now + CustomRefreshToken.lifetime
+    tokens = []
+    for token_type in ('refresh', 'access'):
+        token = CustomRefreshToken()
+        token.payload = {
+            'token_type': token_type,
+            'exp': datetime.timestamp(exp),
+            'iat': datetime.timestamp(now),
+            'jti': str(uuid.uuid4()),
+            'employee_id': employee.employee_id,
+            'type': token_type
+        }
+        OutstandingTokenModel.objects.create(
+            user_id=employee.employee_id,
+            jti=token.payload['jti'],
+            token=str(token),
+            created_at=now,
+            expires_at=exp.replace(microsecond=0)
+        )
+        tokens.append(token)
+    return tokens
+
+
+def batched_login(employee):
+    """Write sequence of the login view"""
+    with transaction.atomic():
+        employee.last_login = timezone.now()
+        employee.save(update_fields=['last_login'])
+        refresh = CustomRefreshToken.for_user(employee)
+    return [refresh, refresh.access_token]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark token issuance under a morning login storm: queries, stored bytes and logins per second'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=500, help='Number of synthetic employees logging in')
+
+    def run(self, label, login, employees):
+        started_id = OutstandingTokenModel.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for employee in employees:
+                login(employee)
+            elapsed = time.perf_counter() - started
+
+        # Savepoints only exist because the benchmark runs inside a rolled back transaction
+        statements = [q for q in queries.captured_queries if 'SAVEPOINT' not in q['sql'].upper()]
+        stored = OutstandingTokenModel.objects.filter(id__gt=started_id).aggregate(
+            bytes=Sum(Length('token'))
+        )['bytes'] or 0
+        logins = len(employees)
+        self.stdout.write(
+            f'{label:<13} {len(statements) / logins:5.2f} queries/login  {stored / logins:7.1f} token bytes/login  '
+            f'{logins / elapsed:9.1f} logins/s'
+        )
+
+    def handle(self, *args, **options):
+        count = options['employees']
+
+        # Everything runs inside one transaction that is rolled back at the end,
+        # so the benchmark never leaves rows behind
+        with transaction.atomic():
+            employees = Employee.objects.bulk_create([
+                Employee(
+                    employee_id=f'T{index:05d}',
+                    email=f'storm{index}@example.com',
+                    username=f'storm{index}',
+                    password='!'
+                )
+                for index in range(count)
+            ])
+
+            self.run('before', legacy_login, employees)
+            self.run('after', batched_login, employees)
+            with override_settings(OUTSTANDING_TOKEN_STORAGE='hash'):
+                self.run('after (hash)', batched_login, employees)
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS('Benchmark finished, all rows rolled back'))
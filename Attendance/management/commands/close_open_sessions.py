@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from Attendance.models import EmployeePresence
+from Attendance.services import close_open_sessions
+from datetime import datetime, time as day_time, timedelta
+import time
+
+
+class Command(BaseCommand):
+    help = 'Close sessions left open by a missing check-out (run nightly from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--cutoff-hours', type=float,
+            help='Close sessions opened more than this many hours ago (default: opened before today)'
+        )
+        parser.add_argument(
+            '--policy-hours', type=float,
+            help='Hours credited for a session without check-out (default: ATTENDANCE_MISSING_CHECKOUT_HOURS)'
+        )
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Employees closed per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the open sessions')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        if options['cutoff_hours'] is not None:
+            cutoff = now - timedelta(hours=options['cutoff_hours'])
+        else:
+            cutoff = timezone.make_aware(datetime.combine(timezone.localdate(now), day_time.min))
+        policy_hours = options['policy_hours']
+        if policy_hours is None:
+            policy_hours = getattr(settings, 'ATTENDANCE_MISSING_CHECKOUT_HOURS', 2)
+        policy = timedelta(hours=policy_hours)
+        chunk_size = options['chunk_size']
+
+        # One indexed query over employee_presence finds every open session
+        open_sessions = EmployeePresence.objects.filter(
+            state='check-in',
+            session_started_at__lt=cutoff
+        ).order_by('employee_id').values_list('employee_id', flat=True)
+
+        if options['dry_run']:
+            self.stdout.write(f'{open_sessions.count()} sessions opened before {cutoff} would be closed')
+            return
+
+        started = time.perf_counter()
+        closed = 0
+        last_id = ''
+        while True:
+            employee_ids = list(open_sessions.filter(employee_id__gt=last_id)[:chunk_size])
+            if not employee_ids:
+                break
+            closed += len(close_open_sessions(employee_ids, cutoff, policy, now))
+            last_id = employee_ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Closed {closed} open sessions opened before {cutoff} '
+            f'({policy_hours:g}h credited each) in {time.perf_counter() - started:.2f}s'
+        ))
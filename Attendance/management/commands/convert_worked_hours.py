@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from decimal import Decimal
+import time
+
+
+def legacy_to_minutes(value):
+    """Minutes encoded by a legacy HH.MM value, e.g. Decimal('8.30') -> 510"""
+    value = Decimal(value)
+    hours = int(value)
+    return hours * 60 + int(round((value - hours) * 100))
+
+
+class Command(BaseCommand):
+    help = 'One-shot conversion of legacy HH.MM worked_hours values into integer worked_minutes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows converted per transaction')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        started = time.perf_counter()
+        converted = 0
+        last_id = 0
+
+        # Converted rows get worked_hours = NULL, so a rerun (or a run after an
+        # interruption) only picks up what is left
+        while True:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        'SELECT id, worked_hours FROM worked_hours '
+                        'WHERE id > %s AND worked_hours IS NOT NULL ORDER BY id LIMIT %s',
+                        [last_id, chunk_size]
+                    )
+                    rows = cursor.fetchall()
+                if not rows:
+                    break
+
+                # Added in SQL, not assigned: check-outs since the deploy may
+                # already have incremented worked_minutes of a legacy row, and
+                # one can land between the SELECT and this UPDATE
+                ids = [row_id for row_id, _ in rows]
+                cases = ' '.join(['WHEN %s THEN %s'] * len(rows))
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f'UPDATE worked_hours SET worked_minutes = worked_minutes + CASE id {cases} END, '
+                        f'worked_hours = NULL WHERE id IN ({", ".join(["%s"] * len(ids))}) '
+                        'AND worked_hours IS NOT NULL',
+                        [param for row_id, value in rows for param in (row_id, legacy_to_minutes(value))] + ids
+                    )
+
+            converted += len(rows)
+            last_id = rows[-1][0]
+            self.stdout.write(f'Converted {converted} rows')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Converted {converted} worked_hours rows to minutes in {time.perf_counter() - started:.2f}s'
+        ))
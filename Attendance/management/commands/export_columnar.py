@@ -0,0 +1,120 @@
+import json
+import os
+import shutil
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils.dateparse import parse_date
+from Attendance import columnar
+from Attendance.date_ranges import date_range, timestamp_range
+from Attendance.exports import ACTIVITY, WORKED_HOURS, keyset_chunks
+from Attendance.models import EmployeeActivity, WorkedHours
+
+MANIFEST = '_manifest.json'
+
+# name -> (dataset, model, partition date field, aggregates that change whenever a partition's rows change)
+TABLES = {
+    'employee_activity': (ACTIVITY, EmployeeActivity, 'timestamp', {
+        'rows': Count('id'), 'max_id': Max('id'), 'id_sum': Sum('id'),
+    }),
+    'worked_hours': (WORKED_HOURS, WorkedHours, 'work_date', {
+        'rows': Count('id'), 'max_id': Max('id'), 'id_sum': Sum('id'), 'minutes': Sum('worked_minutes'),
+    }),
+}
+
+
+def in_range(queryset, date_field, start_date, end_date):
+    if date_field == 'timestamp':
+        return timestamp_range(queryset, start_date, end_date)
+    return date_range(queryset, start_date, end_date, date_field)
+
+
+def fingerprints(queryset, date_field, aggregates):
+    """``{'YYYY-MM-DD': [aggregates]}`` for every partition, from one grouped query"""
+    day = TruncDate('timestamp') if date_field == 'timestamp' else F(date_field)
+    rows = queryset.annotate(day=day).values('day').annotate(**aggregates).order_by('day')
+    return {row['day'].isoformat(): [row[name] for name in aggregates] for row in rows}
+
+
+class Command(BaseCommand):
+    help = 'Export employee_activity and worked_hours as date-partitioned Parquet files for BI'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Directory receiving <table>/date=YYYY-MM-DD/part-0.parquet')
+        parser.add_argument('--table', choices=sorted(TABLES), action='append', help='Table to export (default: all)')
+        parser.add_argument('--start-date', help='First partition to export (YYYY-MM-DD)')
+        parser.add_argument('--end-date', help='Last partition to export (YYYY-MM-DD)')
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Only rewrite partitions whose rows changed since the last run (tracked in _manifest.json)'
+        )
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Rows per round trip and Parquet row group')
+
+    def handle(self, *args, **options):
+        try:
+            columnar.parquet()
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+
+        dates = {}
+        for name in ('start_date', 'end_date'):
+            dates[name] = parse_date(options[name]) if options[name] else None
+            if options[name] and dates[name] is None:
+                raise CommandError(f'Invalid --{name.replace("_", "-")}: {options[name]}')
+
+        for table in options['table'] or sorted(TABLES):
+            self.export_table(table, options, **dates)
+
+    def export_table(self, table, options, start_date, end_date):
+        dataset, model, date_field, aggregates = TABLES[table]
+        directory = os.path.join(options['output'], table)
+        os.makedirs(directory, exist_ok=True)
+        manifest_path = os.path.join(directory, MANIFEST)
+        manifest = {}
+        if options['incremental'] and os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+
+        started = time.perf_counter()
+        queryset = in_range(model.objects.all(), date_field, start_date, end_date)
+        current = fingerprints(queryset, date_field, aggregates)
+
+        def save_manifest():
+            with open(f'{manifest_path}.tmp', 'w') as f:
+                json.dump(manifest, f, indent=1, sort_keys=True)
+            os.replace(f'{manifest_path}.tmp', manifest_path)
+
+        written = rows = removed = 0
+        for day, fingerprint in current.items():
+            if manifest.get(day) == fingerprint:
+                continue
+            partition = os.path.join(directory, f'date={day}')
+            os.makedirs(partition, exist_ok=True)
+            partition_rows = in_range(queryset, date_field, parse_date(day), parse_date(day))
+            rows += columnar.write_parquet(
+                os.path.join(partition, 'part-0.parquet'),
+                dataset.columns,
+                keyset_chunks(partition_rows, dataset.paths, dataset.ordering, options['chunk_size'])
+            )
+            written += 1
+            # Saved per partition, so an interrupted run resumes where it stopped
+            manifest[day] = fingerprint
+            save_manifest()
+
+        # Partitions in range whose rows are all gone
+        for day in list(manifest):
+            day_value = parse_date(day)
+            if day in current or (start_date and day_value < start_date) or (end_date and day_value > end_date):
+                continue
+            shutil.rmtree(os.path.join(directory, f'date={day}'), ignore_errors=True)
+            del manifest[day]
+            removed += 1
+        save_manifest()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{table}: wrote {written} partitions ({rows} rows), kept {len(current) - written} unchanged, '
+            f'removed {removed} in {time.perf_counter() - started:.2f}s'
+        ))
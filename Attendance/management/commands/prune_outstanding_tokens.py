@@ -0,0 +1,116 @@
+import gzip
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F, Max, Min, Q
+from django.db.models.functions import Length
+from django.utils import timezone
+from Attendance.models import OutstandingTokenModel, RevokedToken
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete expired and blacklisted rows of token_blacklist_outstandingtoken in primary key chunks; '
+        'blacklisted JTIs are kept in revoked_jti so they stay revoked'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Primary keys scanned per transaction')
+        parser.add_argument(
+            '--archive', help='Append pruned rows to this gzip-compressed JSONL file before deleting them'
+        )
+        parser.add_argument('--pause', type=float, default=0, help='Seconds to sleep between chunks')
+        parser.add_argument('--dry-run', action='store_true', help='Count what would be pruned, change nothing')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be positive')
+        dry_run = options['dry_run']
+        archive_path = options['archive'] if not dry_run else None
+
+        now = timezone.now()
+        bounds = OutstandingTokenModel.objects.aggregate(low=Min('id'), high=Max('id'))
+        started = time.perf_counter()
+        pruned = {'expired': 0, 'blacklisted': 0}
+        reclaimed = 0
+        archived_before = os.path.getsize(archive_path) if archive_path and os.path.exists(archive_path) else 0
+
+        archive = None
+        try:
+            start = bounds['low']
+            while start is not None and start <= bounds['high']:
+                end = start + chunk_size
+                rows = self.candidates(start, end, now, include_token=archive_path is not None)
+                if rows:
+                    if archive_path:
+                        if archive is None:
+                            # Appending adds a gzip member; concatenated members read back as one stream
+                            archive = gzip.open(archive_path, 'at', encoding='utf-8')
+                        for row in rows:
+                            record = {name: value for name, value in row.items() if name != 'token_bytes'}
+                            archive.write(json.dumps(record, cls=DjangoJSONEncoder) + '\n')
+                        # Durable before the rows are gone
+                        archive.flush()
+                    if not dry_run:
+                        self.prune(rows, now)
+                    for row in rows:
+                        pruned['expired' if row['expires_at'] < now else 'blacklisted'] += 1
+                        reclaimed += row['token_bytes'] + len(row['jti'])
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f'ids {start}-{end - 1}: {len(rows)} rows')
+                    if options['pause']:
+                        time.sleep(options['pause'])
+                start = end
+        finally:
+            if archive is not None:
+                archive.close()
+
+        expired_revoked = self.prune_expired_revoked(now, chunk_size, dry_run)
+        elapsed = time.perf_counter() - started
+        total = pruned['expired'] + pruned['blacklisted']
+        archived = f', archived {os.path.getsize(archive_path) - archived_before} bytes gzip' if archive_path else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Would prune" if dry_run else "Pruned"} {total} outstanding tokens '
+            f'({pruned["expired"]} expired, {pruned["blacklisted"]} blacklisted) and {expired_revoked} expired '
+            f'revoked JTIs in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.0f} rows/s), '
+            f'reclaimed {reclaimed} bytes of token data{archived}'
+        ))
+
+    def candidates(self, start, end, now, include_token):
+        """Prunable rows with ``start <= id < end``: expired, or blacklisted"""
+        fields = ['id', 'user_id', 'jti', 'created_at', 'expires_at'] + (['token'] if include_token else [])
+        return list(
+            OutstandingTokenModel.objects.filter(id__gte=start, id__lt=end).filter(
+                Q(expires_at__lt=now) | Q(blacklistedtokenmodel__isnull=False)
+            ).values(
+                *fields, blacklisted_at=F('blacklistedtokenmodel__blacklisted_at'), token_bytes=Length('token')
+            ).order_by('id')
+        )
+
+    def prune(self, rows, now):
+        with transaction.atomic():
+            # Still-valid blacklisted tokens keep being rejected through revoked_jti
+            RevokedToken.objects.bulk_create([
+                RevokedToken(jti=row['jti'], expires_at=row['expires_at'], revoked_at=row['blacklisted_at'])
+                for row in rows
+                if row['blacklisted_at'] is not None and row['expires_at'] >= now
+            ], ignore_conflicts=True)
+            # Removes the blacklist rows too; only('id') keeps the token text out of the collector
+            OutstandingTokenModel.objects.filter(id__in=[row['id'] for row in rows]).only('id').delete()
+
+    def prune_expired_revoked(self, now, chunk_size, dry_run):
+        """Expired tokens fail signature validation, so their revoked_jti rows are no longer needed"""
+        expired = RevokedToken.objects.filter(expires_at__lt=now)
+        if dry_run:
+            return expired.count()
+        deleted = 0
+        while True:
+            ids = list(expired.order_by('id').values_list('id', flat=True)[:chunk_size])
+            if not ids:
+                return deleted
+            deleted += RevokedToken.objects.filter(id__in=ids).delete()[0]
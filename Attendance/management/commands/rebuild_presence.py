@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from Attendance.models import EmployeeActivity, EmployeePresence
+from Attendance.presence import fold_activities
+from itertools import groupby
+from operator import itemgetter
+import time
+
+
+class Command(BaseCommand):
+    help = 'Regenerate the employee_presence table from employee_activity history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employee', help='Only rebuild this employee ID')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows fetched and written per batch')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        activities = EmployeeActivity.objects.all()
+        presences = EmployeePresence.objects.all()
+        if options['employee']:
+            activities = activities.filter(emp_id=options['employee'])
+            presences = presences.filter(employee_id=options['employee'])
+
+        rows = activities.order_by('emp_id', 'timestamp', 'id').values_list(
+            'emp_id', 'activity', 'timestamp'
+        ).iterator(chunk_size=chunk_size)
+
+        started = time.perf_counter()
+        rebuilt = 0
+        with transaction.atomic():
+            presences.delete()
+
+            batch = []
+            for employee_id, history in groupby(rows, key=itemgetter(0)):
+                batch.append(fold_activities(
+                    employee_id,
+                    ((activity, timestamp) for _, activity, timestamp in history)
+                ))
+                if len(batch) >= chunk_size:
+                    EmployeePresence.objects.bulk_create(batch)
+                    rebuilt += len(batch)
+                    batch = []
+            if batch:
+                EmployeePresence.objects.bulk_create(batch)
+                rebuilt += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt presence for {rebuilt} employees in {time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,213 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from itertools import groupby
+from operator import itemgetter
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from Attendance.date_ranges import day_start
+from Attendance.models import Employee, EmployeeActivity, EmployeePresence, WorkedHours
+from Attendance.presence import session_minutes
+
+
+def sessions(rows):
+    """
+    Pair ``(emp_id, activity, timestamp)`` rows ordered by employee and time
+    into closed sessions, yielding ``(emp_id, work_date, minutes)``.
+
+    Same rules as the write path: a check-in (re)opens the session, a
+    check-out only closes a session opened on the same local day.
+    """
+    for emp_id, history in groupby(rows, key=itemgetter(0)):
+        started = None
+        for _, activity, timestamp in history:
+            if activity == 'check-in':
+                started = timestamp
+                continue
+            if started is not None and timezone.localdate(started) == timezone.localdate(timestamp):
+                yield emp_id, timezone.localdate(timestamp), session_minutes(started, timestamp)
+            started = None
+
+
+def daily_totals(closed_sessions):
+    """Sum consecutive sessions of the same employee and day into ``(emp_id, work_date, minutes)``"""
+    for (emp_id, work_date), day_sessions in groupby(closed_sessions, key=itemgetter(0, 1)):
+        yield emp_id, work_date, sum(minutes for _, _, minutes in day_sessions)
+
+
+def scope(queryset, field, options):
+    """Apply the employee range/filter and date range options to a queryset"""
+    if options.get('employee'):
+        queryset = queryset.filter(**{field: options['employee']})
+    if options.get('range_start') is not None:
+        queryset = queryset.filter(**{f'{field}__gte': options['range_start']})
+    if options.get('range_end') is not None:
+        queryset = queryset.filter(**{f'{field}__lt': options['range_end']})
+    return queryset
+
+
+def apply_batch(totals, employee_ids, options, stats, report):
+    """
+    Make the worked_hours rows of ``employee_ids`` in the date range equal to
+    ``totals``: update changed rows, create missing ones and delete rows with
+    no worked time left (including duplicates of the same day).
+    """
+    existing = WorkedHours.objects.filter(emp_id__in=employee_ids)
+    if options['start_date']:
+        existing = existing.filter(work_date__gte=options['start_date'])
+    if options['end_date']:
+        existing = existing.filter(work_date__lte=options['end_date'])
+
+    to_update, to_delete, seen = [], [], set()
+    for record in existing.order_by('emp_id', 'work_date', 'id'):
+        key = (record.emp_id, record.work_date)
+        minutes = totals.get(key)
+        if minutes is None or key in seen:
+            to_delete.append(record.id)
+            report(f'- {record.emp_id} {record.work_date} {record.worked_minutes}')
+            continue
+        seen.add(key)
+        if record.worked_minutes != minutes:
+            report(f'~ {record.emp_id} {record.work_date} {record.worked_minutes} -> {minutes}')
+            record.worked_minutes = minutes
+            to_update.append(record)
+
+    to_create = []
+    for (emp_id, work_date), minutes in totals.items():
+        if (emp_id, work_date) not in seen:
+            report(f'+ {emp_id} {work_date} {minutes}')
+            to_create.append(WorkedHours(emp_id=emp_id, work_date=work_date, worked_minutes=minutes))
+
+    stats['updated'] += len(to_update)
+    stats['created'] += len(to_create)
+    stats['deleted'] += len(to_delete)
+    if options['dry_run']:
+        return
+
+    WorkedHours.objects.bulk_update(to_update, ['worked_minutes'], batch_size=1000)
+    WorkedHours.objects.bulk_create(to_create, batch_size=1000)
+    WorkedHours.objects.filter(id__in=to_delete).delete()
+
+
+def rebuild_employees(employee_ids, options, stats, report):
+    """
+    Recompute the worked_hours rows of ``employee_ids`` in one transaction.
+    Their presence rows are locked before the history is read, as the write
+    path locks them, so a check-out cannot add minutes in between that the
+    rewrite would then overwrite.
+    """
+    with transaction.atomic():
+        if not options['dry_run']:
+            list(EmployeePresence.objects.select_for_update().filter(
+                employee_id__in=employee_ids
+            ).order_by('employee_id').values_list('employee_id', flat=True))
+
+        activities = EmployeeActivity.objects.filter(emp_id__in=employee_ids)
+        if options['start_date']:
+            activities = activities.filter(timestamp__gte=day_start(options['start_date']))
+        if options['end_date']:
+            activities = activities.filter(timestamp__lt=day_start(options['end_date'] + timedelta(days=1)))
+
+        def counted(rows):
+            for row in rows:
+                stats['rows'] += 1
+                yield row
+
+        rows = counted(activities.order_by('emp_id', 'timestamp', 'id').values_list(
+            'emp_id', 'activity', 'timestamp'
+        ).iterator(chunk_size=options['chunk_size']))
+        totals = {(emp_id, work_date): minutes for emp_id, work_date, minutes in daily_totals(sessions(rows))}
+        apply_batch(totals, employee_ids, options, stats, report)
+
+
+def rebuild(options, report=None):
+    """Rebuild one employee range; returns row counters (also the process pool task)"""
+    report = report or (lambda line: None)
+    stats = {'rows': 0, 'created': 0, 'updated': 0, 'deleted': 0}
+
+    employee_ids = list(scope(Employee.objects.all(), 'employee_id', options).order_by(
+        'employee_id'
+    ).values_list('employee_id', flat=True))
+    for offset in range(0, len(employee_ids), options['batch_size']):
+        rebuild_employees(employee_ids[offset:offset + options['batch_size']], options, stats, report)
+    return stats
+
+
+def init_worker():
+    django.setup()
+
+
+def rebuild_in_worker(options):
+    try:
+        return rebuild(options)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Recompute worked_hours from employee_activity history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employee', help='Only rebuild this employee ID')
+        parser.add_argument('--start-date', help='First work date to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--end-date', help='Last work date to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Activity rows fetched per round trip')
+        parser.add_argument('--batch-size', type=int, default=100, help='Employees rebuilt per transaction')
+        parser.add_argument('--workers', type=int, default=1, help='Processes, each rebuilding a range of employee IDs')
+        parser.add_argument('--dry-run', action='store_true', help='Report the differences without writing them')
+
+    def employee_ranges(self, workers, options):
+        """Split the employees in scope into ``workers`` contiguous employee_id ranges"""
+        employee_ids = list(scope(Employee.objects.all(), 'employee_id', options).order_by(
+            'employee_id'
+        ).values_list('employee_id', flat=True))
+        if not employee_ids:
+            return []
+        step = -(-len(employee_ids) // workers)
+        bounds = [employee_ids[index] for index in range(0, len(employee_ids), step)]
+        return [
+            {**options, 'range_start': start, 'range_end': end}
+            for start, end in zip(bounds, bounds[1:] + [None])
+        ]
+
+    def handle(self, *args, **options):
+        for name in ('start_date', 'end_date'):
+            if options[name]:
+                value = parse_date(options[name])
+                if value is None:
+                    raise CommandError(f'Invalid --{name.replace("_", "-")}: {options[name]}')
+                options[name] = value
+
+        # Only plain values, so the options can be sent to pool workers
+        options = {key: options[key] for key in (
+            'employee', 'start_date', 'end_date', 'chunk_size', 'batch_size', 'workers', 'dry_run', 'verbosity'
+        )}
+        show_diff = options['dry_run'] and options['verbosity'] >= 2
+        report = self.stdout.write if show_diff else None
+        started = time.perf_counter()
+
+        if options['workers'] > 1 and not options['employee']:
+            if show_diff:
+                raise CommandError('Use --workers 1 to list individual differences')
+            ranges = self.employee_ranges(options['workers'], options)
+            # Children must not share the parent's database connections
+            connections.close_all()
+            stats = {'rows': 0, 'created': 0, 'updated': 0, 'deleted': 0}
+            with ProcessPoolExecutor(max_workers=len(ranges) or 1, initializer=init_worker) as executor:
+                for result in executor.map(rebuild_in_worker, ranges):
+                    for key, value in result.items():
+                        stats[key] += value
+        else:
+            stats = rebuild(options, report)
+
+        elapsed = time.perf_counter() - started
+        verb = 'Would change' if options['dry_run'] else 'Changed'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} worked_hours: {stats['created']} created, {stats['updated']} updated, "
+            f"{stats['deleted']} deleted. Streamed {stats['rows']} activities in {elapsed:.2f}s "
+            f"({stats['rows'] / elapsed if elapsed else 0:.0f} rows/s)"
+        ))
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from Attendance import journal
+import os
+
+
+class Command(BaseCommand):
+    help = 'Replay the unflushed tail of write-behind journals left by stopped processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help='Journal directory (default: ATTENDANCE_JOURNAL_DIR)')
+
+    def handle(self, *args, **options):
+        directory = options['dir'] or getattr(settings, 'ATTENDANCE_JOURNAL_DIR', None)
+        if not directory:
+            raise CommandError('No journal directory: pass --dir or set ATTENDANCE_JOURNAL_DIR')
+        if not os.path.isdir(directory):
+            raise CommandError(f'Journal directory {directory} does not exist')
+
+        # Journals still locked by running workers are skipped
+        replayed = journal.replay_orphans(directory)
+        self.stdout.write(self.style.SUCCESS(f'Replayed {replayed} journaled events'))
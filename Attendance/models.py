@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models.functions import ExtractHour
+from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from rest_framework_simplejwt.tokens import Token
 
@@ -66,12 +68,22 @@ class EmployeeActivity(models.Model):
     
     id = models.AutoField(primary_key=True)
     emp = models.ForeignKey(Employee, to_field='employee_id', db_column='emp_id', on_delete=models.CASCADE)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)  # Not auto_now_add: replayed scans keep their time
     activity = models.CharField(max_length=9, choices=ACTIVITY_CHOICES)
+    # Hour of day in TIME_ZONE, stored by the database so the hour filter can use an index
+    local_hour = models.GeneratedField(
+        expression=ExtractHour('timestamp'), output_field=models.PositiveSmallIntegerField(), db_persist=True
+    )
 
     class Meta:
         db_table = 'employee_activity'
         managed = False
+        # Created by queries.write, listed for reference and the test database
+        indexes = [
+            models.Index(fields=['timestamp', 'id'], name='employee_activity_keyset_idx'),
+            models.Index(fields=['emp', 'timestamp', 'id'], name='employee_activity_emp_ks_idx'),
+            models.Index(fields=['local_hour', 'timestamp'], name='employee_activity_hour_idx'),
+        ]
 
 class QRDetails(models.Model):
     USAGE_CHOICES = [
@@ -88,6 +100,9 @@ class QRDetails(models.Model):
     class Meta:
         db_table = 'qr_details'
         managed = False
+        indexes = [
+            models.Index(fields=['usage_type', 'create_date'], name='qr_details_usage_created_idx'),
+        ]
 
 class OutstandingTokenModel(models.Model):
     id = models.AutoField(primary_key=True)
@@ -118,11 +133,27 @@ class BlacklistedTokenModel(models.Model):
     class Meta:
         db_table = 'token_blacklist_blacklistedtoken'
         managed = False
+        indexes = [
+            models.Index(fields=['blacklisted_at'], name='token_blacklist_at_idx'),
+        ]
+
+class RevokedToken(models.Model):
+    """JTI of a blacklisted token whose outstanding row was pruned (prune_outstanding_tokens)"""
+    id = models.BigAutoField(primary_key=True)
+    jti = models.CharField(unique=True, max_length=255)
+    expires_at = models.DateTimeField()
+    revoked_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'revoked_jti'
+        managed = False
 
 class OfficeLocation(models.Model):
     id = models.AutoField(primary_key=True)
+    name = models.CharField(max_length=100, blank=True, default='')
     latitude = models.DecimalField(max_digits=9, decimal_places=6)
     longitude = models.DecimalField(max_digits=9, decimal_places=6)
+    radius_meters = models.PositiveIntegerField(default=200)
     is_valid = models.BooleanField(default=True)
 
     class Meta:
@@ -133,11 +164,15 @@ class WorkedHours(models.Model):
     id = models.AutoField(primary_key=True)
     emp = models.ForeignKey(Employee, to_field='employee_id', db_column='employee_id', on_delete=models.CASCADE)
     work_date = models.DateField()
-    worked_hours = models.DecimalField(max_digits=5, decimal_places=2)
+    worked_minutes = models.PositiveIntegerField(default=0)  # Formatted as H:MM by the serializers
 
     class Meta:
         db_table = 'worked_hours'
         managed = False
+        indexes = [
+            models.Index(fields=['work_date', 'id'], name='worked_hours_keyset_idx'),
+            models.Index(fields=['emp', 'work_date', 'id'], name='worked_hours_emp_keyset_idx'),
+        ]
 
 class Holiday(models.Model):
     id = models.AutoField(primary_key=True)
@@ -197,3 +232,59 @@ class LeaveRequest(models.Model):
     class Meta:
         db_table = 'leave_requests'
         managed = False
+
+class EmployeePresence(models.Model):
+    """
+    Current presence of an employee, maintained by the attendance write path
+    in the same transaction as the EmployeeActivity insert.
+    """
+    STATE_CHOICES = EmployeeActivity.ACTIVITY_CHOICES
+
+    employee = models.OneToOneField(Employee, to_field='employee_id', db_column='employee_id',
+                                    primary_key=True, related_name='presence', on_delete=models.CASCADE)
+    state = models.CharField(max_length=9, choices=STATE_CHOICES, null=True, blank=True)
+    last_activity_at = models.DateTimeField(null=True, blank=True)
+    session_started_at = models.DateTimeField(null=True, blank=True)  # Open check-in, if any
+    work_date = models.DateField(null=True, blank=True)  # Day minutes_today refers to
+    minutes_today = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'employee_presence'
+        managed = False
+
+class ActivityDailyRollup(models.Model):
+    """
+    Activity count per employee, local day and activity type, kept up to date
+    by the attendance write path (see rollups.py).
+    """
+    id = models.AutoField(primary_key=True)
+    emp = models.ForeignKey(Employee, to_field='employee_id', db_column='emp_id', on_delete=models.CASCADE)
+    day = models.DateField()
+    activity = models.CharField(max_length=9, choices=EmployeeActivity.ACTIVITY_CHOICES)
+    events = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'activity_daily_rollup'
+        managed = False
+        indexes = [
+            models.Index(fields=['day'], name='activity_daily_day_idx'),
+        ]
+
+class ActivityHourlyRollup(models.Model):
+    """Same as ActivityDailyRollup, per local hour (start of the hour)"""
+    id = models.AutoField(primary_key=True)
+    emp = models.ForeignKey(Employee, to_field='employee_id', db_column='emp_id', on_delete=models.CASCADE)
+    hour = models.DateTimeField()
+    activity = models.CharField(max_length=9, choices=EmployeeActivity.ACTIVITY_CHOICES)
+    events = models.PositiveIntegerField(default=0)
+    local_hour = models.GeneratedField(
+        expression=ExtractHour('hour'), output_field=models.PositiveSmallIntegerField(), db_persist=True
+    )
+
+    class Meta:
+        db_table = 'activity_hourly_rollup'
+        managed = False
+        indexes = [
+            models.Index(fields=['hour'], name='activity_hourly_hour_idx'),
+            models.Index(fields=['local_hour', 'hour'], name='activity_hourly_lhour_idx'),
+        ]
@@ -0,0 +1,169 @@
+"""
+Pagination for the attendance list endpoints.
+
+``KeysetPagination`` pages with a WHERE on the ordering key instead of an
+OFFSET, e.g. for ``('-timestamp', '-id')``::
+
+    WHERE timestamp < %s OR (timestamp = %s AND id < %s)
+    ORDER BY timestamp DESC, id DESC LIMIT page_size + 1
+
+so every page is an index range scan and page 10,000 costs the same as page
+one. Rows inserted while a client is paging do not shift later pages.
+
+Cursors are signed (opaque to clients, not forgeable) and carry a digest of
+the request's filter parameters: a cursor replayed with different filters is
+rejected instead of silently paging through another result set.
+"""
+import hashlib
+from base64 import urlsafe_b64encode
+
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def keyset_after(ordering, position):
+    """
+    Q matching rows strictly after ``position`` (values of the ``ordering``
+    fields) in ``order_by(*ordering)`` order.
+    """
+    condition = None
+    for name, value in reversed(list(zip(ordering, position))):
+        field = name.lstrip('-')
+        beyond = Q(**{f'{field}__{"lt" if name.startswith("-") else "gt"}': value})
+        condition = beyond if condition is None else beyond | (Q(**{field: value}) & condition)
+    return condition
+
+
+class EmployeeStatsPagination(PageNumberPagination):
+    """Pages of employees for AttendanceLogsViewSet.employee_stats"""
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on a unique ``ordering`` tuple (the last field must be
+    unique, normally the primary key). Responses carry ``next``, ``previous``
+    and ``results``; there is no count, which would need a full scan.
+    """
+    ordering = ('-id',)
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    salt = 'Attendance.pagination.KeysetPagination'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def filter_digest(self, request):
+        """Digest of the query parameters that select rows (everything but the cursor and page size)"""
+        params = sorted(
+            (key, value)
+            for key, values in request.query_params.lists()
+            if key not in (self.cursor_query_param, self.page_size_query_param)
+            for value in values
+        )
+        digest = hashlib.sha256(repr(params).encode()).digest()[:12]
+        return urlsafe_b64encode(digest).decode()
+
+    def fields(self, queryset):
+        """``(model field, descending)`` for each ordering entry"""
+        return [
+            (queryset.model._meta.get_field(name.lstrip('-')), name.startswith('-'))
+            for name in self.ordering
+        ]
+
+    def decode_cursor(self, request, fields):
+        """``(position values, reverse)`` from the cursor parameter, or ``(None, False)``"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = signing.loads(encoded, salt=self.salt)
+            if cursor['f'] != self.filter_digest(request) or len(cursor['p']) != len(fields):
+                raise ValueError
+            position = [field.to_python(value) for (field, _), value in zip(fields, cursor['p'])]
+            return position, bool(cursor['r'])
+        except (signing.BadSignature, ValidationError, ValueError, TypeError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row, reverse):
+        cursor = {
+            'p': [field.value_to_string(row) for field, _ in self.key_fields],
+            'r': int(reverse),
+            'f': self.digest,
+        }
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, signing.dumps(cursor, salt=self.salt, compress=True)
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.key_fields = self.fields(queryset)
+        self.digest = self.filter_digest(request)
+        self.base_url = remove_query_param(request.build_absolute_uri(), self.cursor_query_param)
+        page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request, self.key_fields)
+
+        ordering = [
+            ('-' if descending != reverse else '') + field.name
+            for field, descending in self.key_fields
+        ]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(keyset_after(ordering, position))
+
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        self.next_link = self.previous_link = None
+        if rows:
+            # The extra row tells whether more rows follow in the paging
+            # direction; the other direction is where the cursor came from
+            if has_more or reverse:
+                self.next_link = self.encode_cursor(rows[-1], reverse=False)
+            if has_more if reverse else position is not None:
+                self.previous_link = self.encode_cursor(rows[0], reverse=True)
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.next_link,
+            'previous': self.previous_link,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class ActivityLogPagination(KeysetPagination):
+    """Newest activities first, keyed on (timestamp, id)"""
+    ordering = ('-timestamp', '-id')
+
+
+class WorkedHoursPagination(KeysetPagination):
+    """Latest work dates first, keyed on (work_date, id)"""
+    ordering = ('-work_date', '-id')
@@ -0,0 +1,154 @@
+"""
+Login password verification in a pool of worker processes.
+
+A PBKDF2 check holds a core for tens of milliseconds, so a burst of logins at
+shift start stalls the request workers that run it. With
+LOGIN_PASSWORD_POOL_WORKERS > 0 ``check_password`` hands the verification to
+a process pool instead:
+
+    - back-pressure: at most LOGIN_PASSWORD_POOL_MAX_PENDING verifications are
+      queued or running per request worker process; beyond that, and when one
+      waits longer than LOGIN_PASSWORD_POOL_TIMEOUT_SECONDS, ``PasswordPoolBusy``
+      is raised and the login answers 503 so clients back off
+    - rehash: when the stored hash does not match the hasher policy
+      (PASSWORD_HASHERS, PASSWORD_PBKDF2_ITERATIONS) the worker also computes the
+      new hash, and the caller saves it, as Employee.check_password does inline
+    - metrics: time spent queued and verifying, kept for the last verifications
+
+Workers are spawned, not forked, and read the settings module on start;
+settings overridden at runtime do not reach them.
+"""
+import multiprocessing
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password, verify_password
+
+# Verifications kept for the latency percentiles
+LATENCY_WINDOW = 1000
+
+
+class PasswordPoolBusy(Exception):
+    """Too many verifications are waiting; the login should be retried later"""
+
+
+def _init_worker():
+    django.setup()
+
+
+def _verify(password, encoded, submitted_at):
+    """Runs in a worker: ``(is_correct, new_encoded or None, seconds queued, seconds verifying)``"""
+    started_at = time.time()
+    is_correct, must_update = verify_password(password, encoded)
+    new_encoded = make_password(password) if is_correct and must_update else None
+    return is_correct, new_encoded, started_at - submitted_at, time.time() - started_at
+
+
+def _milliseconds(samples):
+    if not samples:
+        return {'p50': None, 'p95': None, 'max': None}
+    ordered = sorted(samples)
+    return {
+        'p50': round(ordered[len(ordered) // 2] * 1000, 2),
+        'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+        'max': round(ordered[-1] * 1000, 2),
+    }
+
+
+class PasswordPool:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = 0
+        self.counters = Counter()
+        self._queued = deque(maxlen=LATENCY_WINDOW)
+        self._verifying = deque(maxlen=LATENCY_WINDOW)
+
+    def workers(self):
+        return getattr(settings, 'LOGIN_PASSWORD_POOL_WORKERS', 0)
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                self.workers(), mp_context=multiprocessing.get_context('spawn'), initializer=_init_worker
+            )
+        return self._executor
+
+    def verify(self, password, encoded):
+        """``(is_correct, new_encoded)``, where new_encoded is the rehashed password or None"""
+        max_pending = getattr(settings, 'LOGIN_PASSWORD_POOL_MAX_PENDING', 64)
+        with self._lock:
+            if self._pending >= max_pending:
+                self.counters['rejected'] += 1
+                raise PasswordPoolBusy(f'{self._pending} password verifications pending')
+            self._pending += 1
+            executor = self._get_executor()
+
+        try:
+            future = executor.submit(_verify, password, encoded, time.time())
+            is_correct, new_encoded, queued, verifying = future.result(
+                timeout=getattr(settings, 'LOGIN_PASSWORD_POOL_TIMEOUT_SECONDS', 10)
+            )
+        except FutureTimeoutError:
+            future.cancel()
+            with self._lock:
+                self.counters['timed_out'] += 1
+            raise PasswordPoolBusy('Password verification timed out')
+        except BrokenProcessPool:
+            # A worker died; start a new pool for the next login
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+                self.counters['broken'] += 1
+            raise PasswordPoolBusy('Password verification pool restarted')
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+        with self._lock:
+            self.counters['verified'] += 1
+            if new_encoded:
+                self.counters['rehashed'] += 1
+            self._queued.append(queued)
+            self._verifying.append(verifying)
+        return is_correct, new_encoded
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers(),
+                'pending': self._pending,
+                **self.counters,
+                'queued_ms': _milliseconds(self._queued),
+                'verifying_ms': _milliseconds(self._verifying),
+            }
+
+
+pool = PasswordPool()
+
+
+def check_password(user, password):
+    """
+    ``user.check_password(password)``, verified in the pool when
+    LOGIN_PASSWORD_POOL_WORKERS is set. Either way a hash that does not match
+    the hasher policy is replaced and saved. Raises PasswordPoolBusy.
+    """
+    if pool.workers() <= 0:
+        return user.check_password(password)
+
+    is_correct, new_encoded = pool.verify(password, user.password)
+    if new_encoded:
+        user.password = new_encoded
+        user.save(update_fields=['password'])
+    return is_correct
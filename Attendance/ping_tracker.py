@@ -0,0 +1,144 @@
+"""
+Hysteresis and debouncing for ``auto_attend`` location pings.
+
+Mobile clients ping every few seconds. The tracker keeps each employee's
+attendance state in memory and decides locally whether a ping can change it:
+
+    - hysteresis: a ping only asks for a check-in when it is at least
+      AUTO_ATTEND_HYSTERESIS_METERS inside the office radius, and for a
+      check-out when it is that far outside it; pings in the band between
+      keep the current state, so a phone hovering at the boundary does not flip
+    - dwell: a transition is only escalated once it has been asked for
+      continuously for AUTO_ATTEND_MIN_DWELL_SECONDS
+
+Pings that cannot change state are absorbed without touching the database.
+The in-memory state is re-read from ``employee_presence`` after
+AUTO_ATTEND_STATE_TTL_SECONDS so changes made elsewhere (QR scans, other
+workers) are picked up.
+"""
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from .models import EmployeePresence
+
+
+@dataclass
+class TrackedEmployee:
+    state: str              # 'check-in', 'check-out' or None when never seen
+    last_activity_at: object
+    synced_at: float
+    pending: str = None     # Transition being debounced
+    pending_since: float = None
+
+
+@dataclass
+class PingDecision:
+    action: str             # 'check-in' / 'check-out' to write, None when absorbed
+    state: str
+    last_activity_at: object
+    pending: str = None
+    dwell_remaining: float = 0
+
+
+class PingTracker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._employees = {}
+        self.counters = Counter()
+
+    @staticmethod
+    def _presence_query(employee_id):
+        return EmployeePresence.objects.filter(employee_id=employee_id).values_list('state', 'last_activity_at')
+
+    def _cached(self, employee_id, now):
+        """Tracked state if still within its TTL, else None"""
+        ttl = getattr(settings, 'AUTO_ATTEND_STATE_TTL_SECONDS', 60)
+        tracked = self._employees.get(employee_id)
+        if tracked is None or now - tracked.synced_at >= ttl:
+            return None
+        return tracked
+
+    def _store(self, employee_id, row, now):
+        state, last_activity_at = row or (None, None)
+        tracked = TrackedEmployee(state, last_activity_at, synced_at=now)
+        with self._lock:
+            self._employees[employee_id] = tracked
+            self.counters['state_loads'] += 1
+        return tracked
+
+    def _tracked(self, employee_id, now):
+        tracked = self._cached(employee_id, now)
+        if tracked is None:
+            tracked = self._store(employee_id, self._presence_query(employee_id).first(), now)
+        return tracked
+
+    async def _atracked(self, employee_id, now):
+        tracked = self._cached(employee_id, now)
+        if tracked is None:
+            tracked = self._store(employee_id, await self._presence_query(employee_id).afirst(), now)
+        return tracked
+
+    @staticmethod
+    def target_state(match):
+        """State a ping asks for: 'check-in', 'check-out' or None inside the band"""
+        band = getattr(settings, 'AUTO_ATTEND_HYSTERESIS_METERS', 25)
+        radius = match.office.radius_meters
+        if match.distance <= radius - band:
+            return 'check-in'
+        if match.distance > radius + band:
+            return 'check-out'
+        return None
+
+    def decide(self, employee_id, match, now=None):
+        """Decide what a ping at GeofenceMatch ``match`` should do"""
+        now = time.monotonic() if now is None else now
+        return self._decide(self._tracked(employee_id, now), match, now)
+
+    async def adecide(self, employee_id, match, now=None):
+        """Async variant of decide(); tracked state is loaded with the async ORM"""
+        now = time.monotonic() if now is None else now
+        return self._decide(await self._atracked(employee_id, now), match, now)
+
+    def _decide(self, tracked, match, now):
+        target = self.target_state(match)
+        current = tracked.state or 'check-out'
+
+        with self._lock:
+            self.counters['pings'] += 1
+            if target is None or target == current:
+                tracked.pending = tracked.pending_since = None
+                self.counters['absorbed'] += 1
+                return PingDecision(None, tracked.state, tracked.last_activity_at)
+
+            if tracked.pending != target:
+                tracked.pending, tracked.pending_since = target, now
+
+            dwell = getattr(settings, 'AUTO_ATTEND_MIN_DWELL_SECONDS', 30)
+            remaining = dwell - (now - tracked.pending_since)
+            if remaining > 0:
+                self.counters['absorbed'] += 1
+                return PingDecision(None, tracked.state, tracked.last_activity_at, target, remaining)
+
+            self.counters['escalated'] += 1
+            return PingDecision(target, tracked.state, tracked.last_activity_at)
+
+    def record(self, employee_id, state, last_activity_at, now=None):
+        """Store the state confirmed by the database after an escalation"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._employees[employee_id] = TrackedEmployee(state, last_activity_at, synced_at=now)
+
+    def forget(self, employee_id):
+        with self._lock:
+            self._employees.pop(employee_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {'tracked_employees': len(self._employees), **self.counters}
+
+
+tracker = PingTracker()
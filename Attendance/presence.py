@@ -0,0 +1,76 @@
+"""
+Per-employee presence state.
+
+``EmployeePresence`` holds the result of folding an employee's activity
+history: the last activity, the open session (if any) and the minutes worked
+on the current work date. The attendance write path keeps it up to date so
+sequence validation is a primary key read instead of a scan over
+``employee_activity``.
+"""
+from datetime import datetime, time
+
+from django.utils import timezone
+
+from .models import EmployeeActivity, EmployeePresence
+
+
+def session_minutes(check_in_time, check_out_time):
+    """Whole minutes between a check-in and a check-out"""
+    return int((check_out_time - check_in_time).total_seconds() // 60)
+
+
+def minutes_on(presence, day):
+    """Minutes ``presence`` has accumulated on ``day``"""
+    return presence.minutes_today if presence.work_date == day else 0
+
+
+def apply_activity(presence, activity, at):
+    """
+    Fold one activity into ``presence``.
+
+    A check-out only closes a session opened on the same local day, matching
+    the rule enforced for new scans. Returns the minutes of the closed session,
+    or None when nothing was closed.
+    """
+    closed_minutes = None
+    if activity == 'check-in':
+        presence.session_started_at = at
+    else:
+        started = presence.session_started_at
+        day = timezone.localdate(at)
+        if started is not None and timezone.localdate(started) == day:
+            closed_minutes = session_minutes(started, at)
+            presence.minutes_today = minutes_on(presence, day) + closed_minutes
+            presence.work_date = day
+        presence.session_started_at = None
+
+    presence.state = activity
+    presence.last_activity_at = at
+    return closed_minutes
+
+
+def fold_activities(employee_id, activities):
+    """Build an unsaved EmployeePresence from ``(activity, timestamp)`` pairs in time order"""
+    presence = EmployeePresence(employee_id=employee_id, minutes_today=0)
+    for activity, timestamp in activities:
+        apply_activity(presence, activity, timestamp)
+    return presence
+
+
+def presence_from_history(employee_id):
+    """
+    Rebuild the presence of one employee from ``employee_activity``.
+
+    Only the last activity and the activities of its day are needed, so this
+    reads at most one day of history.
+    """
+    last = EmployeeActivity.objects.filter(emp_id=employee_id).order_by('-timestamp').first()
+    if last is None:
+        return EmployeePresence(employee_id=employee_id, minutes_today=0)
+
+    day_start = timezone.make_aware(datetime.combine(timezone.localdate(last.timestamp), time.min))
+    activities = EmployeeActivity.objects.filter(
+        emp_id=employee_id,
+        timestamp__gte=day_start
+    ).order_by('timestamp', 'id').values_list('activity', 'timestamp')
+    return fold_activities(employee_id, activities)
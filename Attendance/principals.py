@@ -0,0 +1,67 @@
+"""
+Short-lived cache of authenticated principals.
+
+JWTAuthentication resolved the token's ``employee_id`` into a full Employee
+row on every request, although permission checks only read a handful of
+flags. The cache keeps those fields per ``employee_id`` in the Django cache
+for PRINCIPAL_CACHE_SECONDS:
+
+    - ``get`` rebuilds an Employee from the cached fields; every other field is
+      deferred and loaded on first access, so views that need more still work
+    - saving or deleting an Employee drops its entry (signals.py); bulk
+      ``update()`` calls of these fields bypass signals and must call
+      ``invalidate`` themselves
+    - with a process-local cache backend other workers see changes after at
+      most PRINCIPAL_CACHE_SECONDS
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Employee
+
+# In Employee's concrete field order, as Model.from_db expects
+FIELDS = [
+    field.attname for field in Employee._meta.concrete_fields
+    if field.attname in {'id', 'employee_id', 'is_active', 'is_staff', 'is_superuser'}
+]
+
+
+def _key(employee_id):
+    return f'attendance:principal:{employee_id}'
+
+
+def _timeout():
+    return getattr(settings, 'PRINCIPAL_CACHE_SECONDS', 30)
+
+
+def _principal(values):
+    return Employee.from_db('default', FIELDS, values)
+
+
+def get(employee_id):
+    """The Employee with ``employee_id`` with only the principal fields loaded, None if there is none"""
+    values = cache.get(_key(employee_id))
+    if values is None:
+        values = Employee.objects.filter(employee_id=employee_id).values_list(*FIELDS).first()
+        if values is None:
+            return None
+        cache.set(_key(employee_id), values, _timeout())
+    return _principal(values)
+
+
+async def aget(employee_id):
+    """Async variant of get()"""
+    values = await cache.aget(_key(employee_id))
+    if values is None:
+        values = await Employee.objects.filter(employee_id=employee_id).values_list(*FIELDS).afirst()
+        if values is None:
+            return None
+        await cache.aset(_key(employee_id), values, _timeout())
+    return _principal(values)
+
+
+def invalidate(employee_id):
+    """Drop the cached principal now and again after commit, so a concurrent read cannot re-cache old values"""
+    cache.delete(_key(employee_id))
+    transaction.on_commit(lambda: cache.delete(_key(employee_id)))
@@ -0,0 +1,135 @@
+"""
+QR code validation.
+
+Two kinds of codes are accepted by the attendance endpoints:
+
+    - stored codes: the 8 character ``unique_number`` rows in ``qr_details``
+      created by ``generate_qr``; validating one costs a query
+    - signed codes (optional, ``QR_SIGNED_CODES``): ``S<window>.<mac>`` where
+      ``window`` is the current QR_ROTATION_SECONDS time step and ``mac`` an
+      HMAC over the usage type and window, TOTP-style. They are verified with
+      CPU work only, and kiosks rotate them without touching the table.
+"""
+import hmac
+import time
+
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
+from django.utils.crypto import salted_hmac
+
+from .models import QRDetails
+
+SIGNED_PREFIX = 'S'
+KEY_SALT = 'Attendance.qr_codes'
+
+
+def signed_codes_enabled():
+    return getattr(settings, 'QR_SIGNED_CODES', False)
+
+
+def rotation_seconds():
+    return getattr(settings, 'QR_ROTATION_SECONDS', 30)
+
+
+def time_window(at=None):
+    """Index of the rotation window containing ``at`` (a unix timestamp, default now)"""
+    return int((time.time() if at is None else at) // rotation_seconds())
+
+
+def _mac(usage_type, window):
+    return salted_hmac(
+        KEY_SALT,
+        f'{usage_type}:{window}',
+        secret=getattr(settings, 'QR_SIGNING_KEY', None),
+        algorithm='sha256'
+    ).hexdigest()[:16]
+
+
+def sign_code(usage_type, window=None):
+    """Signed code for ``usage_type`` valid during ``window`` (default: the current one)"""
+    window = time_window() if window is None else window
+    return f'{SIGNED_PREFIX}{window}.{_mac(usage_type, window)}'
+
+
+def is_signed_code(code):
+    return code.startswith(SIGNED_PREFIX) and '.' in code
+
+
+def verify_signed_code(code, usage_type, at=None):
+    """
+    Check a signed code at ``at`` (unix timestamp, default now). Codes from up
+    to QR_ALLOWED_SKEW_WINDOWS previous windows are still accepted, so a code
+    scanned just before rotation does not fail.
+    """
+    try:
+        window_part, mac = code[len(SIGNED_PREFIX):].split('.', 1)
+        window = int(window_part)
+    except ValueError:
+        return False
+
+    skew = getattr(settings, 'QR_ALLOWED_SKEW_WINDOWS', 1)
+    current = time_window(at)
+    if not current - skew <= window <= current:
+        return False
+    return hmac.compare_digest(mac, _mac(usage_type, window))
+
+
+def _stored_code_query(code, usage_type):
+    return QRDetails.objects.filter(unique_number=code, usage_type=usage_type, is_valid=True)
+
+
+def is_valid_code(code, usage_type):
+    """Validate a scanned code; signed codes need no query when enabled"""
+    if signed_codes_enabled() and is_signed_code(code):
+        return verify_signed_code(code, usage_type)
+    return _stored_code_query(code, usage_type).exists()
+
+
+async def ais_valid_code(code, usage_type):
+    """Async variant of is_valid_code()"""
+    if signed_codes_enabled() and is_signed_code(code):
+        return verify_signed_code(code, usage_type)
+    return await _stored_code_query(code, usage_type).aexists()
+
+
+def stored_code_windows(codes):
+    """
+    Validity windows of stored codes, for validating scans after the fact.
+
+    A stored code is valid from its create_date until the next code of the
+    same usage type was generated (which invalidated it). Returns a dict
+    ``unique_number -> (usage_type, valid_from, valid_until)`` where
+    valid_until is None for the code that is still current.
+    """
+    codes = [code for code in codes if code and not is_signed_code(code)]
+    if not codes:
+        return {}
+
+    # Only the referenced codes, each with the create_date of the next code
+    # of its usage type (one index seek per code)
+    next_created = QRDetails.objects.filter(
+        usage_type=OuterRef('usage_type'), create_date__gt=OuterRef('create_date')
+    ).order_by('create_date').values('create_date')[:1]
+    rows = QRDetails.objects.filter(unique_number__in=codes).annotate(
+        valid_until=Subquery(next_created)
+    ).values_list('unique_number', 'usage_type', 'create_date', 'is_valid', 'valid_until')
+
+    windows = {}
+    for unique_number, usage_type, create_date, is_valid, valid_until in rows:
+        if is_valid:
+            windows[unique_number] = (usage_type, create_date, None)
+        elif valid_until is not None:
+            windows[unique_number] = (usage_type, create_date, valid_until)
+    return windows
+
+
+def is_valid_code_at(code, usage_type, at, windows):
+    """Validate a code scanned at datetime ``at`` against ``stored_code_windows`` output"""
+    if signed_codes_enabled() and is_signed_code(code):
+        return verify_signed_code(code, usage_type, at.timestamp())
+
+    window = windows.get(code)
+    if window is None:
+        return False
+    window_type, valid_from, valid_until = window
+    return window_type == usage_type and valid_from <= at and (valid_until is None or at < valid_until)
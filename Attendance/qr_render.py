@@ -0,0 +1,79 @@
+"""
+QR image rendering and display caching.
+
+Rendered images are kept in a process-local LRU cache keyed by the code, so
+lobby displays polling the current code get the same bytes back without
+re-rasterizing. SVG output skips PIL entirely and is much cheaper than PNG.
+
+The currently valid stored code per usage type is remembered in the Django
+cache for QR_CURRENT_CODE_CACHE_SECONDS; display polling falls back to
+``qr_details`` (one indexed read) when that entry is missing. ``generate_qr``
+refreshes the entry of the worker that handled it; with a process-local cache
+the other workers serve the new code once their entry expires.
+"""
+from functools import lru_cache
+from io import BytesIO
+
+import qrcode
+import qrcode.image.svg
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import QRDetails
+
+FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+CURRENT_CODE_KEY = 'attendance:qr:current:{usage_type}'
+
+
+def attendance_url(host, code, usage_type):
+    return f"http://{host}/attend?code={code}&type={usage_type}"
+
+
+@lru_cache(maxsize=256)
+def render_qr(code, usage_type, host, image_format='png'):
+    """Render the attendance QR for ``code``; returns (content, content_type)"""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(attendance_url(host, code, usage_type))
+    qr.make(fit=True)
+
+    if image_format == 'svg':
+        return qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).to_string(), FORMATS['svg']
+
+    buffer = BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(buffer, format='PNG')
+    return buffer.getvalue(), FORMATS['png']
+
+
+def etag_for(code, image_format, host):
+    """ETag of render_qr's output, which embeds the host in the attendance URL"""
+    return f'"{code}-{image_format}-{host}"'
+
+
+def _timeout():
+    return getattr(settings, 'QR_CURRENT_CODE_CACHE_SECONDS', 5)
+
+
+def set_current_code(usage_type, code):
+    cache.set(CURRENT_CODE_KEY.format(usage_type=usage_type), code, _timeout())
+
+
+def current_code(usage_type):
+    """Currently valid stored code for ``usage_type``, or None"""
+    key = CURRENT_CODE_KEY.format(usage_type=usage_type)
+    code = cache.get(key)
+    if code is None:
+        code = QRDetails.objects.filter(
+            usage_type=usage_type,
+            is_valid=True
+        ).order_by('-create_date').values_list('unique_number', flat=True).first()
+        if code is not None:
+            cache.set(key, code, _timeout())
+    return code
@@ -0,0 +1,187 @@
+"""
+Process-local list of revoked (blacklisted) token JTIs.
+
+Access and refresh tokens live for 100 years (SIMPLE_JWT), so the blacklist
+is the only way to revoke one. Looking every request's JTI up in
+token_blacklist_blacklistedtoken would cost a join per request; instead each
+worker keeps the revoked JTIs in memory:
+
+    - a Bloom filter answers "not revoked" for almost every token with a few
+      bit tests; a hit is confirmed against the exact set of revoked JTIs, so
+      a false positive never rejects a valid token
+    - the list is loaded on first use and then refreshed incrementally every
+      TOKEN_REVOCATION_REFRESH_SECONDS with the rows blacklisted since the
+      ``blacklisted_at`` watermark (an indexed range query)
+    - tokens revoked by this worker are added immediately; other workers see
+      them after at most TOKEN_REVOCATION_REFRESH_SECONDS
+    - blacklisted tokens pruned by prune_outstanding_tokens are kept in
+      revoked_jti, read after the blacklist and incrementally by primary key,
+      so a token moved between the two reads is still picked up
+"""
+import hashlib
+import math
+import threading
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from .models import BlacklistedTokenModel, RevokedToken
+
+# Re-read this far behind the watermark: a row committed late can carry an
+# earlier blacklisted_at than rows already seen
+WATERMARK_OVERLAP = timedelta(minutes=1)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter of strings, sized for ``capacity`` items at ``error_rate``"""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = max(capacity, 1)
+        self.size = max(8, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + index * second) % self.size for index in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationList:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._revoked = set()
+        self._watermark = None
+        self._pruned_id = 0
+        self._checked_at = None
+
+    def _new_bloom(self, capacity):
+        error_rate = getattr(settings, 'TOKEN_REVOCATION_BLOOM_ERROR_RATE', 0.001)
+        bloom = BloomFilter(capacity, error_rate)
+        for jti in self._revoked:
+            bloom.add(jti)
+        return bloom
+
+    def _add(self, jti):
+        if jti in self._revoked:
+            return
+        self._revoked.add(jti)
+        if self._bloom.count >= self._bloom.capacity:
+            # Past capacity the false positive rate climbs; rebuild twice as large
+            self._bloom = self._new_bloom(self._bloom.capacity * 2)
+        else:
+            self._bloom.add(jti)
+
+    def _read(self, since):
+        rows = BlacklistedTokenModel.objects.all()
+        if since is not None:
+            rows = rows.filter(blacklisted_at__gte=since - WATERMARK_OVERLAP)
+        for jti, blacklisted_at in rows.values_list('token__jti', 'blacklisted_at').iterator(chunk_size=5000):
+            self._add(jti)
+            if self._watermark is None or blacklisted_at > self._watermark:
+                self._watermark = blacklisted_at
+
+        # Pruned rows move here in one transaction with their blacklist row
+        # removal, so reading this table second cannot miss them
+        pruned = RevokedToken.objects.filter(id__gt=self._pruned_id).order_by('id')
+        for pruned_id, jti in pruned.values_list('id', 'jti').iterator(chunk_size=5000):
+            self._add(jti)
+            self._pruned_id = pruned_id
+
+    def _load(self):
+        """Read everything into a new list and swap it in, so readers never see a half-filled set"""
+        loaded = RevocationList()
+        capacity = getattr(settings, 'TOKEN_REVOCATION_BLOOM_CAPACITY', 100000)
+        revoked = BlacklistedTokenModel.objects.count() + RevokedToken.objects.count()
+        loaded._bloom = loaded._new_bloom(max(capacity, revoked * 2))
+        loaded._read(None)
+
+        self._watermark, self._pruned_id = loaded._watermark, loaded._pruned_id
+        self._revoked = loaded._revoked
+        # Last: a reader holding the new filter always finds the complete set
+        self._bloom = loaded._bloom
+
+    def _fresh(self, now):
+        refresh_seconds = getattr(settings, 'TOKEN_REVOCATION_REFRESH_SECONDS', 5)
+        return self._checked_at is not None and now - self._checked_at < refresh_seconds
+
+    def refresh(self):
+        """Load the list, or read the rows blacklisted since the watermark, unless checked recently"""
+        now = time.monotonic()
+        if self._fresh(now):
+            return
+        with self._lock:
+            if self._fresh(now):
+                return
+            if self._bloom is None:
+                self._load()
+            else:
+                self._read(self._watermark)
+            self._checked_at = now
+
+    def _contains(self, jti):
+        bloom = self._bloom
+        return bloom is not None and jti in bloom and jti in self._revoked
+
+    def is_revoked(self, jti):
+        """True if the token with ``jti`` has been blacklisted"""
+        self.refresh()
+        return self._contains(jti)
+
+    async def ais_revoked(self, jti):
+        """Async variant of is_revoked(); only hops to a thread when a refresh is due"""
+        if not self._fresh(time.monotonic()):
+            await sync_to_async(self.refresh)()
+        return self._contains(jti)
+
+    def add(self, jti):
+        """Record a JTI this worker has just blacklisted"""
+        with self._lock:
+            if self._bloom is not None:
+                self._add(jti)
+
+    def clear(self):
+        """Drop the local copy so the next check reloads everything"""
+        with self._lock:
+            self._bloom = None
+            self._checked_at = None
+
+    def stats(self):
+        bloom = self._bloom
+        return {
+            'revoked': len(self._revoked),
+            'bloom_bits': bloom.size if bloom else 0,
+            'bloom_hashes': bloom.hashes if bloom else 0,
+            'watermark': self._watermark,
+        }
+
+
+revoked_tokens = RevocationList()
+
+
+def is_revoked(jti):
+    return revoked_tokens.is_revoked(jti)
+
+
+async def ais_revoked(jti):
+    return await revoked_tokens.ais_revoked(jti)
+
+
+def revoked(jti):
+    """Add ``jti`` to this worker's list once the blacklisting transaction commits"""
+    transaction.on_commit(lambda: revoked_tokens.add(jti))
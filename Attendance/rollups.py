@@ -0,0 +1,123 @@
+"""
+Daily and hourly activity rollups for the attendance summary.
+
+``AttendanceLogsViewSet.summary`` used to GROUP BY TruncDate/TruncHour over the
+whole employee_activity table on every request. The rollup tables hold the
+same counts per employee, local day (or hour) and activity type:
+
+    - the write paths (record_attendance, record_attendance_batch,
+      close_open_sessions) call ``record`` in the transaction that inserts the
+      activities, under the employees' presence locks, so the per-employee
+      rows are never incremented concurrently
+    - ``backfill_rollups`` recomputes closed days from employee_activity
+    - the summary reads the rollups for days before today and only aggregates
+      raw rows for the current day
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .date_ranges import date_range, day_start, hour_of_day, timestamp_range
+from .models import ActivityDailyRollup, ActivityHourlyRollup
+
+
+def hour_start(at):
+    """Start of the local hour ``at`` falls in"""
+    return timezone.localtime(at).replace(minute=0, second=0, microsecond=0)
+
+
+def _add(model, period_field, counts):
+    """Add ``counts`` keyed by ``(emp_id, period, activity)`` to the rollup rows of ``model``"""
+    if len(counts) == 1:
+        # Single scan: one in-SQL increment, plus an insert for the first event of the period
+        ((emp_id, period, activity), events), = counts.items()
+        key = {'emp_id': emp_id, period_field: period, 'activity': activity}
+        if not model.objects.filter(**key).update(events=F('events') + events):
+            model.objects.create(events=events, **key)
+        return
+
+    existing = {
+        (row.emp_id, getattr(row, period_field), row.activity): row
+        for row in model.objects.filter(**{
+            'emp_id__in': {emp_id for emp_id, _, _ in counts},
+            f'{period_field}__in': {period for _, period, _ in counts},
+            'activity__in': {activity for _, _, activity in counts},
+        })
+    }
+    to_update, to_create = [], []
+    for (emp_id, period, activity), events in counts.items():
+        row = existing.get((emp_id, period, activity))
+        if row is None:
+            to_create.append(model(emp_id=emp_id, activity=activity, events=events, **{period_field: period}))
+        else:
+            row.events += events
+            to_update.append(row)
+    model.objects.bulk_update(to_update, ['events'])
+    model.objects.bulk_create(to_create)
+
+
+def record(activities):
+    """
+    Count new EmployeeActivity rows into the rollups. Call it in the
+    transaction that saves them, with the employees' presence rows locked.
+    """
+    daily, hourly = Counter(), Counter()
+    for activity in activities:
+        daily[(activity.emp_id, timezone.localdate(activity.timestamp), activity.activity)] += 1
+        hourly[(activity.emp_id, hour_start(activity.timestamp), activity.activity)] += 1
+    if daily:
+        _add(ActivityDailyRollup, 'day', daily)
+        _add(ActivityHourlyRollup, 'hour', hourly)
+
+
+def closed_counts(before, employee_id=None, start_date=None, end_date=None, activity=None, hour=None):
+    """
+    ``(activity_counts, hourly_distribution)`` querysets read from the rollups
+    for days before ``before``, in the shape of the raw summary aggregates.
+    """
+    hourly = ActivityHourlyRollup.objects.filter(hour__lt=day_start(before))
+    hourly = timestamp_range(hourly, start_date, end_date, 'hour')
+    if employee_id:
+        hourly = hourly.filter(emp_id=employee_id)
+    if activity:
+        hourly = hourly.filter(activity=activity)
+
+    if hour not in (None, ''):
+        # Only the hourly rollup knows which hour an event happened in
+        hourly = hour_of_day(hourly, hour)
+        daily = hourly.annotate(date=TruncDate('hour'))
+    else:
+        daily = date_range(ActivityDailyRollup.objects.filter(day__lt=before), start_date, end_date, 'day')
+        if employee_id:
+            daily = daily.filter(emp_id=employee_id)
+        if activity:
+            daily = daily.filter(activity=activity)
+        daily = daily.annotate(date=F('day'))
+
+    activity_counts = daily.values('date', 'activity').annotate(count=Sum('events')).order_by('date')
+    hourly_distribution = hourly.values('hour', 'activity').annotate(count=Sum('events')).order_by('hour')
+    return activity_counts, hourly_distribution
+
+
+def rebuild_day(day, counts):
+    """
+    Replace the rollup rows of ``day`` with ``counts``, an iterable of
+    ``(emp_id, hour, activity, events)``. Returns the number of hourly rows.
+    """
+    start = day_start(day)
+    ActivityDailyRollup.objects.filter(day=day).delete()
+    ActivityHourlyRollup.objects.filter(hour__gte=start, hour__lt=day_start(day + timedelta(days=1))).delete()
+
+    daily, hourly = Counter(), []
+    for emp_id, hour, activity, events in counts:
+        daily[(emp_id, activity)] += events
+        hourly.append(ActivityHourlyRollup(emp_id=emp_id, hour=hour, activity=activity, events=events))
+    ActivityHourlyRollup.objects.bulk_create(hourly, batch_size=1000)
+    ActivityDailyRollup.objects.bulk_create([
+        ActivityDailyRollup(emp_id=emp_id, day=day, activity=activity, events=events)
+        for (emp_id, activity), events in daily.items()
+    ], batch_size=1000)
+    return len(hourly)
@@ -1,5 +1,21 @@
 from rest_framework import serializers
-from .models import Employee, EmployeeActivity, QRDetails, OfficeLocation, Holiday, LeaveType, LeaveBalance, LeaveRequest, WorkedHours
+from django.utils import timezone
+from .models import Employee, EmployeeActivity, QRDetails, OfficeLocation, Holiday, LeaveType, LeaveBalance, LeaveRequest, WorkedHours, EmployeePresence
+from .presence import minutes_on
+
+
+def format_minutes(minutes):
+    """Display form of a worked time in minutes, e.g. 510 -> '8:30'"""
+    if minutes is None:
+        return None
+    return f'{minutes // 60}:{minutes % 60:02d}'
+
+
+class MinutesField(serializers.ReadOnlyField):
+    """Integer minutes rendered as H:MM"""
+
+    def to_representation(self, value):
+        return format_minutes(value)
 
 class EmployeeSerializer(serializers.ModelSerializer):
     class Meta:
@@ -35,7 +51,7 @@ class QRDetailsSerializer(serializers.ModelSerializer):
 class OfficeLocationSerializer(serializers.ModelSerializer):
     class Meta:
         model = OfficeLocation
-        fields = ['id', 'latitude', 'longitude', 'is_valid'] 
+        fields = ['id', 'name', 'latitude', 'longitude', 'radius_meters', 'is_valid'] 
 
 class HolidaySerializer(serializers.ModelSerializer):
     class Meta:
@@ -74,7 +90,19 @@ class LeaveRequestSerializer(serializers.ModelSerializer):
 class WorkedHoursSerializer(serializers.ModelSerializer):
     employee_id = serializers.CharField(source='emp.employee_id', read_only=True)
     username = serializers.CharField(source='emp.username', read_only=True)
+    worked_hours = MinutesField(source='worked_minutes')
 
     class Meta:
         model = WorkedHours
-        fields = ['work_date', 'worked_hours', 'employee_id', 'username']
\ No newline at end of file
+        fields = ['work_date', 'worked_minutes', 'worked_hours', 'employee_id', 'username']
+
+class EmployeePresenceSerializer(serializers.ModelSerializer):
+    employee_id = serializers.CharField(read_only=True)
+    minutes_today = serializers.SerializerMethodField()
+
+    class Meta:
+        model = EmployeePresence
+        fields = ['employee_id', 'state', 'last_activity_at', 'session_started_at', 'minutes_today']
+
+    def get_minutes_today(self, obj):
+        return minutes_on(obj, timezone.localdate())
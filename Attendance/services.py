@@ -0,0 +1,359 @@
+"""
+Attendance recording service.
+
+Every attendance write (QR scans through ``mark_attendance`` and location based
+``auto_attend``) goes through ``record_attendance``. It validates the
+check-in/check-out sequence against the employee's presence row, locks it and
+persists the activity, worked hours, presence and ``last_login`` in one
+transaction.
+
+Worked time is kept as integer minutes (``worked_hours.worked_minutes``) and
+only formatted for display by the serializers.
+
+Query budget per scan (inside the transaction):
+    - check-in:  lock presence, insert activity, increment the daily and hourly
+      rollups (see rollups.py), update presence, update last_login
+    - check-out: the above plus one increment of worked_hours (and an insert
+      for the first session of the day)
+"""
+from dataclasses import dataclass
+from datetime import datetime, time as day_time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Employee, EmployeeActivity, EmployeePresence, WorkedHours
+from .presence import apply_activity, minutes_on, presence_from_history, session_minutes
+from . import rollups
+
+ACTIVITY_TYPES = ('check-in', 'check-out')
+
+
+class AttendanceError(Exception):
+    """
+    Raised when an attendance event is rejected.
+
+    ``code`` identifies the rule that failed and ``payload`` is the error body
+    the views return to the client.
+    """
+
+    def __init__(self, code, error, **details):
+        super().__init__(error)
+        self.code = code
+        self.payload = {'error': error, **details}
+
+
+@dataclass
+class AttendanceResult:
+    employee: Employee
+    activity: EmployeeActivity
+    session_minutes: int = None
+    total_minutes: int = None
+
+
+@dataclass
+class Scan:
+    employee_id: str
+    usage_type: str
+    at: datetime
+
+
+@dataclass
+class ScanOutcome:
+    activity: EmployeeActivity = None
+    session_minutes: int = None
+    error: AttendanceError = None
+
+
+def _last_activity_details(presence):
+    return {
+        'type': presence.state,
+        'timestamp': presence.last_activity_at
+    }
+
+
+def validate_sequence(usage_type, presence, today):
+    """
+    Check that ``usage_type`` may follow the employee's current ``presence``.
+
+    Raises AttendanceError when the sequence is broken.
+    """
+    if usage_type == 'check-in':
+        if presence.state == 'check-in':
+            raise AttendanceError(
+                'already-checked-in',
+                'Cannot check in: You have not checked out from your previous session',
+                last_activity=_last_activity_details(presence)
+            )
+        return
+
+    if presence.state is None:
+        raise AttendanceError('no-check-in', 'Cannot check out: No previous check-in found')
+    if presence.state == 'check-out':
+        raise AttendanceError(
+            'not-checked-in',
+            'Cannot check out: You have not checked in yet',
+            last_activity=_last_activity_details(presence)
+        )
+    # The open session must have started today
+    if presence.session_started_at is None or timezone.localdate(presence.session_started_at) != today:
+        raise AttendanceError('no-check-in-today', 'No check-in record found for today')
+
+
+def lock_presence(employee_id):
+    """
+    Return the EmployeePresence of ``employee_id`` with its row (and the
+    employee row) locked for the rest of the transaction.
+
+    The presence row is created from activity history the first time an
+    employee is seen. Raises AttendanceError for unknown employees.
+    """
+    presence = EmployeePresence.objects.select_for_update().select_related(
+        'employee'
+    ).filter(employee_id=employee_id).first()
+    if presence is not None:
+        return presence
+
+    employee = Employee.objects.select_for_update().filter(employee_id=employee_id).first()
+    if employee is None:
+        raise AttendanceError('unknown-employee', f'Employee with ID {employee_id} not found')
+
+    # Another transaction may have created the row while we waited for the lock
+    presence = EmployeePresence.objects.select_for_update().filter(employee_id=employee_id).first()
+    if presence is None:
+        presence = presence_from_history(employee_id)
+        presence.save(force_insert=True)
+    presence.employee = employee
+    return presence
+
+
+def record_attendance(employee_id, usage_type, at=None):
+    """
+    Validate and persist one attendance event for ``employee_id``.
+
+    The presence row is locked with SELECT ... FOR UPDATE so concurrent scans
+    for the same person are serialised, while scans for different employees
+    proceed in parallel. The activity, worked hours, presence and last_login
+    are written in the same transaction.
+
+    Returns an AttendanceResult, raises AttendanceError on rejection.
+    """
+    if usage_type not in ACTIVITY_TYPES:
+        raise AttendanceError('invalid-type', 'Invalid usage type. Must be check-in or check-out')
+
+    at = at or timezone.now()
+    today = timezone.localdate(at)
+
+    with transaction.atomic():
+        presence = lock_presence(employee_id)
+        employee = presence.employee
+        validate_sequence(usage_type, presence, today)
+
+        result = AttendanceResult(employee=employee, activity=None)
+        if usage_type == 'check-out':
+            result.session_minutes = session_minutes(presence.session_started_at, at)
+            add_worked_minutes(employee_id, today, result.session_minutes)
+
+        result.activity = EmployeeActivity.objects.create(
+            emp_id=employee_id,
+            activity=usage_type,
+            timestamp=at
+        )
+        rollups.record([result.activity])
+
+        apply_activity(presence, usage_type, result.activity.timestamp)
+        presence.save(update_fields=[
+            'state', 'last_activity_at', 'session_started_at', 'work_date', 'minutes_today'
+        ])
+        if usage_type == 'check-out':
+            # The presence row carries the day's total, no need to read worked_hours back
+            result.total_minutes = minutes_on(presence, today)
+
+        Employee.objects.filter(pk=employee.pk).update(last_login=at)
+        employee.last_login = at
+
+    return result
+
+
+def record_attendance_batch(scans):
+    """
+    Validate and persist a list of Scans (e.g. an offline kiosk replay) in one
+    transaction.
+
+    Employees and their presence rows are resolved with one IN query each,
+    the check-in/check-out rules are applied per employee in timestamp order
+    in memory, and the results are written with bulk_create / bulk_update.
+    Scans older than the employee's last recorded activity are rejected.
+
+    Returns a list of ScanOutcome aligned with ``scans``.
+    """
+    outcomes = [ScanOutcome() for _ in scans]
+    for scan, outcome in zip(scans, outcomes):
+        if scan.usage_type not in ACTIVITY_TYPES:
+            outcome.error = AttendanceError('invalid-type', 'Invalid usage type. Must be check-in or check-out')
+    pending = [index for index, outcome in enumerate(outcomes) if outcome.error is None]
+    if not pending:
+        return outcomes
+
+    employee_ids = {scans[index].employee_id for index in pending}
+
+    with transaction.atomic():
+        employees = {
+            employee.employee_id: employee
+            for employee in Employee.objects.filter(employee_id__in=employee_ids).only('id', 'employee_id', 'last_login')
+        }
+        # Lock in a stable order so concurrent batches cannot deadlock each other
+        presences = {
+            presence.employee_id: presence
+            for presence in EmployeePresence.objects.select_for_update().filter(
+                employee_id__in=list(employees)
+            ).order_by('employee_id')
+        }
+        for employee_id in sorted(set(employees) - set(presences)):
+            presences[employee_id] = lock_presence(employee_id)
+
+        activities = []
+        sessions = {}  # (employee_id, work_date) -> minutes added by this batch
+        last_seen = {}  # employee_id -> latest accepted scan time
+
+        for index in sorted(pending, key=lambda i: (scans[i].employee_id, scans[i].at)):
+            scan, outcome = scans[index], outcomes[index]
+            presence = presences.get(scan.employee_id)
+            if presence is None:
+                outcome.error = AttendanceError('unknown-employee', f'Employee with ID {scan.employee_id} not found')
+                continue
+            if presence.last_activity_at is not None and scan.at <= presence.last_activity_at:
+                outcome.error = AttendanceError(
+                    'out-of-order',
+                    'Scan is older than the last recorded activity',
+                    last_activity=_last_activity_details(presence)
+                )
+                continue
+
+            day = timezone.localdate(scan.at)
+            try:
+                validate_sequence(scan.usage_type, presence, day)
+            except AttendanceError as e:
+                outcome.error = e
+                continue
+
+            if scan.usage_type == 'check-out':
+                outcome.session_minutes = session_minutes(presence.session_started_at, scan.at)
+                key = (scan.employee_id, day)
+                sessions[key] = sessions.get(key, 0) + outcome.session_minutes
+
+            apply_activity(presence, scan.usage_type, scan.at)
+            outcome.activity = EmployeeActivity(emp_id=scan.employee_id, activity=scan.usage_type, timestamp=scan.at)
+            activities.append(outcome.activity)
+            last_seen[scan.employee_id] = scan.at
+
+        if not activities:
+            return outcomes
+
+        EmployeeActivity.objects.bulk_create(activities)
+        rollups.record(activities)
+        upsert_worked_hours(sessions)
+        EmployeePresence.objects.bulk_update(
+            [presences[employee_id] for employee_id in last_seen],
+            ['state', 'last_activity_at', 'session_started_at', 'work_date', 'minutes_today']
+        )
+
+        touched = []
+        for employee_id, at in last_seen.items():
+            employee = employees[employee_id]
+            if employee.last_login is None or employee.last_login < at:
+                employee.last_login = at
+                touched.append(employee)
+        Employee.objects.bulk_update(touched, ['last_login'])
+
+    return outcomes
+
+
+def add_worked_minutes(employee_id, work_date, minutes):
+    """
+    Add ``minutes`` to the worked_hours row of ``employee_id`` on ``work_date``
+    with an in-SQL increment, inserting the row for the first session of the day.
+    The caller must hold the employee's presence lock.
+    """
+    updated = WorkedHours.objects.filter(emp_id=employee_id, work_date=work_date).update(
+        worked_minutes=F('worked_minutes') + minutes
+    )
+    if not updated:
+        WorkedHours.objects.create(emp_id=employee_id, work_date=work_date, worked_minutes=minutes)
+
+
+def upsert_worked_hours(sessions):
+    """
+    Add minutes to worked_hours rows keyed by ``(employee_id, work_date)``
+    with one read, one bulk update and one bulk insert.
+    """
+    if not sessions:
+        return
+
+    existing = {
+        (record.emp_id, record.work_date): record
+        for record in WorkedHours.objects.filter(
+            emp_id__in={employee_id for employee_id, _ in sessions},
+            work_date__in={day for _, day in sessions}
+        )
+    }
+    to_update, to_create = [], []
+    for (employee_id, day), minutes in sessions.items():
+        record = existing.get((employee_id, day))
+        if record is None:
+            to_create.append(WorkedHours(emp_id=employee_id, work_date=day, worked_minutes=minutes))
+        else:
+            record.worked_minutes += minutes
+            to_update.append(record)
+
+    WorkedHours.objects.bulk_update(to_update, ['worked_minutes'])
+    WorkedHours.objects.bulk_create(to_create)
+
+
+def missing_check_out_policy():
+    """Time credited for a session that was never checked out"""
+    return timedelta(hours=getattr(settings, 'ATTENDANCE_MISSING_CHECKOUT_HOURS', 2))
+
+
+def missing_check_out_time(started, policy, now):
+    """Synthetic check-out time: start + policy, kept on the start's day and not in the future"""
+    # Whole seconds: employee_activity.timestamp has none, and MySQL would round
+    # 23:59:59.999999 up into the next day
+    end_of_day = timezone.make_aware(
+        datetime.combine(timezone.localdate(started), day_time(23, 59, 59)), timezone.get_current_timezone()
+    )
+    return min(started + policy, end_of_day, now)
+
+
+def close_open_sessions(employee_ids, cutoff, policy, now):
+    """
+    Close the sessions of ``employee_ids`` opened before ``cutoff`` with a
+    synthetic check-out (see missing_check_out_time), in one transaction.
+    Returns the check-out activities written.
+    """
+    with transaction.atomic():
+        # Re-checked under the lock: a scan may have closed the session meanwhile
+        presences = list(EmployeePresence.objects.select_for_update().filter(
+            employee_id__in=employee_ids,
+            state='check-in',
+            session_started_at__lt=cutoff
+        ).order_by('employee_id'))
+
+        activities = []
+        sessions = {}  # (employee_id, work_date) -> minutes
+        for presence in presences:
+            started = presence.session_started_at
+            at = missing_check_out_time(started, policy, now)
+            sessions[(presence.employee_id, timezone.localdate(started))] = session_minutes(started, at)
+            activities.append(EmployeeActivity(emp_id=presence.employee_id, activity='check-out', timestamp=at))
+            apply_activity(presence, 'check-out', at)
+
+        EmployeeActivity.objects.bulk_create(activities)
+        rollups.record(activities)
+        upsert_worked_hours(sessions)
+        EmployeePresence.objects.bulk_update(
+            presences, ['state', 'last_activity_at', 'session_started_at', 'work_date', 'minutes_today']
+        )
+    return activities
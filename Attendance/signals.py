@@ -0,0 +1,15 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import geofence, principals
+from .models import Employee, OfficeLocation
+
+
+@receiver([post_save, post_delete], sender=OfficeLocation)
+def invalidate_geofence(sender, **kwargs):
+    geofence.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Employee)
+def invalidate_principal(sender, instance, **kwargs):
+    principals.invalidate(instance.employee_id)
@@ -1,3 +1,1742 @@
-from django.test import TestCase
+import csv
+import gzip
+import hashlib
+import json
+import math
+import os
+import random
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from datetime import timedelta
+from itertools import combinations
+from unittest import skipUnless
+from urllib.parse import parse_qsl, urlsplit
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+
+from django.apps import apps
+from django.core.management import call_command
+from django.contrib.auth.hashers import make_password
+from django.core import signing
+from django.core.cache import cache
+from django.db import connection
+from django.http import JsonResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.db.models import Count
+from django.db.models.functions import TruncDate, TruncHour
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from . import (
+    async_views, columnar, exports, geofence, idempotency, password_pool, ping_tracker, qr_codes, qr_render, revocation,
+    rollups,
+)
+from .pagination import ActivityLogPagination
+from .authentication import RevocableJWTAuthentication
+from .date_ranges import day_start
+from .hashers import ConfiguredPBKDF2PasswordHasher
+from .journal import AttendanceJournal, replay_orphans
+from .management.commands.convert_worked_hours import legacy_to_minutes
+from .management.commands.rebuild_worked_hours import daily_totals, sessions
+from .models import (
+    ActivityDailyRollup, ActivityHourlyRollup, BlacklistedTokenModel, Employee, EmployeeActivity, EmployeePresence, LeaveRequest, LeaveType, OfficeLocation,
+    OutstandingTokenModel, QRDetails, RevokedToken, WorkedHours
+)
+from .presence import minutes_on, presence_from_history
+from .services import AttendanceError, Scan, ScanOutcome, record_attendance, record_attendance_batch
+from .tokens import CustomRefreshToken
+from .views import (
+    AttendanceLogsViewSet, IsSuperuserOrStaff, WorkedHoursViewSet, auto_attend, current_qr, login, logout, mark_attendance_batch
+)
+
+
+class RecordingSink:
+    """Stands in for record_attendance_batch: remembers every flushed scan"""
+
+    def __init__(self, fail=False):
+        self.scans = []
+        self.fail = fail
+
+    def __call__(self, scans):
+        if self.fail:
+            raise RuntimeError('database unavailable')
+        self.scans.extend(scans)
+        return [ScanOutcome() for _ in scans]
+
+
+def empty_presence(employee_id):
+    return EmployeePresence(employee_id=employee_id, minutes_today=0)
+
+
+@override_settings(ATTENDANCE_JOURNAL_BATCH_SIZE=500, ATTENDANCE_JOURNAL_COMPACT_BYTES=1024 * 1024)
+class AttendanceJournalTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'journal-test.jsonl')
+        self.sink = RecordingSink()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def open_journal(self, sink=None):
+        journal = AttendanceJournal(self.path, sink=sink or self.sink, presence_loader=empty_presence)
+        journal.open()
+        self.addCleanup(journal.close)
+        return journal
+
+    def test_submit_is_durable_before_flush(self):
+        journal = self.open_journal()
+        at = timezone.now()
+        result = journal.submit('EMP001', 'check-in', at)
+
+        self.assertEqual(result.activity.timestamp, at)
+        self.assertEqual(self.sink.scans, [])
+        with open(self.path, 'rb') as journal_file:
+            self.assertEqual(journal_file.read().count(b'\n'), 1)
+
+        self.assertEqual(journal.flush(), 1)
+        self.assertEqual([(s.employee_id, s.usage_type, s.at) for s in self.sink.scans], [('EMP001', 'check-in', at)])
+        self.assertEqual(journal.pending_count(), 0)
+
+    def test_sequence_checked_against_unflushed_events(self):
+        journal = self.open_journal()
+        at = timezone.now()
+        journal.submit('EMP001', 'check-in', at)
+
+        with self.assertRaises(AttendanceError) as raised:
+            journal.submit('EMP001', 'check-in', at + timedelta(minutes=1))
+        self.assertEqual(raised.exception.code, 'already-checked-in')
+
+        result = journal.submit('EMP001', 'check-out', at + timedelta(minutes=90))
+        self.assertEqual(result.session_minutes, 90)
+
+    def test_failed_flush_keeps_events_pending(self):
+        failing = RecordingSink(fail=True)
+        journal = self.open_journal(sink=failing)
+        journal.submit('EMP001', 'check-in', timezone.now())
+
+        with self.assertRaises(RuntimeError):
+            journal.flush()
+        self.assertEqual(journal.pending_count(), 1)
+
+        failing.fail = False
+        self.assertEqual(journal.flush(), 1)
+        self.assertEqual(len(failing.scans), 1)
+
+    def test_reopen_replays_unflushed_tail_only(self):
+        journal = self.open_journal()
+        at = timezone.now()
+        journal.submit('EMP001', 'check-in', at)
+        journal.flush()
+        journal.submit('EMP002', 'check-in', at + timedelta(seconds=1))
+        journal.close()
+
+        # A crash in the middle of an append leaves a torn last line
+        with open(self.path, 'ab') as journal_file:
+            journal_file.write(b'{"employee_id":"EMP0')
+
+        replay_sink = RecordingSink()
+        self.assertEqual(replay_orphans(self.directory.name, sink=replay_sink), 1)
+        self.assertEqual([scan.employee_id for scan in replay_sink.scans], ['EMP002'])
+        self.assertFalse(os.path.exists(self.path))
+
+    @override_settings(ATTENDANCE_JOURNAL_COMPACT_BYTES=1)
+    def test_fully_flushed_journal_is_compacted(self):
+        journal = self.open_journal()
+        journal.submit('EMP001', 'check-in', timezone.now())
+        journal.flush()
+
+        self.assertEqual(os.path.getsize(self.path), 0)
+        journal.submit('EMP002', 'check-in', timezone.now())
+        self.assertEqual(journal.flush(), 1)
+
+
+class UnmanagedTablesTestCase(TestCase):
+    """Creates the tables of the unmanaged Attendance models (queries.write) for the test database"""
+
+    @classmethod
+    def setUpClass(cls):
+        existing = set(connection.introspection.table_names())
+        cls.created_models = [
+            model for model in apps.get_app_config('Attendance').get_models()
+            if not model._meta.managed and model._meta.db_table not in existing
+        ]
+        with connection.schema_editor() as editor:
+            for model in cls.created_models:
+                editor.create_model(model)
+                # Not created for unmanaged models; mirror the indexes of queries.write
+                for index in model._meta.indexes:
+                    editor.add_index(model, index)
+            cls.setUpSchema(editor)
+        super().setUpClass()
+
+    @classmethod
+    def setUpSchema(cls, editor):
+        """Extra DDL for the created tables, run before the test transaction starts"""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with connection.schema_editor() as editor:
+            for model in reversed(cls.created_models):
+                editor.delete_model(model)
+
+
+class TokenTablesTestCase(UnmanagedTablesTestCase):
+    """
+    Also replaces simplejwt's token_blacklist tables (user_id) with the schema
+    of queries.write (employee_id) that OutstandingTokenModel and
+    BlacklistedTokenModel map
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        with connection.schema_editor() as editor:
+            editor.delete_model(BlacklistedToken)
+            editor.delete_model(OutstandingToken)
+            editor.create_model(OutstandingTokenModel)
+            editor.create_model(BlacklistedTokenModel)
+            for index in BlacklistedTokenModel._meta.indexes:
+                editor.add_index(BlacklistedTokenModel, index)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with connection.schema_editor() as editor:
+            editor.delete_model(BlacklistedTokenModel)
+            editor.delete_model(OutstandingTokenModel)
+            editor.create_model(OutstandingToken)
+            editor.create_model(BlacklistedToken)
+
+
+class EmployeeStatsTests(UnmanagedTablesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = Employee.objects.create_user(
+            employee_id='ST000', username='stats-staff', email='stats-staff@example.com', password='x', is_staff=True
+        )
+        leave_type = LeaveType.objects.create(name='Casual', max_days_per_year=12)
+        now = timezone.now()
+        for index in range(12):
+            employee = Employee.objects.create_user(
+                employee_id=f'ST{index + 1:03d}', username=f'stats-{index}',
+                email=f'stats-{index}@example.com', password='x'
+            )
+            EmployeeActivity.objects.create(emp=employee, activity='check-in', timestamp=now - timedelta(hours=3))
+            EmployeeActivity.objects.create(emp=employee, activity='check-out', timestamp=now - timedelta(hours=1))
+            WorkedHours.objects.create(emp=employee, work_date=timezone.localdate(now), worked_minutes=120 + index)
+            LeaveRequest.objects.create(
+                employee=employee, leave_type=leave_type, start_date=timezone.localdate(now),
+                end_date=timezone.localdate(now), reason='test'
+            )
+
+    def get_stats(self, page_size):
+        request = APIRequestFactory().get('/attendance-logs/employee_stats/', {'page_size': page_size})
+        force_authenticate(request, user=self.staff)
+        return AttendanceLogsViewSet.as_view({'get': 'employee_stats'})(request)
+
+    def test_query_count_does_not_grow_with_employees(self):
+        # COUNT and page of employees, then one query per dimension
+        with self.assertNumQueries(7):
+            few = self.get_stats(2)
+        with self.assertNumQueries(7):
+            many = self.get_stats(13)
+
+        self.assertEqual(len(few.data['results']), 2)
+        self.assertEqual(len(many.data['results']), 13)
+        self.assertEqual(many.data['count'], 13)
+
+    def test_results_are_per_employee(self):
+        results = {row['employee_id']: row for row in self.get_stats(13).data['results']}
+
+        self.assertEqual(results['ST000']['attendance'], [])
+        self.assertEqual(results['ST000']['total_worked_hours'], {'total_minutes': 0, 'total': '0:00'})
+        stats = results['ST004']
+        self.assertEqual([row['activity'] for row in stats['attendance']], ['check-in', 'check-out'])
+        self.assertEqual(stats['total_worked_hours'], {'total_minutes': 123, 'total': '2:03'})
+        self.assertEqual(len(stats['leaves']), 1)
+        self.assertEqual(sum(row['count'] for row in stats['check_in_distribution']), 1)
+
+
+class WorkedHoursResponseTests(UnmanagedTablesTestCase):
+    """Worked time keeps the worked_hours key in its H:MM form next to the integer minutes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = Employee.objects.create_user(
+            employee_id='WH000', username='worked-staff', email='worked-staff@example.com', password='x', is_staff=True
+        )
+        cls.day = timezone.localdate() - timedelta(days=1)
+        WorkedHours.objects.create(emp=cls.staff, work_date=cls.day, worked_minutes=510)
+
+    def get(self, viewset, action, params):
+        request = APIRequestFactory().get('/', params)
+        force_authenticate(request, user=self.staff)
+        return viewset.as_view({'get': action})(request)
+
+    def test_rows_carry_formatted_worked_hours(self):
+        expected = {'worked_minutes': 510, 'worked_hours': '8:30', 'emp__employee_id': 'WH000'}
+        responses = {
+            'summary': self.get(AttendanceLogsViewSet, 'summary', {'start_date': str(self.day)}).data['worked_hours'],
+            'daily_hours': self.get(WorkedHoursViewSet, 'daily_hours', {}).data['daily_hours'],
+            'date_wise': self.get(WorkedHoursViewSet, 'date_wise', {'date': str(self.day)}).data['records'],
+        }
+        for action, rows in responses.items():
+            with self.subTest(action):
+                self.assertEqual(len(rows), 1)
+                self.assertLessEqual(expected.items(), rows[0].items())
+
+
+class ActivityRollupTests(UnmanagedTablesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = Employee.objects.create_user(
+            employee_id='RU000', username='rollup-staff', email='rollup-staff@example.com', password='x', is_staff=True
+        )
+        Employee.objects.create_user(employee_id='RU001', username='rollup-1', email='rollup-1@example.com')
+        cls.today = timezone.localdate()
+        cls.first_day = cls.today - timedelta(days=3)
+
+    def at(self, days_ago, hour, minute=0):
+        return day_start(self.today - timedelta(days=days_ago)) + timedelta(hours=hour, minutes=minute)
+
+    def rollup_rows(self):
+        daily = set(ActivityDailyRollup.objects.values_list('emp_id', 'day', 'activity', 'events'))
+        hourly = set(ActivityHourlyRollup.objects.values_list('emp_id', 'hour', 'activity', 'events'))
+        return daily, hourly
+
+    def test_single_scan_creates_then_increments(self):
+        scan = EmployeeActivity(emp_id='RU001', activity='check-in', timestamp=self.at(1, 9, 10))
+        rollups.record([scan])
+        rollups.record([scan])
+        daily, hourly = self.rollup_rows()
+        self.assertEqual(daily, {('RU001', self.today - timedelta(days=1), 'check-in', 2)})
+        self.assertEqual(hourly, {('RU001', self.at(1, 9), 'check-in', 2)})
+
+    def test_batch_increments_existing_rows_and_creates_new_ones(self):
+        rollups.record([EmployeeActivity(emp_id='RU001', activity='check-in', timestamp=self.at(1, 9, 10))])
+        rollups.record([
+            EmployeeActivity(emp_id='RU001', activity='check-in', timestamp=self.at(1, 9, 50)),
+            EmployeeActivity(emp_id='RU001', activity='check-out', timestamp=self.at(1, 17, 5)),
+            EmployeeActivity(emp_id='RU000', activity='check-in', timestamp=self.at(2, 8, 0)),
+        ])
+        daily, hourly = self.rollup_rows()
+        self.assertEqual(daily, {
+            ('RU001', self.today - timedelta(days=1), 'check-in', 2),
+            ('RU001', self.today - timedelta(days=1), 'check-out', 1),
+            ('RU000', self.today - timedelta(days=2), 'check-in', 1),
+        })
+        self.assertEqual(hourly, {
+            ('RU001', self.at(1, 9), 'check-in', 2),
+            ('RU001', self.at(1, 17), 'check-out', 1),
+            ('RU000', self.at(2, 8), 'check-in', 1),
+        })
+
+    def record_history(self):
+        """Sessions for both employees on the last three days and today, through the write path"""
+        for days_ago in (3, 2, 1, 0):
+            for employee_id, start in (('RU000', 9), ('RU001', 10)):
+                record_attendance(employee_id, 'check-in', at=self.at(days_ago, start, 15))
+                record_attendance(employee_id, 'check-out', at=self.at(days_ago, start, 45))
+                if days_ago % 2:
+                    record_attendance(employee_id, 'check-in', at=self.at(days_ago, 13))
+                    record_attendance(employee_id, 'check-out', at=self.at(days_ago, 14, 30))
+
+    def test_backfill_matches_employee_activity(self):
+        self.record_history()
+        expected = self.rollup_rows()
+        # Lost and miscounted rows on closed days
+        ActivityHourlyRollup.objects.filter(hour__lt=day_start(self.today)).delete()
+        ActivityDailyRollup.objects.filter(day=self.first_day, emp_id='RU000').update(events=7)
+
+        call_command('backfill_rollups', stdout=StringIO())
+        self.assertEqual(self.rollup_rows(), expected)
+
+    def summary(self, params):
+        request = APIRequestFactory().get('/attendance-logs/summary/', params)
+        force_authenticate(request, user=self.staff)
+        data = AttendanceLogsViewSet.as_view({'get': 'summary'})(request).data
+        return (
+            sorted((row['date'], row['activity'], row['count']) for row in data['activity_counts']),
+            sorted((row['hour'], row['activity'], row['count']) for row in data['hourly_distribution']),
+        )
+
+    def raw_summary(self, params):
+        """The GROUP BY over employee_activity the summary used before the rollups"""
+        queryset = EmployeeActivity.objects.filter(timestamp__date__gte=params['start_date'])
+        if 'hour' in params:
+            queryset = queryset.filter(timestamp__hour=params['hour'])
+        if 'employee' in params:
+            queryset = queryset.filter(emp_id=params['employee'])
+        return (
+            sorted(queryset.annotate(date=TruncDate('timestamp')).values_list('date', 'activity').annotate(
+                count=Count('id')
+            )),
+            sorted(queryset.annotate(hour=TruncHour('timestamp')).values_list('hour', 'activity').annotate(
+                count=Count('id')
+            )),
+        )
+
+    def test_summary_matches_raw_aggregate(self):
+        self.record_history()
+        for params in (
+            {'start_date': str(self.first_day)},
+            {'start_date': str(self.first_day), 'hour': '13'},
+            {'start_date': str(self.first_day), 'hour': '9', 'employee': 'RU000'},
+            {'start_date': str(self.today - timedelta(days=1)), 'employee': 'RU001'},
+        ):
+            with self.subTest(**params):
+                expected = self.raw_summary(params)
+                self.assertTrue(expected[0])
+                self.assertEqual(self.summary(params), expected)
+
+
+class DateRangeFilterIndexTests(UnmanagedTablesTestCase):
+    """The list filters must reach an index, never a full scan of the table"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = Employee.objects.create_user(
+            employee_id='IX000', username='index-staff', email='index-staff@example.com', password='x', is_staff=True
+        )
+        employees = [cls.staff] + Employee.objects.bulk_create([
+            Employee(employee_id=f'IX{index:03d}', username=f'index-{index}', email=f'index-{index}@example.com')
+            for index in range(1, 20)
+        ])
+        # Enough employees and days for ANALYZE to see the filters as selective
+        now = timezone.now()
+        EmployeeActivity.objects.bulk_create([
+            EmployeeActivity(emp=employee, activity='check-in', timestamp=now - timedelta(hours=index))
+            for employee in employees for index in range(200)
+        ])
+        WorkedHours.objects.bulk_create([
+            WorkedHours(emp=employee, work_date=timezone.localdate(now) - timedelta(days=index), worked_minutes=60)
+            for employee in employees for index in range(100)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def get_queryset(self, viewset, params):
+        request = Request(APIRequestFactory().get('/', params))
+        request.user = self.staff
+        return viewset(request=request, format_kwarg=None).get_queryset()
+
+    def assertUsesIndex(self, queryset, table):
+        plan = queryset.explain()
+        if connection.vendor == 'mysql':
+            # id, select_type, table, partitions, type, ...
+            access = [line.split()[4] for line in plan.splitlines() if line.split()[2:3] == [table]]
+            self.assertNotIn('ALL', access, plan)
+        else:
+            self.assertRegex(plan, rf'SEARCH {table} USING (COVERING )?INDEX', plan)
+
+    def filter_combinations(self, params):
+        for size in range(1, len(params) + 1):
+            for names in combinations(params, size):
+                yield {name: params[name] for name in names}
+
+    def test_attendance_log_filters_use_an_index(self):
+        today = timezone.localdate()
+        params = {
+            'start_date': str(today - timedelta(days=3)),
+            'end_date': str(today),
+            'employee': 'IX000',
+            'hour': '9',
+        }
+        for combination in self.filter_combinations(params):
+            for extra in ({}, {'activity': 'check-in'}):
+                with self.subTest(**combination, **extra):
+                    queryset = self.get_queryset(AttendanceLogsViewSet, {**combination, **extra})
+                    self.assertUsesIndex(queryset, 'employee_activity')
+
+    def test_worked_hours_filters_use_an_index(self):
+        today = timezone.localdate()
+        params = {
+            'start_date': str(today - timedelta(days=30)),
+            'end_date': str(today),
+            'employee': 'IX000',
+        }
+        for combination in self.filter_combinations(params):
+            with self.subTest(**combination):
+                self.assertUsesIndex(self.get_queryset(WorkedHoursViewSet, combination), 'worked_hours')
+
+    def test_malformed_dates_are_rejected(self):
+        response = self.get_logs_response({'start_date': '2024-13-45'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('start_date', response.data)
+
+    def get_logs_response(self, params):
+        request = APIRequestFactory().get('/attendance-logs/', params)
+        force_authenticate(request, user=self.staff)
+        return AttendanceLogsViewSet.as_view({'get': 'list'})(request)
+
+
+class KeysetPaginationTests(UnmanagedTablesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = Employee.objects.create_user(
+            employee_id='KP000', username='keyset-staff', email='keyset-staff@example.com', password='x', is_staff=True
+        )
+        # Runs of equal timestamps, so pages have to split ties on id
+        start = timezone.now().replace(microsecond=0) - timedelta(days=1)
+        EmployeeActivity.objects.bulk_create([
+            EmployeeActivity(emp=cls.staff, activity='check-in', timestamp=start + timedelta(minutes=index // 4))
+            for index in range(23)
+        ])
+        cls.expected = list(EmployeeActivity.objects.order_by('-timestamp', '-id').values_list('id', flat=True))
+
+    def get_logs(self, params):
+        request = APIRequestFactory().get('/attendance-logs/', params)
+        force_authenticate(request, user=self.staff)
+        return AttendanceLogsViewSet.as_view({'get': 'list'})(request)
+
+    def follow(self, link):
+        return self.get_logs(dict(parse_qsl(urlsplit(link).query)))
+
+    def ids(self, response):
+        return [row['id'] for row in response.data['results']]
+
+    def test_pages_forward_and_back_over_tied_timestamps(self):
+        response = self.get_logs({'page_size': 5})
+        self.assertIsNone(response.data['previous'])
+        pages = [self.ids(response)]
+        while response.data['next']:
+            response = self.follow(response.data['next'])
+            self.assertEqual(response.status_code, 200)
+            pages.append(self.ids(response))
+        self.assertEqual([row for page in pages for row in page], self.expected)
+        self.assertEqual([len(page) for page in pages], [5, 5, 5, 5, 3])
+
+        # Back from the last page through the previous links
+        for page in reversed(pages[:-1]):
+            response = self.follow(response.data['previous'])
+            self.assertEqual(self.ids(response), page)
+        self.assertIsNone(response.data['previous'])
+        self.assertIsNotNone(response.data['next'])
+
+    def test_cursor_carries_position_and_filter_digest(self):
+        response = self.get_logs({'page_size': 5, 'activity': 'check-in'})
+        cursor = dict(parse_qsl(urlsplit(response.data['next']).query))['cursor']
+        decoded = signing.loads(cursor, salt=ActivityLogPagination.salt)
+        last = EmployeeActivity.objects.get(id=self.expected[4])
+        self.assertEqual(decoded['p'], [EmployeeActivity._meta.get_field('timestamp').value_to_string(last), str(last.id)])
+        self.assertEqual(decoded['r'], 0)
+
+    def test_cursor_with_other_filters_is_rejected(self):
+        response = self.get_logs({'page_size': 5, 'activity': 'check-in'})
+        params = dict(parse_qsl(urlsplit(response.data['next']).query))
+        self.assertEqual(self.follow(response.data['next']).status_code, 200)
+        self.assertEqual(self.get_logs({**params, 'activity': 'check-out'}).status_code, 404)
+        self.assertEqual(self.get_logs({**params, 'cursor': params['cursor'][:-2]}).status_code, 404)
+
+
+class StreamingExportTests(UnmanagedTablesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = Employee.objects.create_user(
+            employee_id='EX000', username='export-staff', email='export-staff@example.com', password='x', is_staff=True
+        )
+        # More than two keyset chunks, with runs of equal timestamps across the chunk boundaries
+        start = timezone.now().replace(microsecond=0) - timedelta(days=1)
+        EmployeeActivity.objects.bulk_create([
+            EmployeeActivity(emp=cls.staff, activity='check-in', timestamp=start + timedelta(seconds=index // 3))
+            for index in range(2 * exports.CHUNK_SIZE + 7)
+        ])
+        cls.expected = list(EmployeeActivity.objects.order_by('timestamp', 'id').values_list('id', flat=True))
+
+    def export(self, export_format, gzip_encoding):
+        headers = {'HTTP_ACCEPT_ENCODING': 'gzip'} if gzip_encoding else {}
+        request = APIRequestFactory().get('/attendance-logs/export/', {'export_format': export_format}, **headers)
+        force_authenticate(request, user=self.staff)
+        response = AttendanceLogsViewSet.as_view({'get': 'export'})(request)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response.has_header('Content-Encoding'), gzip_encoding)
+        content = b''.join(response.streaming_content)
+        return (gzip.decompress(content) if gzip_encoding else content).decode()
+
+    def test_csv_and_ndjson_stream_every_row_once(self):
+        for export_format in ('csv', 'ndjson'):
+            for gzip_encoding in (False, True):
+                with self.subTest(export_format=export_format, gzip=gzip_encoding):
+                    content = self.export(export_format, gzip_encoding)
+                    if export_format == 'csv':
+                        header, *rows = csv.reader(StringIO(content))
+                        self.assertEqual(header, list(exports.ACTIVITY.header))
+                        ids = [int(row[1]) for row in rows]
+                    else:
+                        rows = [json.loads(line) for line in content.splitlines()]
+                        self.assertEqual(list(rows[0]), list(exports.ACTIVITY.header))
+                        ids = [row['id'] for row in rows]
+                    self.assertEqual(len(ids), 2 * exports.CHUNK_SIZE + 7)
+                    self.assertEqual(ids, self.expected)
+
+
+@skipUnless(columnar.available(), 'pyarrow is not installed')
+class ColumnarExportTests(UnmanagedTablesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.employee = Employee.objects.create_user(
+            employee_id='CX000', username='columnar', email='columnar@example.com'
+        )
+        cls.days = [timezone.localdate() - timedelta(days=2), timezone.localdate() - timedelta(days=1)]
+        EmployeeActivity.objects.bulk_create([
+            EmployeeActivity(
+                emp=cls.employee, activity=('check-in', 'check-out')[index % 2],
+                timestamp=day_start(day) + timedelta(hours=8, minutes=index, microseconds=index)
+            )
+            for day in cls.days for index in range(5)
+        ])
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.output = directory.name
+
+    def export(self, *args):
+        output = StringIO()
+        call_command('export_columnar', self.output, '--table', 'employee_activity', *args, stdout=output)
+        return output.getvalue()
+
+    def partition(self, day):
+        path = os.path.join(self.output, 'employee_activity', f'date={day}', 'part-0.parquet')
+        return columnar.parquet().read_table(path)
+
+    def manifest(self):
+        with open(os.path.join(self.output, 'employee_activity', '_manifest.json')) as f:
+            return json.load(f)
+
+    def test_partitions_round_trip(self):
+        self.export('--chunk-size', '2')
+        pa = columnar.arrow()
+        manifest = self.manifest()
+        for day in self.days:
+            with self.subTest(day=day):
+                table = self.partition(day)
+                self.assertEqual(table.schema.field('timestamp').type, pa.timestamp('us', tz='UTC'))
+                self.assertEqual(table.num_rows, 5)
+                expected = list(EmployeeActivity.objects.filter(
+                    timestamp__gte=day_start(day), timestamp__lt=day_start(day + timedelta(days=1))
+                ).order_by('timestamp', 'id').values_list('timestamp', 'id', 'emp_id', 'activity'))
+                rows = table.to_pydict()
+                self.assertEqual(list(zip(rows['timestamp'], rows['id'], rows['employee_id'], rows['activity'])), expected)
+                self.assertEqual(manifest[str(day)], [len(rows['id']), max(rows['id']), sum(rows['id'])])
+
+    def test_incremental_run_rewrites_changed_partitions_only(self):
+        self.export('--incremental')
+        self.assertIn('wrote 0 partitions (0 rows), kept 2 unchanged', self.export('--incremental'))
+
+        EmployeeActivity.objects.create(emp=self.employee, activity='check-in', timestamp=day_start(self.days[1]))
+        EmployeeActivity.objects.filter(timestamp__lt=day_start(self.days[1])).delete()
+        output = self.export('--incremental')
+        self.assertIn('wrote 1 partitions (6 rows), kept 0 unchanged, removed 1', output)
+        self.assertEqual(self.partition(self.days[1]).num_rows, 6)
+        self.assertEqual(list(self.manifest()), [str(self.days[1])])
+        self.assertFalse(os.path.exists(os.path.join(self.output, 'employee_activity', f'date={self.days[0]}')))
+
+
+class PrincipalCacheTests(UnmanagedTablesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = Employee.objects.create_user(
+            employee_id='PC000', username='principal-staff', email='principal-staff@example.com',
+            password='x', is_staff=True
+        )
+        token = CustomRefreshToken()
+        now = timezone.now()
+        token.payload = {
+            'token_type': 'refresh', 'exp': (now + timedelta(days=1)).timestamp(), 'iat': now.timestamp(),
+            'jti': 'principal-cache-test', 'employee_id': 'PC000', 'type': 'access',
+        }
+        cls.raw_token = str(token)
+
+    def setUp(self):
+        cache.clear()
+        revocation.revoked_tokens.clear()
+
+    def authenticate(self):
+        request = APIRequestFactory().get('/worked-hours/', HTTP_AUTHORIZATION=f'Bearer {self.raw_token}')
+        user, _ = RevocableJWTAuthentication().authenticate(Request(request))
+        request.user = user
+        return request
+
+    def employee_queries(self, queries):
+        return [query['sql'] for query in queries if '"employee"' in query['sql']]
+
+    def test_permission_checks_do_not_read_the_employee_table(self):
+        self.authenticate()
+        with CaptureQueriesContext(connection) as queries:
+            request = self.authenticate()
+            self.assertTrue(IsSuperuserOrStaff().has_permission(request, None))
+            self.assertEqual(request.user.employee_id, 'PC000')
+        self.assertEqual(self.employee_queries(queries.captured_queries), [])
+
+        # Other fields are deferred, not missing
+        self.assertEqual(request.user.email, 'principal-staff@example.com')
+
+    def test_saving_the_employee_invalidates_the_principal(self):
+        self.assertTrue(IsSuperuserOrStaff().has_permission(self.authenticate(), None))
+        self.staff.is_staff = False
+        self.staff.save()
+        self.assertFalse(IsSuperuserOrStaff().has_permission(self.authenticate(), None))
+
+
+class RevocationTests(TokenTablesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.employee = Employee.objects.create_user(
+            employee_id='RV000', username='revocation', email='revocation@example.com', password='x'
+        )
+
+    def setUp(self):
+        cache.clear()
+        revocation.revoked_tokens.clear()
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get('/worked-hours/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return RevocableJWTAuthentication().authenticate(Request(request))
+
+    def test_blacklisted_token_is_rejected(self):
+        token = CustomRefreshToken.for_user(self.employee)
+        access = token.access_token
+        user, _ = self.authenticate(access)
+        self.assertEqual(user.employee_id, 'RV000')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            access.blacklist()
+        with self.assertRaises(InvalidToken):
+            self.authenticate(access)
+
+        # Also after a reload from the blacklist table
+        revocation.revoked_tokens.clear()
+        with self.assertRaises(InvalidToken):
+            self.authenticate(access)
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = revocation.BloomFilter(1000, 0.01)
+        added = [f'jti-{index}' for index in range(1000)]
+        for jti in added:
+            bloom.add(jti)
+        self.assertTrue(all(jti in bloom for jti in added))
+        false_positives = sum(f'other-{index}' in bloom for index in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_revocation_past_capacity_rebuilds_the_filter(self):
+        revoked = revocation.RevocationList()
+        with override_settings(TOKEN_REVOCATION_BLOOM_CAPACITY=4):
+            revoked.refresh()
+            for index in range(20):
+                revoked.add(f'jti-{index}')
+        self.assertTrue(all(revoked._contains(f'jti-{index}') for index in range(20)))
+        self.assertFalse(revoked._contains('jti-20'))
+
+    @override_settings(TOKEN_REVOCATION_REFRESH_SECONDS=60)
+    def test_other_workers_revocations_are_read_after_the_refresh_interval(self):
+        revoked = revocation.RevocationList()
+        token = CustomRefreshToken.for_user(self.employee)
+        self.assertFalse(revoked.is_revoked(token['jti']))
+
+        # Blacklisted by another worker: no local add()
+        BlacklistedTokenModel.objects.create(token=OutstandingTokenModel.objects.get(jti=token['jti']))
+        with self.assertNumQueries(0):
+            self.assertFalse(revoked.is_revoked(token['jti']))
+
+        revoked._checked_at -= 60
+        with self.assertNumQueries(2):
+            self.assertTrue(revoked.is_revoked(token['jti']))
+
+
+@override_settings(PASSWORD_PBKDF2_ITERATIONS=1000)
+class LoginPasswordTests(TokenTablesTestCase):
+    password = 'correct horse battery staple'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.employee = Employee.objects.create_user(
+            employee_id='LP000', username='login-password', email='login-password@example.com'
+        )
+
+    def setUp(self):
+        password_pool.pool.counters.clear()
+
+    def set_hash(self, iterations):
+        hasher = ConfiguredPBKDF2PasswordHasher()
+        Employee.objects.filter(pk=self.employee.pk).update(
+            password=hasher.encode(self.password, hasher.salt(), iterations=iterations)
+        )
+
+    def login(self, password):
+        request = APIRequestFactory().post('/login/', {'login': 'LP000', 'password': password}, format='json')
+        return login(request)
+
+    def stored_iterations(self):
+        return Employee.objects.get(pk=self.employee.pk).password.split('$')[1]
+
+    def test_hasher_uses_configured_iterations(self):
+        self.assertTrue(make_password(self.password).startswith('pbkdf2_sha256$1000$'))
+        with override_settings(PASSWORD_PBKDF2_ITERATIONS=2000):
+            self.assertTrue(make_password(self.password).startswith('pbkdf2_sha256$2000$'))
+
+    def test_login_upgrades_a_hash_with_fewer_iterations(self):
+        self.set_hash(500)
+        self.assertEqual(self.login(self.password).status_code, 200)
+        self.assertEqual(self.stored_iterations(), '1000')
+
+        self.assertEqual(self.login('wrong password').status_code, 401)
+        self.assertEqual(self.stored_iterations(), '1000')
+
+    @override_settings(LOGIN_PASSWORD_POOL_WORKERS=1, LOGIN_PASSWORD_POOL_MAX_PENDING=2)
+    def test_saturated_pool_answers_503(self):
+        self.set_hash(1000)
+        password_pool.pool._pending = 2
+        try:
+            response = self.login(self.password)
+        finally:
+            password_pool.pool._pending = 0
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(password_pool.pool.stats()['rejected'], 1)
+
+    @override_settings(LOGIN_PASSWORD_POOL_WORKERS=1)
+    def test_wrong_password_fails_through_the_pool(self):
+        # Verified in a spawned worker, which reads the settings module: a
+        # low stored iteration count keeps the check fast there too
+        self.set_hash(1000)
+        self.addCleanup(password_pool.pool.close)
+        self.assertEqual(self.login('wrong password').status_code, 401)
+        self.assertEqual(password_pool.pool.stats()['verified'], 1)
+        self.assertEqual(self.stored_iterations(), '1000')
+
+
+@override_settings(PASSWORD_PBKDF2_ITERATIONS=1000)
+class TokenIssueTests(TokenTablesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.employee = Employee.objects.create_user(
+            employee_id='TI000', username='token-issue', email='token-issue@example.com', password='secret'
+        )
+
+    def setUp(self):
+        cache.clear()
+        revocation.revoked_tokens.clear()
+
+    def login(self):
+        request = APIRequestFactory().post('/login/', {'login': 'TI000', 'password': 'secret'}, format='json')
+        response = login(request)
+        self.assertEqual(response.status_code, 200)
+        return response.data['tokens']
+
+    def stored(self):
+        return dict(OutstandingTokenModel.objects.filter(user_id='TI000').values_list('jti', 'token'))
+
+    def test_for_user_writes_both_rows_in_one_insert(self):
+        with self.assertNumQueries(1):
+            token = CustomRefreshToken.for_user(self.employee)
+        self.assertEqual(self.stored(), {
+            token['jti']: str(token), token.access_token['jti']: str(token.access_token),
+        })
+
+    def test_login_inserts_both_outstanding_rows_at_once(self):
+        table = connection.ops.quote_name(OutstandingTokenModel._meta.db_table)
+        with CaptureQueriesContext(connection) as queries:
+            tokens = self.login()
+        inserts = [query for query in queries.captured_queries if query['sql'].startswith(f'INSERT INTO {table}')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(len(self.stored()), 2)
+        self.assertIn(tokens['refresh'], self.stored().values())
+
+    @override_settings(OUTSTANDING_TOKEN_STORAGE='hash')
+    def test_logout_with_hashed_tokens(self):
+        tokens = self.login()
+        self.assertEqual(
+            sorted(self.stored().values()),
+            sorted(f'sha256:{hashlib.sha256(tokens[name].encode()).hexdigest()}' for name in ('access', 'refresh'))
+        )
+
+        def post_logout():
+            request = APIRequestFactory().post(
+                '/logout/', {'refresh_token': tokens['refresh']}, format='json',
+                HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}'
+            )
+            return logout(request)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = post_logout()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(BlacklistedTokenModel.objects.filter(token__user_id='TI000').count(), 2)
+        # The access token of the logout request is revoked with the refresh token
+        self.assertEqual(post_logout().status_code, 401)
+
+
+class PruneOutstandingTokensTests(TokenTablesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.employee = Employee.objects.create_user(
+            employee_id='PO000', username='prune-tokens', email='prune-tokens@example.com', password='x'
+        )
+
+    def setUp(self):
+        cache.clear()
+        revocation.revoked_tokens.clear()
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get('/worked-hours/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return RevocableJWTAuthentication().authenticate(Request(request))
+
+    def test_pruned_blacklisted_token_stays_revoked(self):
+        token = CustomRefreshToken.for_user(self.employee)
+        access = token.access_token
+        access.blacklist()
+
+        call_command('prune_outstanding_tokens', '--chunk-size', '1', stdout=StringIO())
+        self.assertFalse(OutstandingTokenModel.objects.filter(jti=access['jti']).exists())
+        self.assertFalse(BlacklistedTokenModel.objects.exists())
+        self.assertTrue(RevokedToken.objects.filter(jti=access['jti']).exists())
+        # The refresh token was neither expired nor blacklisted
+        self.assertTrue(OutstandingTokenModel.objects.filter(jti=token['jti']).exists())
+
+        revocation.revoked_tokens.clear()
+        with self.assertRaises(InvalidToken):
+            self.authenticate(access)
+
+    def test_expired_tokens_are_pruned_without_a_revoked_row(self):
+        token = CustomRefreshToken.for_user(self.employee)
+        OutstandingTokenModel.objects.filter(jti=token['jti']).update(expires_at=timezone.now() - timedelta(days=1))
+        call_command('prune_outstanding_tokens', stdout=StringIO())
+        self.assertFalse(OutstandingTokenModel.objects.filter(jti=token['jti']).exists())
+        self.assertFalse(RevokedToken.objects.exists())
+
+
+@override_settings(AUTO_ATTEND_MIN_DWELL_SECONDS=0, ATTENDANCE_MISSING_CHECKOUT_HOURS=2)
+def office(office_id, latitude, longitude, radius_meters):
+    return OfficeLocation(
+        id=office_id, latitude=Decimal(f'{latitude:.6f}'), longitude=Decimal(f'{longitude:.6f}'),
+        radius_meters=radius_meters
+    )
+
+
+class GeofenceIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.rng = random.Random(20261018)
+        # One large campus spanning several cells, small sites around and inside
+        # it, and a site on the antimeridian
+        self.offices = [
+            office(1, 12.0, 77.0, 5000),
+            office(2, 12.03, 77.02, 150),
+            office(3, 60.0, 10.0, 300),
+            office(4, 0.0, 179.99, 3000),
+        ]
+        for office_id in range(5, 60):
+            self.offices.append(office(
+                office_id, 12 + self.rng.uniform(-0.1, 0.1), 77 + self.rng.uniform(-0.1, 0.1),
+                self.rng.randint(50, 800)
+            ))
+        self.index = geofence.GeofenceIndex(self.offices)
+
+    def assertMatchesLinearScan(self, points):
+        inside = 0
+        for latitude, longitude in points:
+            with self.subTest(latitude=latitude, longitude=longitude):
+                match = self.index.locate(latitude, longitude)
+                expected = self.index.locate_linear(latitude, longitude)
+                self.assertEqual((match.office.id, match.inside), (expected.office.id, expected.inside))
+                self.assertAlmostEqual(match.distance, expected.distance, delta=0.01)
+                inside += match.inside
+        # Both outcomes are exercised
+        self.assertTrue(0 < inside < len(points))
+
+    def test_random_points_match_linear_scan(self):
+        self.assertMatchesLinearScan([
+            (12 + self.rng.uniform(-0.15, 0.15), 77 + self.rng.uniform(-0.15, 0.15)) for _ in range(2000)
+        ])
+
+    def test_points_on_cell_edges_match_linear_scan(self):
+        lat_cell, lon_cell = self.index._cell(12.0), self.index._lon_cell(77.0)
+        points = []
+        for lat_offset in range(-3, 4):
+            for lon_offset in range(-3, 4):
+                latitude = (lat_cell + lat_offset) * self.index.cell_degrees
+                longitude = (lon_cell + lon_offset) * self.index.lon_cell_degrees - 180
+                for nudge in (-1e-7, 0, 1e-7):
+                    points.append((latitude + nudge, longitude + nudge))
+                    points.append((latitude + nudge, longitude - nudge))
+        self.assertMatchesLinearScan(points)
+
+    def test_site_radius_spans_cells(self):
+        campus = self.offices[0]
+        points = []
+        # Just inside and just outside the campus edge, all around it
+        for bearing in range(0, 360, 5):
+            for meters in (4990, 5010):
+                latitude = 12.0 + meters * math.cos(math.radians(bearing)) / geofence.METERS_PER_DEGREE
+                longitude = 77.0 + meters * math.sin(math.radians(bearing)) / (
+                    geofence.METERS_PER_DEGREE * math.cos(math.radians(12.0))
+                )
+                points.append((latitude, longitude))
+        cells = {(self.index._cell(latitude), self.index._lon_cell(longitude)) for latitude, longitude in points}
+        self.assertGreater(len(cells), 4)
+        self.assertMatchesLinearScan(points)
+        self.assertEqual(self.index.locate(12.0, 77.044).office, campus)
+
+    def test_sites_across_the_antimeridian(self):
+        self.assertMatchesLinearScan([
+            (self.rng.uniform(-0.03, 0.03), self.rng.choice([-1, 1]) * self.rng.uniform(179.96, 180))
+            for _ in range(500)
+        ])
+        match = self.index.locate(0.0, -179.99)
+        self.assertEqual((match.office.id, match.inside), (4, True))
+
+    def test_no_sites(self):
+        self.assertIsNone(geofence.GeofenceIndex([]).locate(12.0, 77.0))
+
+
+class GeofenceInvalidationTests(UnmanagedTablesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.office = OfficeLocation.objects.create(latitude='12.000000', longitude='77.000000', radius_meters=200)
+
+    def setUp(self):
+        cache.clear()
+        geofence.geofence_cache.clear()
+        self.addCleanup(geofence.geofence_cache.clear)
+
+    def test_save_invalidates_after_commit(self):
+        self.assertFalse(geofence.locate(12.0, 77.003).inside)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.office.radius_meters = 500
+            self.office.save()
+            # Not before the transaction commits
+            self.assertFalse(geofence.locate(12.0, 77.003).inside)
+        self.assertEqual(len(callbacks), 1)
+        self.assertTrue(geofence.locate(12.0, 77.003).inside)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            OfficeLocation.objects.create(latitude='13.000000', longitude='78.000000', radius_meters=200)
+        self.assertTrue(geofence.locate(13.0, 78.0).inside)
+
+    def test_delete_invalidates_after_commit(self):
+        self.assertTrue(geofence.locate(12.0, 77.0).inside)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.office.delete()
+            self.assertTrue(geofence.locate(12.0, 77.0).inside)
+        self.assertIsNone(geofence.locate(12.0, 77.0))
+
+    def test_invalidation_bumps_the_shared_version(self):
+        geofence.locate(12.0, 77.0)
+        version = cache.get(geofence.VERSION_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.office.save()
+        self.assertNotEqual(cache.get(geofence.VERSION_KEY), version)
+
+
+class AutoAttendStaleSessionTests(UnmanagedTablesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.employee = Employee.objects.create_user(
+            employee_id='AA000', username='auto-attend', email='auto-attend@example.com', password='x'
+        )
+        OfficeLocation.objects.create(latitude='12.000000', longitude='77.000000', radius_meters=200)
+
+    def setUp(self):
+        geofence.geofence_cache.clear()
+        ping_tracker.tracker.forget('AA000')
+
+    def ping(self, latitude, longitude):
+        request = APIRequestFactory().post(
+            '/auto-attend/', {'latitude': latitude, 'longitude': longitude}, format='json'
+        )
+        force_authenticate(request, user=self.employee)
+        return auto_attend(request)
+
+    def test_outside_ping_closes_session_from_yesterday(self):
+        yesterday = timezone.localdate() - timedelta(days=1)
+        checked_in = day_start(yesterday) + timedelta(hours=9)
+        record_attendance('AA000', 'check-in', at=checked_in)
+
+        response = self.ping(12.1, 77.0)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['message'], 'Previous session closed')
+        self.assertEqual(EmployeePresence.objects.get(employee_id='AA000').state, 'check-out')
+        check_out = EmployeeActivity.objects.filter(emp_id='AA000', activity='check-out').get()
+        self.assertEqual(check_out.timestamp, checked_in + timedelta(hours=2))
+        self.assertEqual(WorkedHours.objects.get(emp_id='AA000', work_date=yesterday).worked_minutes, 120)
+
+        # The employee is now checked out, so further outside pings are absorbed
+        with self.assertNumQueries(0):
+            response = self.ping(12.1, 77.0)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(EmployeeActivity.objects.filter(emp_id='AA000').count(), 2)
+
+
+@override_settings(
+    AUTO_ATTEND_HYSTERESIS_METERS=25, AUTO_ATTEND_MIN_DWELL_SECONDS=30, AUTO_ATTEND_STATE_TTL_SECONDS=60
+)
+class PingTrackerTests(UnmanagedTablesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.employee = Employee.objects.create_user(
+            employee_id='PT000', username='ping-tracker', email='ping-tracker@example.com', password='x'
+        )
+        cls.office = OfficeLocation.objects.create(latitude='12.000000', longitude='77.000000', radius_meters=200)
+
+    def setUp(self):
+        geofence.geofence_cache.clear()
+        ping_tracker.tracker.forget('PT000')
+
+    def match(self, distance):
+        return geofence.GeofenceMatch(self.office, distance, distance <= self.office.radius_meters)
+
+    def ping(self, distance):
+        """auto_attend ping ``distance`` meters north of the office"""
+        latitude = 12 + math.degrees(distance / geofence.EARTH_RADIUS)
+        request = APIRequestFactory().post('/auto-attend/', {'latitude': latitude, 'longitude': 77}, format='json')
+        force_authenticate(request, user=self.employee)
+        return auto_attend(request)
+
+    def test_band_edges(self):
+        target = ping_tracker.PingTracker.target_state
+        self.assertEqual(target(self.match(175)), 'check-in')
+        self.assertIsNone(target(self.match(175.01)))
+        self.assertIsNone(target(self.match(225)))
+        self.assertEqual(target(self.match(225.01)), 'check-out')
+
+    def test_escalates_at_the_dwell_limit(self):
+        tracker = ping_tracker.PingTracker()
+        decision = tracker.decide('PT000', self.match(100), now=1000)
+        self.assertIsNone(decision.action)
+        self.assertEqual((decision.pending, decision.dwell_remaining), ('check-in', 30))
+        self.assertIsNone(tracker.decide('PT000', self.match(175), now=1029.9).action)
+        self.assertEqual(tracker.decide('PT000', self.match(175), now=1030).action, 'check-in')
+
+    def test_band_ping_restarts_the_dwell(self):
+        tracker = ping_tracker.PingTracker()
+        tracker.decide('PT000', self.match(100), now=1000)
+        self.assertIsNone(tracker.decide('PT000', self.match(200), now=1020).pending)
+        tracker.decide('PT000', self.match(100), now=1025)
+        self.assertIsNone(tracker.decide('PT000', self.match(100), now=1054).action)
+        self.assertEqual(tracker.decide('PT000', self.match(100), now=1055).action, 'check-in')
+
+    def test_boundary_flapping_does_not_touch_the_database(self):
+        record_attendance('PT000', 'check-in')
+        self.assertEqual(self.ping(0).data['message'], 'Already checked in')
+
+        with self.assertNumQueries(0):
+            for distance in (180, 220, 190, 225, 240, 210, 170, 230):
+                self.assertEqual(self.ping(distance).status_code, 200)
+        self.assertEqual(EmployeeActivity.objects.filter(emp_id='PT000').count(), 1)
+        self.assertEqual(EmployeePresence.objects.get(employee_id='PT000').state, 'check-in')
+
+
+class RebuildWorkedHoursTests(UnmanagedTablesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for index in range(3):
+            Employee.objects.create_user(
+                employee_id=f'RW00{index}', username=f'rebuild-{index}', email=f'rebuild-{index}@example.com'
+            )
+        cls.day = timezone.localdate() - timedelta(days=3)
+
+    def at(self, days, hour, minute=0):
+        return day_start(self.day + timedelta(days=days)) + timedelta(hours=hour, minutes=minute)
+
+    def history(self):
+        return [
+            ('RW000', 'check-in', self.at(0, 9)),
+            ('RW000', 'check-out', self.at(0, 12)),
+            ('RW000', 'check-in', self.at(0, 13)),
+            ('RW000', 'check-out', self.at(0, 14, 30)),
+            ('RW000', 'check-out', self.at(0, 15)),      # No open session
+            ('RW000', 'check-in', self.at(1, 22)),
+            ('RW000', 'check-out', self.at(2, 1)),       # Session from the day before
+            ('RW001', 'check-in', self.at(1, 8)),
+            ('RW001', 'check-in', self.at(1, 9)),        # Re-opens the session
+            ('RW001', 'check-out', self.at(1, 10, 15)),
+            ('RW001', 'check-in', self.at(2, 9)),        # Still open
+        ]
+
+    def test_history_folds_into_daily_totals(self):
+        self.assertEqual(list(sessions(self.history())), [
+            ('RW000', self.day, 180), ('RW000', self.day, 90), ('RW001', self.day + timedelta(days=1), 75),
+        ])
+        self.assertEqual(list(daily_totals(sessions(self.history()))), [
+            ('RW000', self.day, 270), ('RW001', self.day + timedelta(days=1), 75),
+        ])
+
+    def worked(self):
+        return sorted(WorkedHours.objects.values_list('emp_id', 'work_date', 'worked_minutes'))
+
+    def test_dry_run_reports_the_diff_and_rebuild_applies_it(self):
+        EmployeeActivity.objects.bulk_create([
+            EmployeeActivity(emp_id=emp_id, activity=activity, timestamp=timestamp)
+            for emp_id, activity, timestamp in self.history()
+        ])
+        WorkedHours.objects.bulk_create([
+            WorkedHours(emp_id='RW000', work_date=self.day, worked_minutes=200),
+            WorkedHours(emp_id='RW000', work_date=self.day, worked_minutes=70),
+            WorkedHours(emp_id='RW002', work_date=self.day, worked_minutes=30),
+        ])
+        before = self.worked()
+
+        output = StringIO()
+        call_command('rebuild_worked_hours', '--dry-run', '--verbosity', '2', stdout=output)
+        self.assertEqual(self.worked(), before)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(sorted(lines[:-1]), sorted([
+            f'~ RW000 {self.day} 200 -> 270',
+            f'- RW000 {self.day} 70',
+            f'+ RW001 {self.day + timedelta(days=1)} 75',
+            f'- RW002 {self.day} 30',
+        ]))
+        self.assertIn('Would change worked_hours: 1 created, 1 updated, 2 deleted', lines[-1])
+
+        with CaptureQueriesContext(connection) as queries:
+            call_command('rebuild_worked_hours', '--batch-size', '2', stdout=StringIO())
+        self.assertEqual(self.worked(), [('RW000', self.day, 270), ('RW001', self.day + timedelta(days=1), 75)])
+
+        # Each employee batch locks its presence rows before reading the history
+        tables = [
+            table for query in queries.captured_queries
+            for table in ('employee_presence', 'employee_activity') if connection.ops.quote_name(table) in query['sql']
+        ]
+        self.assertEqual(tables[:2], ['employee_presence', 'employee_activity'])
+        self.assertEqual(tables.count('employee_presence'), 2)
+
+        output = StringIO()
+        call_command('rebuild_worked_hours', stdout=output)
+        self.assertIn('0 created, 0 updated, 0 deleted', output.getvalue())
+
+
+class ConvertWorkedHoursTests(UnmanagedTablesTestCase):
+    @classmethod
+    def setUpSchema(cls, editor):
+        # The legacy HH.MM column that queries.write keeps until the conversion has run
+        editor.execute('ALTER TABLE worked_hours ADD COLUMN worked_hours DECIMAL(5,2) NULL')
+
+    @classmethod
+    def setUpTestData(cls):
+        Employee.objects.create_user(
+            employee_id='CW000', username='convert-hours', email='convert-hours@example.com', password='x'
+        )
+
+    def legacy_row(self, days_ago, worked_hours, worked_minutes):
+        row = WorkedHours.objects.create(
+            emp_id='CW000', work_date=timezone.localdate() - timedelta(days=days_ago), worked_minutes=worked_minutes
+        )
+        if worked_hours is not None:
+            with connection.cursor() as cursor:
+                cursor.execute('UPDATE worked_hours SET worked_hours = %s WHERE id = %s', [worked_hours, row.id])
+        return row.id
+
+    def rows(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT id, worked_minutes, worked_hours FROM worked_hours ORDER BY id')
+            return cursor.fetchall()
+
+    def test_legacy_to_minutes(self):
+        self.assertEqual(legacy_to_minutes(Decimal('8.30')), 510)
+        self.assertEqual(legacy_to_minutes(Decimal('0.59')), 59)
+        self.assertEqual(legacy_to_minutes('7.05'), 425)
+        # Read back as a binary float by some drivers
+        self.assertEqual(legacy_to_minutes(8.29), 509)
+
+    def test_conversion_adds_to_minutes_recorded_since_the_deploy(self):
+        live = self.legacy_row(2, '8.30', 15)  # A check-out incremented it before the conversion
+        legacy = self.legacy_row(3, '1.05', 0)
+        new = self.legacy_row(1, None, 40)
+
+        call_command('convert_worked_hours', '--chunk-size', '1', stdout=StringIO())
+        self.assertEqual(self.rows(), [(live, 525, None), (legacy, 65, None), (new, 40, None)])
+
+        # Converted rows are not picked up again
+        call_command('convert_worked_hours', stdout=StringIO())
+        self.assertEqual(self.rows(), [(live, 525, None), (legacy, 65, None), (new, 40, None)])
+
+
+class PresenceHistoryTests(UnmanagedTablesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.day = timezone.localdate() - timedelta(days=3)
+        cls.next_day = cls.day + timedelta(days=1)
+        history = {
+            # Closed sessions on the day before and earlier that day, then an open one
+            'PH000': [
+                ('check-in', cls.at(cls.day - timedelta(days=1), 9)),
+                ('check-out', cls.at(cls.day - timedelta(days=1), 17)),
+                ('check-in', cls.at(cls.day, 9)),
+                ('check-out', cls.at(cls.day, 12)),
+                ('check-in', cls.at(cls.day, 13)),
+            ],
+            # Two sessions closed on the same day
+            'PH001': [
+                ('check-in', cls.at(cls.day, 8)),
+                ('check-out', cls.at(cls.day, 10, 30)),
+                ('check-in', cls.at(cls.day, 11)),
+                ('check-out', cls.at(cls.day, 11, 45)),
+            ],
+            # A session closed the next day never counts
+            'PH002': [
+                ('check-in', cls.at(cls.day, 8)),
+                ('check-out', cls.at(cls.day, 9)),
+                ('check-in', cls.at(cls.day, 22)),
+                ('check-out', cls.at(cls.next_day, 1)),
+            ],
+        }
+        for employee_id, activities in history.items():
+            Employee.objects.create_user(
+                employee_id=employee_id, username=employee_id.lower(), email=f'{employee_id}@example.com',
+                password='x'
+            )
+            EmployeeActivity.objects.bulk_create([
+                EmployeeActivity(emp_id=employee_id, activity=activity, timestamp=timestamp)
+                for activity, timestamp in activities
+            ])
+        Employee.objects.create_user(
+            employee_id='PH003', username='ph003', email='PH003@example.com', password='x'
+        )
+        cls.expected = {
+            'PH000': ('check-in', cls.at(cls.day, 13), cls.at(cls.day, 13), 180),
+            'PH001': ('check-out', cls.at(cls.day, 11, 45), None, 195),
+            'PH002': ('check-out', cls.at(cls.next_day, 1), None, 0),
+        }
+
+    @staticmethod
+    def at(day, hour, minute=0):
+        return day_start(day) + timedelta(hours=hour, minutes=minute)
+
+    def state(self, presence):
+        # Minutes as of the day of the last activity, the only day they are read for
+        last_day = presence.last_activity_at and timezone.localdate(presence.last_activity_at)
+        return presence.state, presence.last_activity_at, presence.session_started_at, minutes_on(presence, last_day)
+
+    def test_presence_from_history(self):
+        for employee_id, expected in self.expected.items():
+            with self.subTest(employee_id=employee_id):
+                self.assertEqual(self.state(presence_from_history(employee_id)), expected)
+        self.assertEqual(self.state(presence_from_history('PH003')), (None, None, None, 0))
+
+    def test_minutes_today_only_counts_the_work_date(self):
+        presence = presence_from_history('PH001')
+        self.assertEqual(minutes_on(presence, self.day), 195)
+        self.assertEqual(minutes_on(presence, self.next_day), 0)
+        self.assertEqual(minutes_on(presence_from_history('PH002'), self.next_day), 0)
+
+    def test_rebuild_presence_matches_history(self):
+        EmployeePresence.objects.create(employee_id='PH001', state='check-in', minutes_today=999)
+        out = StringIO()
+        call_command('rebuild_presence', '--chunk-size', '2', stdout=out)
+        self.assertIn('Rebuilt presence for 3 employees', out.getvalue())
+        rebuilt = {presence.employee_id: self.state(presence) for presence in EmployeePresence.objects.all()}
+        self.assertEqual(rebuilt, self.expected)
+
+    def test_rebuild_presence_for_one_employee(self):
+        EmployeePresence.objects.create(employee_id='PH000', state='check-out', minutes_today=0)
+        EmployeePresence.objects.create(employee_id='PH001', state='check-in', minutes_today=999)
+        call_command('rebuild_presence', '--employee', 'PH001', stdout=StringIO())
+        self.assertEqual(self.state(EmployeePresence.objects.get(employee_id='PH001')), self.expected['PH001'])
+        self.assertEqual(EmployeePresence.objects.get(employee_id='PH000').state, 'check-out')
+
+
+class CloseOpenSessionsTests(UnmanagedTablesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Employee.objects.create_user(
+            employee_id='CS000', username='close-sessions', email='close-sessions@example.com', password='x'
+        )
+        cls.yesterday = timezone.localdate() - timedelta(days=1)
+        record_attendance('CS000', 'check-in', at=day_start(cls.yesterday) + timedelta(hours=23))
+
+    def close(self):
+        call_command('close_open_sessions', '--policy-hours', '2', stdout=StringIO())
+        activities = list(EmployeeActivity.objects.filter(emp_id='CS000').values_list('activity', 'timestamp'))
+        worked = list(WorkedHours.objects.filter(emp_id='CS000').values_list('work_date', 'worked_minutes'))
+        return activities, worked
+
+    def test_check_out_stays_on_the_session_day(self):
+        activities, worked = self.close()
+        check_out = activities[-1][1]
+        self.assertEqual(activities[-1][0], 'check-out')
+        self.assertEqual(check_out, day_start(self.yesterday) + timedelta(hours=23, minutes=59, seconds=59))
+        self.assertEqual(timezone.localdate(check_out), self.yesterday)
+        self.assertEqual(worked, [(self.yesterday, 59)])
+
+    def test_rerun_is_idempotent(self):
+        self.assertEqual(self.close(), self.close())
+
+
+@override_settings(QR_SIGNED_CODES=True, QR_SIGNING_KEY='qr-test-key', QR_ROTATION_SECONDS=30, QR_ALLOWED_SKEW_WINDOWS=1)
+class QRCodeValidationTests(UnmanagedTablesTestCase):
+    def setUp(self):
+        self.now = 1_700_000_000
+        self.window = qr_codes.time_window(self.now)
+
+    def test_code_signed_for_other_usage_type_is_rejected(self):
+        code = qr_codes.sign_code('check-in', self.window)
+        self.assertTrue(qr_codes.verify_signed_code(code, 'check-in', self.now))
+        self.assertFalse(qr_codes.verify_signed_code(code, 'check-out', self.now))
+        self.assertFalse(qr_codes.is_valid_code(qr_codes.sign_code('check-in'), 'check-out'))
+
+    def test_code_within_skew_window_is_accepted(self):
+        code = qr_codes.sign_code('check-in', self.window - 1)
+        self.assertTrue(qr_codes.verify_signed_code(code, 'check-in', self.now))
+
+    def test_code_outside_skew_window_is_rejected(self):
+        for window in (self.window - 2, self.window + 1):
+            with self.subTest(window=window):
+                code = qr_codes.sign_code('check-in', window)
+                self.assertFalse(qr_codes.verify_signed_code(code, 'check-in', self.now))
+
+    def test_tampered_mac_is_rejected(self):
+        code = qr_codes.sign_code('check-in', self.window)
+        tampered = code[:-1] + ('0' if code[-1] != '0' else '1')
+        self.assertFalse(qr_codes.verify_signed_code(tampered, 'check-in', self.now))
+        self.assertFalse(qr_codes.verify_signed_code(f'S{self.window}', 'check-in', self.now))
+        with override_settings(QR_SIGNING_KEY='another-key'):
+            self.assertFalse(qr_codes.verify_signed_code(code, 'check-in', self.now))
+
+    def test_stored_codes_work_with_signed_codes_off(self):
+        QRDetails.objects.create(unique_number='LEGACY01', usage_type='check-in', is_valid=True)
+        with override_settings(QR_SIGNED_CODES=False):
+            self.assertTrue(qr_codes.is_valid_code('LEGACY01', 'check-in'))
+            self.assertFalse(qr_codes.is_valid_code('LEGACY01', 'check-out'))
+            # Without the feature a signed code is just an unknown stored code
+            self.assertFalse(qr_codes.is_valid_code(qr_codes.sign_code('check-in'), 'check-in'))
+        self.assertTrue(qr_codes.is_valid_code('LEGACY01', 'check-in'))
+
+    def test_stored_code_windows_end_when_replaced(self):
+        created = timezone.now() - timedelta(hours=2)
+        QRDetails.objects.create(unique_number='OLDCODE1', usage_type='check-in', is_valid=False)
+        QRDetails.objects.create(unique_number='NEWCODE1', usage_type='check-in', is_valid=True)
+        QRDetails.objects.filter(unique_number='OLDCODE1').update(create_date=created)
+        QRDetails.objects.filter(unique_number='NEWCODE1').update(create_date=created + timedelta(hours=1))
+
+        # Other usage types and later codes do not end the window, nor are they loaded
+        QRDetails.objects.create(unique_number='OUTCODE1', usage_type='check-out', is_valid=True)
+        QRDetails.objects.filter(unique_number='OUTCODE1').update(create_date=created + timedelta(minutes=10))
+        QRDetails.objects.create(unique_number='NEWCODE2', usage_type='check-in', is_valid=True)
+
+        with override_settings(QR_SIGNED_CODES=False):
+            with self.assertNumQueries(1):
+                windows = qr_codes.stored_code_windows(['OLDCODE1', 'NEWCODE1', 'UNKNOWN1'])
+            self.assertEqual(set(windows), {'OLDCODE1', 'NEWCODE1'})
+            at = created + timedelta(minutes=30)
+            self.assertTrue(qr_codes.is_valid_code_at('OLDCODE1', 'check-in', at, windows))
+            self.assertFalse(qr_codes.is_valid_code_at('OLDCODE1', 'check-in', at + timedelta(hours=1), windows))
+            self.assertFalse(qr_codes.is_valid_code_at('NEWCODE1', 'check-in', at, windows))
+            self.assertTrue(qr_codes.is_valid_code_at('NEWCODE1', 'check-in', at + timedelta(hours=1), windows))
+
+
+@override_settings(QR_SIGNED_CODES=False)
+class QRDisplayTests(UnmanagedTablesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = Employee.objects.create_user(
+            employee_id='QD000', username='qr-display', email='qr-display@example.com', password='x', is_staff=True
+        )
+        QRDetails.objects.create(unique_number='DISPLAY1', usage_type='check-in', is_valid=True)
+
+    def setUp(self):
+        cache.clear()
+        qr_render.render_qr.cache_clear()
+        self.addCleanup(qr_render.render_qr.cache_clear)
+
+    def get(self, image_format='png', **headers):
+        request = APIRequestFactory().get('/current-qr/check-in/', {'image_format': image_format}, **headers)
+        force_authenticate(request, user=self.staff)
+        return current_qr(request, 'check-in')
+
+    def test_render_qr_reuses_rendered_bytes(self):
+        content, content_type = qr_render.render_qr('DISPLAY1', 'check-in', 'testserver')
+        self.assertEqual(content_type, 'image/png')
+        self.assertIs(qr_render.render_qr('DISPLAY1', 'check-in', 'testserver')[0], content)
+        self.assertEqual(qr_render.render_qr.cache_info().hits, 1)
+
+        # Host and format are part of the image, so each renders separately
+        svg, content_type = qr_render.render_qr('DISPLAY1', 'check-in', 'testserver', 'svg')
+        self.assertEqual(content_type, 'image/svg+xml')
+        self.assertIn(b'<svg', svg)
+        self.assertNotEqual(qr_render.render_qr('DISPLAY1', 'check-in', 'other.example')[0], content)
+        self.assertEqual(qr_render.render_qr.cache_info().misses, 3)
+
+    def test_current_qr_serves_the_image_with_an_etag(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], '"DISPLAY1-png-testserver"')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertEqual(response.content, qr_render.render_qr('DISPLAY1', 'check-in', 'testserver')[0])
+        self.assertEqual(self.get('svg')['ETag'], '"DISPLAY1-svg-testserver"')
+
+    def test_matching_if_none_match_returns_not_modified(self):
+        etag = '"DISPLAY1-png-testserver"'
+        for header in (etag, f'"DISPLAY0-png-testserver", {etag}', f'W/{etag}', '*'):
+            with self.subTest(header=header):
+                response = self.get(HTTP_IF_NONE_MATCH=header)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+                self.assertEqual(response.content, b'')
+        # A 304 never renders the image
+        self.assertEqual(qr_render.render_qr.cache_info().misses, 0)
+
+    def test_stale_if_none_match_returns_the_image(self):
+        for header in ('"DISPLAY0-png-testserver"', '"DISPLAY1-svg-testserver"', 'DISPLAY1-png-testserver'):
+            with self.subTest(header=header):
+                self.assertEqual(self.get(HTTP_IF_NONE_MATCH=header).status_code, 200)
+
+
+class AsyncIdempotencyTests(UnmanagedTablesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.employee = Employee.objects.create_user(
+            employee_id='IK000', username='idempotency', email='idempotency@example.com', password='x'
+        )
+        token = CustomRefreshToken()
+        now = timezone.now()
+        token.payload = {
+            'token_type': 'refresh', 'exp': (now + timedelta(days=1)).timestamp(), 'iat': now.timestamp(),
+            'jti': 'idempotency-test', 'employee_id': 'IK000', 'type': 'access',
+        }
+        cls.raw_token = str(token)
+
+    def setUp(self):
+        cache.clear()
+        revocation.revoked_tokens.clear()
+        self.calls = []
+
+    def post(self, view, body, key='retry-1'):
+        request = RequestFactory().post(
+            '/auto-attend/', body, content_type='application/json',
+            HTTP_AUTHORIZATION=f'Bearer {self.raw_token}', HTTP_IDEMPOTENCY_KEY=key
+        )
+        return async_to_sync(view)(request)
+
+    def counting_view(self, status_code=200):
+        async def employee(request, data):
+            return 'IK000'
+
+        @idempotency.aidempotent('test', employee)
+        async def view(request):
+            self.calls.append(request.body)
+            return JsonResponse({'call': len(self.calls)}, status=status_code)
+        return view
+
+    def test_retry_replays_the_stored_response(self):
+        view = self.counting_view()
+        first = self.post(view, {'latitude': 1})
+        retry = self.post(view, {'latitude': 1})
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry[idempotency.REPLAYED_HEADER], 'true')
+        self.assertFalse(first.has_header(idempotency.REPLAYED_HEADER))
+
+    def test_key_reused_with_other_body_is_rejected(self):
+        view = self.counting_view()
+        self.post(view, {'latitude': 1})
+        self.assertEqual(self.post(view, {'latitude': 2}).status_code, 422)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_retry_while_in_flight_conflicts(self):
+        view = self.counting_view()
+        cache.add(f'{idempotency.cache_key("test", "IK000", "retry-1")}:lock', True)
+        self.assertEqual(self.post(view, {'latitude': 1}).status_code, 409)
+        self.assertEqual(self.calls, [])
+
+    def test_server_errors_are_not_stored(self):
+        view = self.counting_view(status_code=500)
+        self.post(view, {'latitude': 1})
+        retry = self.post(view, {'latitude': 1})
+        self.assertEqual(len(self.calls), 2)
+        self.assertFalse(retry.has_header(idempotency.REPLAYED_HEADER))
+
+    def test_revoked_token_gets_no_replay(self):
+        self.post(async_views.auto_attend, {'latitude': 1, 'longitude': 2})
+        retry = self.post(async_views.auto_attend, {'latitude': 1, 'longitude': 2})
+        self.assertEqual(retry[idempotency.REPLAYED_HEADER], 'true')
+
+        revocation.revoked_tokens.refresh()
+        revocation.revoked_tokens.add('idempotency-test')
+        response = self.post(async_views.auto_attend, {'latitude': 1, 'longitude': 2})
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(response.has_header(idempotency.REPLAYED_HEADER))
+
+    def test_inactive_employee_gets_no_replay(self):
+        self.post(async_views.auto_attend, {'latitude': 1, 'longitude': 2})
+        self.employee.is_active = False
+        self.employee.save()
+        response = self.post(async_views.auto_attend, {'latitude': 1, 'longitude': 2})
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(response.has_header(idempotency.REPLAYED_HEADER))
+
+
+class AsyncViewTests(UnmanagedTablesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.employee = Employee.objects.create_user(
+            employee_id='AV000', username='async-view', email='async-view@example.com', password='x'
+        )
+        cls.staff = Employee.objects.create_user(
+            employee_id='AV001', username='async-staff', email='async-staff@example.com', password='x',
+            is_staff=True
+        )
+        OfficeLocation.objects.create(latitude='12.000000', longitude='77.000000', radius_meters=200)
+        QRDetails.objects.create(unique_number='ASYNCIN1', usage_type='check-in', is_valid=True)
+
+    def setUp(self):
+        cache.clear()
+        geofence.geofence_cache.clear()
+        revocation.revoked_tokens.clear()
+
+    def bearer(self, employee_id):
+        token = CustomRefreshToken()
+        now = timezone.now()
+        token.payload = {
+            'token_type': 'access', 'exp': (now + timedelta(days=1)).timestamp(), 'iat': now.timestamp(),
+            'jti': f'async-{employee_id}', 'employee_id': employee_id, 'type': 'access',
+        }
+        return f'Bearer {token}'
+
+    def attend(self, body, code='ASYNCIN1'):
+        request = RequestFactory().post(
+            f'/attend/?code={code}&type=check-in', body, content_type='application/json'
+        )
+        return async_to_sync(async_views.mark_attendance)(request)
+
+    def presence(self, employee_id, **params):
+        request = RequestFactory().get('/presence/', params, HTTP_AUTHORIZATION=self.bearer(employee_id))
+        return async_to_sync(async_views.presence_status)(request)
+
+    def test_mark_attendance_records_the_scan(self):
+        response = self.attend({'employee_id': 'AV000', 'latitude': 12.0, 'longitude': 77.0})
+        self.assertEqual(response.status_code, 200)
+        payload = json.loads(response.content)
+        self.assertEqual(payload['message'], 'Attendance check-in marked successfully')
+        self.assertEqual(payload['details']['activity'], 'check-in')
+        self.assertEqual(payload['details']['distance_from_office'], '0.00 meters')
+        self.assertEqual(EmployeeActivity.objects.filter(emp_id='AV000', activity='check-in').count(), 1)
+        self.assertEqual(EmployeePresence.objects.get(employee_id='AV000').state, 'check-in')
+
+    def test_mark_attendance_rejects_a_body_that_is_not_an_object(self):
+        for body in ('{"employee_id": ', '["AV000", 12.0, 77.0]', '"AV000"', 'null'):
+            with self.subTest(body=body):
+                response = self.attend(body)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(json.loads(response.content), {'error': 'Malformed JSON body'})
+        self.assertFalse(EmployeeActivity.objects.filter(emp_id='AV000').exists())
+
+    def test_mark_attendance_rejects_an_unknown_code(self):
+        response = self.attend({'employee_id': 'AV000', 'latitude': 12.0, 'longitude': 77.0}, code='NOSUCH01')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content), {'error': 'Invalid or expired QR code'})
+
+    def test_presence_status_lookup(self):
+        self.attend({'employee_id': 'AV000', 'latitude': 12.0, 'longitude': 77.0})
+        check_in = EmployeeActivity.objects.get(emp_id='AV000')
+
+        response = self.presence('AV000')
+        self.assertEqual(response.status_code, 200)
+        payload = json.loads(response.content)
+        self.assertEqual(payload['employee_id'], 'AV000')
+        self.assertEqual(payload['state'], 'check-in')
+        self.assertEqual(parse_datetime(payload['session_started_at']), check_in.timestamp)
+
+        # Only staff may look up someone else; the employee parameter is ignored otherwise
+        self.assertEqual(json.loads(self.presence('AV001', employee='AV000').content)['state'], 'check-in')
+        self.assertEqual(json.loads(self.presence('AV000', employee='AV001').content)['employee_id'], 'AV000')
+        self.assertEqual(self.presence('AV001', employee='AV999').status_code, 404)
+
+    def test_presence_status_requires_a_token(self):
+        request = RequestFactory().get('/presence/')
+        self.assertEqual(async_to_sync(async_views.presence_status)(request).status_code, 401)
+
+
+class AttendanceBatchTests(UnmanagedTablesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.kiosk = Employee.objects.create_user(
+            employee_id='KB000', username='batch-kiosk', email='batch-kiosk@example.com', password='x', is_staff=True
+        )
+        for index in (1, 2):
+            Employee.objects.create_user(
+                employee_id=f'KB00{index}', username=f'batch-{index}', email=f'batch-{index}@example.com'
+            )
+        cls.day = timezone.localdate() - timedelta(days=1)
+        OfficeLocation.objects.create(latitude='12.000000', longitude='77.000000', radius_meters=200)
+
+    def at(self, hour, minute=0):
+        return day_start(self.day) + timedelta(hours=hour, minutes=minute)
+
+    def test_mixed_batch(self):
+        record_attendance('KB001', 'check-in', at=self.at(10))
+        outcomes = record_attendance_batch([
+            Scan('KB001', 'check-out', self.at(9)),    # older than the recorded check-in
+            Scan('ZZ999', 'check-in', self.at(9)),
+            Scan('KB002', 'lunch', self.at(9)),
+            Scan('KB002', 'check-out', self.at(12)),   # sorted after its check-in below
+            Scan('KB002', 'check-in', self.at(8)),
+            Scan('KB001', 'check-out', self.at(11)),
+        ])
+        self.assertEqual(
+            [outcome.error.code if outcome.error else outcome.activity.activity for outcome in outcomes],
+            ['out-of-order', 'unknown-employee', 'invalid-type', 'check-out', 'check-in', 'check-out']
+        )
+        self.assertEqual([outcome.session_minutes for outcome in outcomes][3:], [240, None, 60])
+        self.assertEqual(EmployeeActivity.objects.filter(emp_id__in=['KB001', 'KB002']).count(), 4)
+        self.assertEqual(
+            set(EmployeePresence.objects.values_list('employee_id', 'state', 'last_activity_at')),
+            {('KB001', 'check-out', self.at(11)), ('KB002', 'check-out', self.at(12))}
+        )
+        self.assertEqual(Employee.objects.get(employee_id='KB002').last_login, self.at(12))
+
+    def test_sessions_on_one_day_sum_into_one_row(self):
+        outcomes = record_attendance_batch([
+            Scan('KB001', 'check-in', self.at(9)),
+            Scan('KB001', 'check-out', self.at(10, 30)),
+            Scan('KB001', 'check-in', self.at(13)),
+            Scan('KB001', 'check-out', self.at(14)),
+        ])
+        self.assertTrue(all(outcome.error is None for outcome in outcomes))
+        self.assertEqual(list(WorkedHours.objects.filter(emp_id='KB001').values_list('work_date', 'worked_minutes')),
+                         [(self.day, 150)])
+
+        # A later batch adds to the same row
+        record_attendance_batch([Scan('KB001', 'check-in', self.at(15)), Scan('KB001', 'check-out', self.at(15, 20))])
+        self.assertEqual(WorkedHours.objects.get(emp_id='KB001').worked_minutes, 170)
+
+    def test_employee_without_presence_row(self):
+        EmployeeActivity.objects.create(emp_id='KB002', activity='check-in', timestamp=self.at(9))
+        self.assertFalse(EmployeePresence.objects.filter(employee_id='KB002').exists())
+
+        outcome, = record_attendance_batch([Scan('KB002', 'check-out', self.at(11))])
+        self.assertIsNone(outcome.error)
+        self.assertEqual(outcome.session_minutes, 120)
+        presence = EmployeePresence.objects.get(employee_id='KB002')
+        self.assertEqual((presence.state, presence.last_activity_at), ('check-out', self.at(11)))
+        self.assertEqual(WorkedHours.objects.get(emp_id='KB002').worked_minutes, 120)
+
+    def test_endpoint_validates_codes_at_the_scan_time(self):
+        QRDetails.objects.create(unique_number='BATCHIN1', usage_type='check-in', is_valid=False)
+        QRDetails.objects.create(unique_number='BATCHIN2', usage_type='check-in', is_valid=True)
+        QRDetails.objects.filter(unique_number='BATCHIN1').update(create_date=self.at(7))
+        QRDetails.objects.filter(unique_number='BATCHIN2').update(create_date=self.at(10))
+        scan = {'employee_id': 'KB001', 'type': 'check-in', 'latitude': 12, 'longitude': 77}
+
+        request = APIRequestFactory().post('/attend/batch/', {'scans': [
+            {**scan, 'code': 'BATCHIN1', 'timestamp': self.at(11).isoformat()},  # replaced at 10:00
+            {**scan, 'code': 'BATCHIN1', 'timestamp': self.at(9).isoformat()},
+            {**scan, 'employee_id': 'KB002', 'code': 'BATCHIN2', 'timestamp': self.at(11).isoformat(),
+             'latitude': 13},
+            'not a scan',
+        ]}, format='json')
+        force_authenticate(request, user=self.kiosk)
+        geofence.geofence_cache.clear()
+        response = mark_attendance_batch(request)
+
+        self.assertEqual((response.data['accepted'], response.data['rejected']), (1, 3))
+        self.assertEqual(
+            [result.get('error') for result in response.data['results']],
+            ['Invalid or expired QR code', None, 'You are too far from the office location', 'Scan must be an object']
+        )
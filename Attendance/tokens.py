@@ -2,11 +2,24 @@ from rest_framework_simplejwt.tokens import Token, AccessToken, RefreshToken
 from rest_framework_simplejwt.models import TokenUser
 from datetime import datetime, timedelta, timezone
 from django.conf import settings
+import hashlib
 import uuid
 from .models import OutstandingTokenModel, BlacklistedTokenModel
+from . import revocation
 from django.utils import timezone as django_timezone
 from rest_framework_simplejwt.tokens import TokenError
 
+
+def stored_token(raw_token):
+    """
+    Value kept in OutstandingTokenModel.token: the token itself, or only its
+    SHA-256 when OUTSTANDING_TOKEN_STORAGE is 'hash' (revocation only needs the JTI)
+    """
+    if getattr(settings, 'OUTSTANDING_TOKEN_STORAGE', 'full') == 'hash':
+        return 'sha256:' + hashlib.sha256(raw_token.encode()).hexdigest()
+    return raw_token
+
+
 class CustomRefreshToken(RefreshToken):
     lifetime = timedelta(days=36500)  # 100 years
 
@@ -28,7 +41,7 @@ class CustomRefreshToken(RefreshToken):
             self._access_token = self._create_access_token()
         return self._access_token
 
-    def _create_access_token(self):
+    def _create_access_token(self, persist=True):
         """Create a new access token."""
         access = self.__class__()
         
@@ -47,19 +60,24 @@ class CustomRefreshToken(RefreshToken):
         }
 
         # Store access token in database
-        OutstandingTokenModel.objects.create(
-            user_id=self.payload.get('employee_id'),
-            jti=access.payload['jti'],
-            token=str(access),
-            created_at=now,
-            expires_at=exp.replace(microsecond=0)
-        )
+        if persist:
+            access.outstanding().save()
 
         return access
 
+    def outstanding(self):
+        """Unsaved OutstandingTokenModel row recording this token"""
+        return OutstandingTokenModel(
+            user_id=self.payload.get('employee_id'),
+            jti=self.payload['jti'],
+            token=stored_token(str(self)),
+            created_at=datetime.fromtimestamp(self.payload['iat'], timezone.utc),
+            expires_at=datetime.fromtimestamp(self.payload['exp'], timezone.utc).replace(microsecond=0)
+        )
+
     @classmethod
     def for_user(cls, user):
-        """Create a new token for a user."""
+        """Create a new token and its access token for a user, stored with one INSERT."""
         token = cls()
         
         # Set required claims
@@ -76,14 +94,9 @@ class CustomRefreshToken(RefreshToken):
             'type': 'refresh'
         }
 
-        # Store token in database
-        OutstandingTokenModel.objects.create(
-            user_id=user.employee_id,
-            jti=token.payload['jti'],
-            token=str(token),
-            created_at=now,
-            expires_at=exp.replace(microsecond=0)
-        )
+        # Mint the access token up front so both rows go out in one bulk INSERT
+        token._access_token = token._create_access_token(persist=False)
+        OutstandingTokenModel.objects.bulk_create([token.outstanding(), token._access_token.outstanding()])
         
         return token
 
@@ -96,7 +109,9 @@ class CustomRefreshToken(RefreshToken):
             )
             
             # Create blacklist record
-            return BlacklistedTokenModel.objects.create(token=outstanding_token)
+            blacklisted = BlacklistedTokenModel.objects.create(token=outstanding_token)
+            revocation.revoked(self.payload['jti'])
+            return blacklisted
             
         except OutstandingTokenModel.DoesNotExist:
             raise TokenError('Token not found in database')
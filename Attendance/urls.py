@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
@@ -17,7 +18,14 @@ from .views import (
     auto_attend,
     AttendanceLogsViewSet,
     WorkedHoursViewSet,
+    presence_status,
+    signed_qr,
+    current_qr,
+    mark_attendance_batch,
+    auto_attend_stats,
+    login_stats,
 )
+from . import async_views
 
 router = DefaultRouter()
 router.register(r'employees', EmployeeViewSet, basename='employee')
@@ -35,9 +43,23 @@ router.register(r'worked-hours', WorkedHoursViewSet, basename='worked-hours')
 urlpatterns = [
     path('register/', register, name='register'),
     path('login/', login, name='login'),
+    path('login/stats/', login_stats, name='login_stats'),
     path('logout/', logout, name='logout'),
     path('', include(router.urls)),
     path('generate-qr/<str:usage_type>/', generate_qr, name='generate_qr'),
+    path('signed-qr/<str:usage_type>/', signed_qr, name='signed_qr'),
+    path('current-qr/<str:usage_type>/', current_qr, name='current_qr'),
     path('attend/', mark_attendance, name='mark_attendance'),
+    path('attend/batch/', mark_attendance_batch, name='mark_attendance_batch'),
     path('auto-attend/', auto_attend, name='auto_attend'),
-] 
\ No newline at end of file
+    path('auto-attend/stats/', auto_attend_stats, name='auto_attend_stats'),
+    path('presence/', presence_status, name='presence_status'),
+] 
+# Under ASGI the hot endpoints are served by native async views; listed first
+# so they take precedence over the sync routes above
+if getattr(settings, 'ATTENDANCE_ASYNC_VIEWS', False):
+    urlpatterns = [
+        path('attend/', async_views.mark_attendance, name='mark_attendance'),
+        path('auto-attend/', async_views.auto_attend, name='auto_attend'),
+        path('presence/', async_views.presence_status, name='presence_status'),
+    ] + urlpatterns
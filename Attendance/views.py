@@ -15,25 +15,36 @@ from .models import (
     Holiday,
     LeaveType,
     LeaveBalance,
-    LeaveRequest
+    LeaveRequest,
+    EmployeePresence
 )
-from .serializers import EmployeeSerializer, EmployeeActivitySerializer, QRDetailsSerializer, OfficeLocationSerializer, HolidaySerializer, LeaveTypeSerializer, LeaveBalanceSerializer, LeaveRequestSerializer, WorkedHoursSerializer
+from .serializers import format_minutes, EmployeeSerializer, EmployeeActivitySerializer, QRDetailsSerializer, OfficeLocationSerializer, HolidaySerializer, LeaveTypeSerializer, LeaveBalanceSerializer, LeaveRequestSerializer, WorkedHoursSerializer, EmployeePresenceSerializer
 import uuid
 from django.contrib.auth import authenticate
 from .tokens import CustomRefreshToken
+from .services import (
+    AttendanceError, Scan, close_open_sessions, missing_check_out_policy, record_attendance_batch
+)
+from .presence import presence_from_history
+from . import geofence, journal, ping_tracker, qr_codes, qr_render
+from .idempotency import idempotent
+from .pagination import ActivityLogPagination, EmployeeStatsPagination, WorkedHoursPagination
+from . import date_ranges, exports, password_pool, revocation, rollups, stats
 from rest_framework_simplejwt.tokens import TokenError
 import qrcode
 from io import BytesIO
 from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
 from django.core.files.base import ContentFile
 import os
 from django.conf import settings
 from datetime import datetime
-from math import radians, sin, cos, sqrt, atan2
 from decimal import Decimal
+from django.db import transaction
 from django.db.models import Q
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django_filters import rest_framework as filters
 from rest_framework.filters import OrderingFilter
 from django.db.models import Sum, Count
@@ -138,6 +149,7 @@ def login(request):
             - Refresh token
             - User details
         - Error (401): Invalid credentials message
+        - Error (503): Password verification pool saturated, retry later
     """
     login = request.data.get('login')
     password = request.data.get('password')
@@ -149,13 +161,24 @@ def login(request):
         )
     
     user = Employee.objects.get_by_natural_key(login)
-    if user and user.check_password(password):
-        # Update last_login
-        user.last_login = timezone.now()
-        user.save(update_fields=['last_login'])
+    try:
+        # Rehashes the stored password when it does not match the hasher policy
+        password_valid = user is not None and password_pool.check_password(user, password)
+    except password_pool.PasswordPoolBusy:
+        return Response(
+            {'error': 'Too many logins in progress, please retry'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={'Retry-After': '1'}
+        )
 
-        # Create refresh token
-        refresh = CustomRefreshToken.for_user(user)
+    if password_valid:
+        # One transaction for the last_login UPDATE and the token INSERT
+        with transaction.atomic():
+            user.last_login = timezone.now()
+            user.save(update_fields=['last_login'])
+
+            # Create refresh token (and its access token)
+            refresh = CustomRefreshToken.for_user(user)
         
         response_data = {
             'message': 'Login successful',
@@ -236,7 +259,16 @@ def logout(request):
             
             # Blacklist the token
             blacklisted = BlacklistedTokenModel.objects.create(token=outstanding_token)
+            revocation.revoked(jti)
             print(f"Token blacklisted with id: {blacklisted.id}")
+
+            # The access token of this request would otherwise stay valid for its whole lifetime
+            access_jti = request.auth.get('jti') if request.auth is not None else None
+            if access_jti and access_jti != jti:
+                access_token = OutstandingTokenModel.objects.filter(jti=access_jti).first()
+                if access_token and not BlacklistedTokenModel.objects.filter(token=access_token).exists():
+                    BlacklistedTokenModel.objects.create(token=access_token)
+                    revocation.revoked(access_jti)
             
             return Response({
                 'message': 'Logout successful',
@@ -312,27 +344,14 @@ def generate_qr(request, usage_type):
             is_valid=True
         )
 
-        # Generate QR code
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        
-        qr_url = f"http://{request.get_host()}/attend?code={unique_number}&type={usage_type}"
-        qr.add_data(qr_url)
-        qr.make(fit=True)
+        # Remember the current code for display polling
+        qr_render.set_current_code(usage_type, unique_number)
+
+        # Render QR code (cached, so displays fetching it afterwards reuse the bytes)
+        content, content_type = qr_render.render_qr(unique_number, usage_type, request.get_host())
 
-        # Create image
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Save to BytesIO
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        
         # Create response
-        response = HttpResponse(buffer.getvalue(), content_type='image/png')
+        response = HttpResponse(content, content_type=content_type)
         response['Content-Disposition'] = f'attachment; filename="{usage_type}_qr_{unique_number}.png"'
         
         return response
@@ -343,69 +362,150 @@ def generate_qr(request, usage_type):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
-def calculate_distance(lat1, lon1, lat2, lon2):
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def current_qr(request, usage_type):
     """
-    Calculate distance between two points using Haversine formula
-    Returns distance in meters
+    Fetch the currently valid QR image for display screens.
+    
+    Methods:
+        GET
+        
+    Parameters:
+        usage_type: 'check-in' or 'check-out'
+        image_format: 'png' (default) or 'svg'
+        
+    Features:
+        - Does not generate a new code; use generate-qr for that
+        - Serves cached rendered bytes
+        - ETag / If-None-Match support, unchanged codes return 304
+        - Serves the current signed code when QR_SIGNED_CODES is enabled
+        
+    Permissions:
+        Admin/Staff only
     """
-    R = 6371000  # Earth's radius in meters
+    if not request.user.is_staff and not request.user.is_superuser:
+        return Response(
+            {'error': 'You do not have permission to view QR codes'},
+            status=status.HTTP_403_FORBIDDEN
+        )
 
-    lat1, lon1, lat2, lon2 = map(radians, [float(lat1), float(lon1), float(lat2), float(lon2)])
-    
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1-a))
-    distance = R * c
-    
-    return distance
+    if usage_type not in ['check-in', 'check-out']:
+        return Response(
+            {'error': 'Invalid usage type. Must be check-in or check-out'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
-def get_last_activity(employee):
-    """Get employee's last activity for validation"""
-    return EmployeeActivity.objects.filter(
-        emp=employee
-    ).order_by('-timestamp').first()
+    image_format = request.query_params.get('image_format', 'png')
+    if image_format not in qr_render.FORMATS:
+        return Response(
+            {'error': 'Invalid format. Must be png or svg'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
-def calculate_worked_hours(check_in_time, check_out_time):
-    """
-    Calculate hours worked between check-in and check-out
-    Returns time in HH.MM format (e.g., 8.30 for 8 hours 30 minutes)
+    if qr_codes.signed_codes_enabled():
+        code = qr_codes.sign_code(usage_type)
+    else:
+        code = qr_render.current_code(usage_type)
+        if code is None:
+            return Response(
+                {'error': f'No valid {usage_type} QR code, generate one first'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+    etag = qr_render.etag_for(code, image_format, request.get_host())
+    # Handles If-None-Match lists, weak validators and "*" like ConditionalGetMiddleware
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        content, content_type = qr_render.render_qr(code, usage_type, request.get_host(), image_format)
+        response = HttpResponse(content, content_type=content_type)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def signed_qr(request, usage_type):
     """
-    # Make both times timezone-aware if they aren't already
-    if check_in_time.tzinfo is None:
-        check_in_time = check_in_time.replace(tzinfo=timezone.utc)
-    if check_out_time.tzinfo is None:
-        check_out_time = check_out_time.replace(tzinfo=timezone.utc)
-        
-    time_diff = check_out_time - check_in_time
-    total_minutes = time_diff.total_seconds() / 60  # Convert to minutes
-    
-    hours = int(total_minutes // 60)  # Get complete hours
-    minutes = int(total_minutes % 60)  # Get remaining minutes
+    Get the current signed QR code for kiosks.
     
-    # Convert to HH.MM format
-    decimal_time = Decimal(f"{hours}.{minutes:02d}")  # :02d ensures two digits for minutes
-    return decimal_time
-
-def handle_missing_checkout(employee, last_activity):
-    """Handle cases where employee didn't check out from previous day"""
-    if last_activity and last_activity.activity == 'check-in':
-        # Get the date of last activity
-        last_date = last_activity.timestamp.date()
+    Methods:
+        GET
         
-        # If last check-in was not today and no checkout was recorded
-        if last_date < datetime.now().date():
-            # Add default 2 hours for incomplete previous day
-            WorkedHours.objects.create(
-                emp=employee,
-                work_date=last_date,
-                worked_hours=Decimal('2.00')  # Default 2 hours for incomplete checkout
-            )
-            return True
-    return False
+    Parameters:
+        usage_type: 'check-in' or 'check-out'
+        
+    Features:
+        - HMAC-signed, time-windowed code (no database access)
+        - Kiosks poll again once valid_until has passed
+        
+    Permissions:
+        Admin/Staff only, requires QR_SIGNED_CODES
+    """
+    if not request.user.is_staff and not request.user.is_superuser:
+        return Response(
+            {'error': 'You do not have permission to generate QR codes'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    if not qr_codes.signed_codes_enabled():
+        return Response(
+            {'error': 'Signed QR codes are not enabled'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    if usage_type not in ['check-in', 'check-out']:
+        return Response(
+            {'error': 'Invalid usage type. Must be check-in or check-out'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    window = qr_codes.time_window()
+    rotation = qr_codes.rotation_seconds()
+    code = qr_codes.sign_code(usage_type, window)
+
+    return Response({
+        'code': code,
+        'usage_type': usage_type,
+        'url': f"http://{request.get_host()}/attend?code={code}&type={usage_type}",
+        'valid_from': datetime.fromtimestamp(window * rotation, tz=dt_timezone.utc),
+        'valid_until': datetime.fromtimestamp((window + 1) * rotation, tz=dt_timezone.utc),
+        'rotation_seconds': rotation
+    }, status=status.HTTP_200_OK)
+
+def _record_scan(employee_id, usage_type, distance):
+    """
+    Write a validated QR scan. Returns (payload, status), shared by the sync
+    and async attendance views.
+    """
+    try:
+        result = journal.record_attendance(employee_id, usage_type)
+    except AttendanceError as e:
+        return e.payload, status.HTTP_400_BAD_REQUEST
+
+    details = {
+        'employee_id': employee_id,
+        'timestamp': result.activity.timestamp,
+        'activity': result.activity.activity,
+        'distance_from_office': f'{distance:.2f} meters',
+    }
+    if usage_type == 'check-out':
+        details['session_hours'] = format_minutes(result.session_minutes)
+        if result.total_minutes is not None:
+            details['total_worked_hours'] = format_minutes(result.total_minutes)
+    else:
+        details['last_login'] = result.activity.timestamp
+    if result.employee is None:
+        # Write-behind mode: journaled, written to the database by the flusher
+        details['queued'] = True
+
+    return {
+        'message': f'Attendance {usage_type} marked successfully',
+        'details': details
+    }, status.HTTP_200_OK
 
 @api_view(['POST'])
+@idempotent('mark_attendance', employee=lambda request: request.data.get('employee_id'))
 def mark_attendance(request):
     """
     Mark attendance using QR code.
@@ -414,7 +514,7 @@ def mark_attendance(request):
         POST
         
     Required Parameters:
-        - code: QR code unique number
+        - code: QR code unique number, or a signed code from signed-qr
         - type: 'check-in' or 'check-out'
         
     Required Data:
@@ -424,9 +524,12 @@ def mark_attendance(request):
         
     Validations:
         - QR code validity
-        - Location within 200m radius
+        - Location within the radius of a valid office
         - Proper check-in/out sequence
         
+    Optional Headers:
+        - Idempotency-Key: retries with the same key replay the first response
+        
     Returns:
         - Success (200): Attendance details with timestamp
         - Error (400): Validation error details
@@ -454,159 +557,32 @@ def mark_attendance(request):
                 }
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Get valid office location
-        office_location = OfficeLocation.objects.filter(is_valid=True).first()
-        if not office_location:
+        # Match against the valid office sites (served from the process-local geofence cache)
+        match = geofence.locate(current_latitude, current_longitude)
+        if match is None:
             return Response({
                 'error': 'No valid office location found'
             }, status=status.HTTP_400_BAD_REQUEST)
+        distance = match.distance
 
-        # Calculate distance
-        distance = calculate_distance(
-            float(current_latitude),
-            float(current_longitude),
-            float(office_location.latitude),
-            float(office_location.longitude)
-        )
-
-        # Check if within 200 meters
-        if distance > 200:
+        # Check if within the radius of an office
+        if not match.inside:
             return Response({
                 'error': 'You are too far from the office location',
                 'distance': f'{distance:.2f} meters',
-                'max_allowed': '200 meters'
+                'max_allowed': f'{match.office.radius_meters} meters'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Validate QR code
-        qr_detail = QRDetails.objects.filter(
-            unique_number=code,
-            usage_type=usage_type,
-            is_valid=True
-        ).first()
-
-        if not qr_detail:
+        # Validate QR code (signed codes are verified without a query)
+        if not qr_codes.is_valid_code(code, usage_type):
             return Response({
                 'error': 'Invalid or expired QR code'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Validate employee
-        try:
-            employee = Employee.objects.get(employee_id=employee_id)
-        except Employee.DoesNotExist:
-            return Response({
-                'error': f'Employee with ID {employee_id} not found'
-            }, status=status.HTTP_400_BAD_REQUEST)
-
-        # Update last_login instead of last_activity
-        employee.last_login = timezone.now()
-        employee.save(update_fields=['last_login'])
-
-        # Get employee's last activity
-        last_activity = get_last_activity(employee)
-        today = datetime.now().date()
-
-        # Modified activity sequence validation
-        if last_activity:
-            if usage_type == 'check-in':
-                if last_activity.activity == 'check-in':
-                    return Response({
-                        'error': 'Cannot check in: You have not checked out from your previous session',
-                        'last_activity': {
-                            'type': last_activity.activity,
-                            'timestamp': last_activity.timestamp
-                        }
-                    }, status=status.HTTP_400_BAD_REQUEST)
-                # If last activity was check-out, allow new check-in
-            elif usage_type == 'check-out':
-                if last_activity.activity == 'check-out':
-                    return Response({
-                        'error': 'Cannot check out: You have not checked in yet',
-                        'last_activity': {
-                            'type': last_activity.activity,
-                            'timestamp': last_activity.timestamp
-                        }
-                    }, status=status.HTTP_400_BAD_REQUEST)
-        elif usage_type == 'check-out':
-            return Response({
-                'error': 'Cannot check out: No previous check-in found'
-            }, status=status.HTTP_400_BAD_REQUEST)
-
-        # For check-out, calculate and store worked hours
-        if usage_type == 'check-out':
-            # Get today's last check-in
-            check_in = EmployeeActivity.objects.filter(
-                emp=employee,
-                activity='check-in',
-                timestamp__date=today
-            ).order_by('-timestamp').first()
-
-            if check_in:
-                # Calculate worked hours for this session
-                current_time = timezone.now()
-                session_hours = calculate_worked_hours(check_in.timestamp, current_time)
-                
-                # Get or create today's worked hours record
-                worked_hours_record, created = WorkedHours.objects.get_or_create(
-                    emp=employee,
-                    work_date=today,
-                    defaults={'worked_hours': Decimal('0.00')}
-                )
-
-                # Add current session hours to total
-                total_minutes = (
-                    int(str(worked_hours_record.worked_hours).split('.')[0]) * 60 +  # Hours to minutes
-                    int(str(worked_hours_record.worked_hours).split('.')[1])         # Minutes
-                ) + (
-                    int(str(session_hours).split('.')[0]) * 60 +                     # Session hours to minutes
-                    int(str(session_hours).split('.')[1])                            # Session minutes
-                )
-
-                # Convert total minutes back to HH.MM format
-                total_hours = int(total_minutes // 60)
-                total_minutes = int(total_minutes % 60)
-                worked_hours_record.worked_hours = Decimal(f"{total_hours}.{total_minutes:02d}")
-                worked_hours_record.save()
-
-                # Create check-out record
-                activity = EmployeeActivity.objects.create(
-                    emp=employee,
-                    activity=usage_type,
-                    timestamp=current_time
-                )
-
-                return Response({
-                    'message': f'Attendance {usage_type} marked successfully',
-                    'details': {
-                        'employee_id': employee.employee_id,
-                        'timestamp': activity.timestamp,
-                        'activity': activity.activity,
-                        'distance_from_office': f'{distance:.2f} meters',
-                        'session_hours': str(session_hours),
-                        'total_worked_hours': str(worked_hours_record.worked_hours)
-                    }
-                }, status=status.HTTP_200_OK)
-            else:
-                return Response({
-                    'error': 'No check-in record found for today'
-                }, status=status.HTTP_400_BAD_REQUEST)
-        else:
-            # Regular check-in process
-            activity = EmployeeActivity.objects.create(
-                emp=employee,
-                activity=usage_type,
-                timestamp=timezone.now()
-            )
-
-            return Response({
-                'message': f'Attendance {usage_type} marked successfully',
-                'details': {
-                    'employee_id': employee.employee_id,
-                    'timestamp': activity.timestamp,
-                    'activity': activity.activity,
-                    'distance_from_office': f'{distance:.2f} meters',
-                    'last_login': employee.last_login
-                }
-            }, status=status.HTTP_200_OK)
+        # Validate sequence and write activity, worked hours and last_login
+        # in a single locked transaction
+        payload, status_code = _record_scan(employee_id, usage_type, distance)
+        return Response(payload, status=status_code)
 
     except Exception as e:
         return Response({
@@ -630,8 +606,8 @@ class OfficeLocationViewSet(viewsets.ModelViewSet):
         POST /office-locations/{id}/toggle_status/ - Toggle validity
         
     Features:
-        - Only one valid location at a time
-        - Automatic previous location invalidation
+        - Any number of valid sites, each with its own radius
+        - Optional replacement of all current sites (replace_existing)
         
     Permissions:
         Admin/Staff only for management
@@ -649,7 +625,8 @@ class OfficeLocationViewSet(viewsets.ModelViewSet):
 
     def create(self, request, *args, **kwargs):
         """
-        Create a new office location and invalidate previous locations
+        Create a new office site. Previous sites stay valid unless
+        replace_existing is true.
         """
         try:
             # Validate required fields
@@ -661,16 +638,22 @@ class OfficeLocationViewSet(viewsets.ModelViewSet):
                     'error': 'Both latitude and longitude are required'
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-            # Invalidate previous locations
-            OfficeLocation.objects.filter(is_valid=True).update(is_valid=False)
+            # Optionally replace all current sites instead of adding one
+            if str(request.data.get('replace_existing', 'false')).lower() == 'true':
+                OfficeLocation.objects.filter(is_valid=True).update(is_valid=False)
 
             # Create new location
             location = OfficeLocation.objects.create(
+                name=request.data.get('name', ''),
                 latitude=latitude,
                 longitude=longitude,
+                radius_meters=request.data.get('radius_meters', 200),
                 is_valid=True
             )
 
+            # The bulk invalidation above bypasses model signals
+            geofence.invalidate()
+
             serializer = self.get_serializer(location)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -700,6 +683,7 @@ class OfficeLocationViewSet(viewsets.ModelViewSet):
         location = self.get_object()
         location.is_valid = not location.is_valid
         location.save()
+        geofence.invalidate()
 
         return Response({
             'message': f'Location status updated to {"valid" if location.is_valid else "invalid"}',
@@ -751,6 +735,7 @@ class LeaveRequestViewSet(viewsets.ModelViewSet):
         - Automatic leave balance update
         - Leave request workflow
         - Status tracking
+        - Idempotency-Key header on create: retries replay the first response
         
     Filters:
         - By status
@@ -795,6 +780,7 @@ class LeaveRequestViewSet(viewsets.ModelViewSet):
             
         return queryset.select_related('employee', 'leave_type', 'approved_by')
 
+    @idempotent('leave_request')
     def create(self, request, *args, **kwargs):
         # Add employee to request data
         data = request.data.copy()
@@ -861,8 +847,137 @@ class LeaveRequestViewSet(viewsets.ModelViewSet):
             'leave_request': LeaveRequestSerializer(leave_request).data
         })
 
+def _absorbed_ping_payload(decision, match):
+    """Payload for an auto_attend ping that did not change the attendance state"""
+    distance = f'{match.distance:.2f} meters'
+    if decision.pending is not None:
+        return {
+            'message': f'Auto {decision.pending} pending',
+            'details': {
+                'pending': decision.pending,
+                'dwell_remaining_seconds': round(decision.dwell_remaining, 1),
+                'distance_from_office': distance
+            }
+        }
+
+    if decision.state == 'check-in':
+        return {
+            'message': 'Already checked in',
+            'details': {
+                'last_activity': decision.state,
+                'timestamp': decision.last_activity_at,
+                'distance_from_office': distance
+            }
+        }
+
+    return {
+        'message': 'Outside office radius' if not match.inside else 'Not checked in',
+        'details': {
+            'distance_from_office': distance,
+            'max_allowed': f'{match.office.radius_meters} meters'
+        }
+    }
+
+def _close_stale_session(employee_id, match):
+    """
+    Close a session opened on an earlier day that an auto check-out ping found,
+    with the policy of close_open_sessions, so the tracker stops escalating it.
+    """
+    now = timezone.now()
+    closed = close_open_sessions(
+        [employee_id], date_ranges.day_start(timezone.localdate(now)), missing_check_out_policy(), now
+    )
+    if not closed:
+        # Closed or replaced meanwhile; reload the state on the next ping
+        ping_tracker.tracker.forget(employee_id)
+        return {'error': 'No check-in record found for today'}, status.HTTP_400_BAD_REQUEST
+
+    ping_tracker.tracker.record(employee_id, 'check-out', closed[0].timestamp)
+    return {
+        'message': 'Previous session closed',
+        'details': {
+            'employee_id': employee_id,
+            'timestamp': closed[0].timestamp,
+            'activity': 'check-out',
+            'distance_from_office': f'{match.distance:.2f} meters',
+            'missing_check_out': True
+        }
+    }, status.HTTP_200_OK
+
+def _escalate_ping(employee_id, action, match):
+    """
+    Write the transition an auto_attend ping asked for and update the ping
+    tracker. Returns (payload, status), shared by the sync and async views.
+    """
+    distance = match.distance
+    if action == 'check-in':
+        try:
+            result = journal.record_attendance(employee_id, 'check-in')
+        except AttendanceError as e:
+            if e.code != 'already-checked-in':
+                ping_tracker.tracker.forget(employee_id)
+                return e.payload, status.HTTP_400_BAD_REQUEST
+            last_activity = e.payload['last_activity']
+            ping_tracker.tracker.record(employee_id, 'check-in', last_activity['timestamp'])
+            return {
+                'message': 'Already checked in',
+                'details': {
+                    'last_activity': last_activity['type'],
+                    'timestamp': last_activity['timestamp'],
+                    'distance_from_office': f'{distance:.2f} meters'
+                }
+            }, status.HTTP_200_OK
+
+        ping_tracker.tracker.record(employee_id, 'check-in', result.activity.timestamp)
+        return {
+            'message': 'Auto check-in successful',
+            'details': {
+                'employee_id': employee_id,
+                'timestamp': result.activity.timestamp,
+                'activity': 'check-in',
+                'distance_from_office': f'{distance:.2f} meters'
+            }
+        }, status.HTTP_200_OK
+
+    # Left the office, close the open session if there is one
+    try:
+        result = journal.record_attendance(employee_id, 'check-out')
+    except AttendanceError as e:
+        if e.code == 'no-check-in-today':
+            return _close_stale_session(employee_id, match)
+        if e.code not in ('not-checked-in', 'no-check-in'):
+            ping_tracker.tracker.forget(employee_id)
+            return e.payload, status.HTTP_400_BAD_REQUEST
+        last_activity = e.payload.get('last_activity') or {}
+        ping_tracker.tracker.record(employee_id, last_activity.get('type'), last_activity.get('timestamp'))
+        return {
+            'message': 'Outside office radius',
+            'details': {
+                'distance_from_office': f'{distance:.2f} meters',
+                'max_allowed': f'{match.office.radius_meters} meters'
+            }
+        }, status.HTTP_200_OK
+
+    ping_tracker.tracker.record(employee_id, 'check-out', result.activity.timestamp)
+    details = {
+        'employee_id': employee_id,
+        'timestamp': result.activity.timestamp,
+        'activity': 'check-out',
+        'distance_from_office': f'{distance:.2f} meters',
+        'session_hours': format_minutes(result.session_minutes)
+    }
+    if result.total_minutes is not None:
+        details['total_worked_hours'] = format_minutes(result.total_minutes)
+    else:
+        details['queued'] = True
+    return {
+        'message': 'Auto check-out successful',
+        'details': details
+    }, status.HTTP_200_OK
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent('auto_attend')
 def auto_attend(request):
     """
     Automatically mark attendance based on location.
@@ -875,9 +990,12 @@ def auto_attend(request):
         - longitude: Current longitude
         
     Features:
-        - Auto check-in when entering office radius
-        - Auto check-out when leaving office radius
+        - Auto check-in when entering the radius of any valid office
+        - Auto check-out when leaving it
+        - Hysteresis band and minimum dwell time against boundary flapping
+        - Pings that cannot change state are answered without database access
         - Calculates worked hours on check-out
+        - Idempotency-Key header: retries replay the first response
         
     Returns:
         - Success (200): Attendance status and details
@@ -898,123 +1016,219 @@ def auto_attend(request):
                 }
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Get valid office location
-        office_location = OfficeLocation.objects.filter(is_valid=True).first()
-        if not office_location:
+        # Match against the valid office sites (served from the process-local geofence cache)
+        match = geofence.locate(current_latitude, current_longitude)
+        if match is None:
             return Response({
                 'error': 'No valid office location found'
             }, status=status.HTTP_400_BAD_REQUEST)
+        distance = match.distance
 
-        # Calculate distance
-        distance = calculate_distance(
-            float(current_latitude),
-            float(current_longitude),
-            float(office_location.latitude),
-            float(office_location.longitude)
-        )
+        # Pings that cannot change the attendance state are absorbed in memory
+        decision = ping_tracker.tracker.decide(employee_id, match)
+        if decision.action is None:
+            return Response(_absorbed_ping_payload(decision, match), status=status.HTTP_200_OK)
 
-        # Get employee's last activity
-        last_activity = get_last_activity(request.user)
-        current_time = timezone.now()
-        today = current_time.date()
-
-        # If within office radius (200 meters)
-        if distance <= 200:
-            # If no previous activity or last activity was check-out
-            if not last_activity or last_activity.activity == 'check-out':
-                # Create check-in record
-                activity = EmployeeActivity.objects.create(
-                    emp=request.user,
-                    activity='check-in',
-                    timestamp=current_time
-                )
+        payload, status_code = _escalate_ping(employee_id, decision.action, match)
+        return Response(payload, status=status_code)
 
-                # Update last login
-                request.user.last_login = current_time
-                request.user.save(update_fields=['last_login'])
+    except Exception as e:
+        return Response({
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-                return Response({
-                    'message': 'Auto check-in successful',
-                    'details': {
-                        'employee_id': employee_id,
-                        'timestamp': activity.timestamp,
-                        'activity': 'check-in',
-                        'distance_from_office': f'{distance:.2f} meters'
-                    }
-                }, status=status.HTTP_200_OK)
-            else:
-                return Response({
-                    'message': 'Already checked in',
-                    'details': {
-                        'last_activity': last_activity.activity,
-                        'timestamp': last_activity.timestamp,
-                        'distance_from_office': f'{distance:.2f} meters'
-                    }
-                }, status=status.HTTP_200_OK)
-
-        # If outside office radius
-        else:
-            # If last activity was check-in, create check-out
-            if last_activity and last_activity.activity == 'check-in':
-                # Create check-out record
-                activity = EmployeeActivity.objects.create(
-                    emp=request.user,
-                    activity='check-out',
-                    timestamp=current_time
-                )
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsSuperuserOrStaff])
+def auto_attend_stats(request):
+    """
+    Counters of the auto_attend ping tracker in this worker process.
+    
+    Returns:
+        - pings: Pings seen
+        - absorbed: Pings answered without a write
+        - escalated: Pings that went to the attendance write path
+        - state_loads: Presence reads to (re)load tracked state
+        - tracked_employees: Employees currently held in memory
+        
+    Permissions:
+        Admin/Staff only
+    """
+    return Response(ping_tracker.tracker.stats())
 
-                # Calculate and store worked hours
-                check_in = EmployeeActivity.objects.filter(
-                    emp=request.user,
-                    activity='check-in',
-                    timestamp__date=today
-                ).order_by('-timestamp').first()
-
-                if check_in:
-                    session_hours = calculate_worked_hours(check_in.timestamp, current_time)
-                    worked_hours_record, created = WorkedHours.objects.get_or_create(
-                        emp=request.user,
-                        work_date=today,
-                        defaults={'worked_hours': Decimal('0.00')}
-                    )
-
-                    # Add current session hours to total
-                    total_minutes = (
-                        int(str(worked_hours_record.worked_hours).split('.')[0]) * 60 +
-                        int(str(worked_hours_record.worked_hours).split('.')[1]) +
-                        int(str(session_hours).split('.')[0]) * 60 +
-                        int(str(session_hours).split('.')[1])
-                    )
-
-                    total_hours = int(total_minutes // 60)
-                    total_minutes = int(total_minutes % 60)
-                    worked_hours_record.worked_hours = Decimal(f"{total_hours}.{total_minutes:02d}")
-                    worked_hours_record.save()
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsSuperuserOrStaff])
+def login_stats(request):
+    """
+    Counters and latencies of the login password verification pool in this
+    worker process.
+    
+    Returns:
+        - workers: Pool processes (0 when verification runs inline)
+        - pending: Verifications queued or running
+        - verified / rehashed: Verifications done, and passwords rehashed by them
+        - rejected / timed_out / broken: Logins answered 503
+        - queued_ms / verifying_ms: p50, p95 and max of recent verifications
+        
+    Permissions:
+        Admin/Staff only
+    """
+    return Response(password_pool.pool.stats())
 
-                return Response({
-                    'message': 'Auto check-out successful',
-                    'details': {
-                        'employee_id': employee_id,
-                        'timestamp': activity.timestamp,
-                        'activity': 'check-out',
-                        'distance_from_office': f'{distance:.2f} meters',
-                        'session_hours': str(session_hours),
-                        'total_worked_hours': str(worked_hours_record.worked_hours)
-                    }
-                }, status=status.HTTP_200_OK)
+def _presence_payload(employee_id, presence):
+    """
+    Presence status payload when the presence row (possibly None) has been
+    read. Returns (payload, status), shared by the sync and async views.
+    """
+    if presence is None:
+        if not Employee.objects.filter(employee_id=employee_id).exists():
+            return {
+                'error': f'Employee with ID {employee_id} not found'
+            }, status.HTTP_404_NOT_FOUND
+        presence = presence_from_history(employee_id)
 
-            return Response({
-                'message': 'Outside office radius',
-                'details': {
-                    'distance_from_office': f'{distance:.2f} meters',
-                    'max_allowed': '200 meters'
-                }
-            }, status=status.HTTP_200_OK)
+    return EmployeePresenceSerializer(presence).data, status.HTTP_200_OK
 
-    except Exception as e:
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def presence_status(request):
+    """
+    Get the current presence of an employee.
+    
+    Methods:
+        GET
+        
+    Parameters:
+        - employee: Employee ID (staff only, defaults to the caller)
+        
+    Returns:
+        - Success (200): Current state, open session start and today's minutes
+        - Error (404): Employee not found
+    """
+    employee_id = request.user.employee_id
+    if request.user.is_superuser or request.user.is_staff:
+        employee_id = request.query_params.get('employee', employee_id)
+
+    presence = EmployeePresence.objects.filter(employee_id=employee_id).first()
+    payload, status_code = _presence_payload(employee_id, presence)
+    return Response(payload, status=status_code)
+
+def _parse_scan_time(value):
+    """Parse an ISO 8601 client timestamp, assuming the current timezone when naive"""
+    at = parse_datetime(value) if isinstance(value, str) else None
+    if at is not None and timezone.is_naive(at):
+        at = timezone.make_aware(at)
+    return at
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsSuperuserOrStaff])
+def mark_attendance_batch(request):
+    """
+    Ingest an ordered batch of offline kiosk scans.
+    
+    Methods:
+        POST
+        
+    Required Data:
+        - scans: List of objects with employee_id, code, type, latitude,
+          longitude and timestamp (ISO 8601, time of the scan on the kiosk)
+          
+    Validations (per scan):
+        - QR code valid at the scan timestamp
+        - Location within the radius of a valid office
+        - Proper check-in/out sequence, applied per employee in time order
+        
+    Returns:
+        - Success (200): Per-item outcomes plus accepted/rejected counts
+        - Error (400): Malformed batch
+        
+    Permissions:
+        Admin/Staff only (kiosk accounts)
+    """
+    items = request.data.get('scans')
+    max_size = getattr(settings, 'ATTENDANCE_BATCH_MAX_SCANS', 1000)
+    if not isinstance(items, list) or not items:
         return Response({
-            'error': str(e)
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            'error': 'scans must be a non-empty list'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if len(items) > max_size:
+        return Response({
+            'error': f'A batch can contain at most {max_size} scans'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    results = [{'index': index, 'status': 'rejected'} for index in range(len(items))]
+    latest_allowed = timezone.now() + timedelta(seconds=60)
+    windows = qr_codes.stored_code_windows({
+        item.get('code') for item in items if isinstance(item, dict) and isinstance(item.get('code'), str)
+    })
+
+    scans, scan_indexes = [], []
+    for index, item in enumerate(items):
+        result = results[index]
+        if not isinstance(item, dict):
+            result['error'] = 'Scan must be an object'
+            continue
+        result['employee_id'] = item.get('employee_id')
+
+        required = ['employee_id', 'code', 'type', 'latitude', 'longitude', 'timestamp']
+        missing = [field for field in required if not item.get(field)]
+        if missing:
+            result['error'] = f'Missing required fields: {", ".join(missing)}'
+            continue
+
+        at = _parse_scan_time(item['timestamp'])
+        if at is None:
+            result['error'] = 'Invalid timestamp'
+            continue
+        if at > latest_allowed:
+            result['error'] = 'Timestamp is in the future'
+            continue
+
+        try:
+            match = geofence.locate(item['latitude'], item['longitude'])
+        except (TypeError, ValueError):
+            result['error'] = 'Invalid coordinates'
+            continue
+        if match is None:
+            result['error'] = 'No valid office location found'
+            continue
+        if not match.inside:
+            result['error'] = 'You are too far from the office location'
+            result['distance'] = f'{match.distance:.2f} meters'
+            continue
+
+        if not qr_codes.is_valid_code_at(str(item['code']), item['type'], at, windows):
+            result['error'] = 'Invalid or expired QR code'
+            continue
+
+        scans.append(Scan(employee_id=item['employee_id'], usage_type=item['type'], at=at))
+        scan_indexes.append(index)
+
+    for index, outcome in zip(scan_indexes, record_attendance_batch(scans)):
+        result = results[index]
+        if outcome.error is not None:
+            result.update(outcome.error.payload)
+            continue
+        result['status'] = 'accepted'
+        result['activity'] = outcome.activity.activity
+        result['timestamp'] = outcome.activity.timestamp
+        if outcome.session_minutes is not None:
+            result['session_hours'] = format_minutes(outcome.session_minutes)
+
+    accepted = sum(1 for result in results if result['status'] == 'accepted')
+    return Response({
+        'accepted': accepted,
+        'rejected': len(results) - accepted,
+        'results': results
+    }, status=status.HTTP_200_OK)
+
+def _total_worked(worked_hours):
+    """Integer SUM of worked minutes over a WorkedHours queryset, plus its H:MM form"""
+    total = worked_hours.aggregate(total=Sum('worked_minutes'))['total'] or 0
+    return {'total_minutes': total, 'total': format_minutes(total)}
+
+def _worked_rows(rows):
+    """WorkedHours values() rows with worked_hours in its H:MM display form, as WorkedHoursSerializer"""
+    return [{**row, 'worked_hours': format_minutes(row['worked_minutes'])} for row in rows]
 
 class AttendanceLogsViewSet(viewsets.ReadOnlyModelViewSet):
     """
@@ -1024,12 +1238,14 @@ class AttendanceLogsViewSet(viewsets.ReadOnlyModelViewSet):
         GET /attendance-logs/ - List all logs
         GET /attendance-logs/summary/ - Get summary
         GET /attendance-logs/employee_stats/ - Get employee statistics
+        GET /attendance-logs/export/ - Stream logs as CSV/NDJSON
         
     Features:
         - Detailed attendance records
         - Working hours calculation
         - Activity patterns
         - Leave integration
+        - Keyset pagination of the list, newest first (cursor, page_size)
         
     Filters:
         - By date range
@@ -1038,6 +1254,7 @@ class AttendanceLogsViewSet(viewsets.ReadOnlyModelViewSet):
     """
     permission_classes = [IsAuthenticated]
     serializer_class = EmployeeActivitySerializer
+    pagination_class = ActivityLogPagination
 
     def get_queryset(self):
         queryset = EmployeeActivity.objects.all()
@@ -1053,23 +1270,25 @@ class AttendanceLogsViewSet(viewsets.ReadOnlyModelViewSet):
         activity_type = self.request.query_params.get('activity')
         hour = self.request.query_params.get('hour')
         
-        # Apply filters
+        # Apply filters (sargable: see date_ranges)
         if employee_id:
             queryset = queryset.filter(emp__employee_id=employee_id)
-        if start_date:
-            queryset = queryset.filter(timestamp__date__gte=start_date)
-        if end_date:
-            queryset = queryset.filter(timestamp__date__lte=end_date)
+        queryset = date_ranges.timestamp_range(queryset, start_date, end_date)
         if activity_type:
             queryset = queryset.filter(activity=activity_type)
-        if hour:
-            queryset = queryset.filter(timestamp__hour=hour)
+        queryset = date_ranges.hour_of_day(queryset, hour)
 
         return queryset.select_related('emp').order_by('-timestamp')
 
     @action(detail=False, methods=['get'])
     def summary(self, request):
-        """Get attendance summary with worked hours"""
+        """
+        Get attendance summary with worked hours.
+
+        Activity counts for days before today come from the rollup tables
+        (see rollups.py); only today's activities are aggregated from
+        employee_activity.
+        """
         queryset = self.get_queryset()
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
@@ -1086,93 +1305,93 @@ class AttendanceLogsViewSet(viewsets.ReadOnlyModelViewSet):
         if end_date:
             worked_hours = worked_hours.filter(work_date__lte=end_date)
 
-        # Get activity counts by date
-        activity_counts = queryset.annotate(
-            date=TruncDate('timestamp')
-        ).values('date', 'activity').annotate(
-            count=Count('id')
-        ).order_by('date')
-
-        # Get hourly distribution
-        hourly_distribution = queryset.annotate(
-            hour=TruncHour('timestamp')
-        ).values('hour', 'activity').annotate(
-            count=Count('id')
-        ).order_by('hour')
+        # Closed days from the rollups, with the same filters as get_queryset()
+        today = timezone.localdate()
+        if request.user.is_superuser or request.user.is_staff:
+            filters = {
+                'employee_id': employee_id,
+                'start_date': start_date,
+                'end_date': end_date,
+                'activity': request.query_params.get('activity'),
+                'hour': request.query_params.get('hour'),
+            }
+        else:
+            filters = {'employee_id': request.user.employee_id}
+        activity_counts, hourly_distribution = rollups.closed_counts(today, **filters)
+        activity_counts, hourly_distribution = list(activity_counts), list(hourly_distribution)
+
+        # The open current day from the raw rows
+        end = date_ranges.parse_day(filters.get('end_date'), 'end_date')
+        if end is None or end >= today:
+            live = queryset.filter(timestamp__gte=date_ranges.day_start(today))
+
+            # Get activity counts by date
+            activity_counts += live.annotate(
+                date=TruncDate('timestamp')
+            ).values('date', 'activity').annotate(
+                count=Count('id')
+            ).order_by('date')
+
+            # Get hourly distribution
+            hourly_distribution += live.annotate(
+                hour=TruncHour('timestamp')
+            ).values('hour', 'activity').annotate(
+                count=Count('id')
+            ).order_by('hour')
 
         return Response({
-            'worked_hours': worked_hours.values(
+            'worked_hours': _worked_rows(worked_hours.values(
                 'work_date', 
                 'emp__employee_id', 
                 'emp__username',
-                'worked_hours'
-            ),
+                'worked_minutes'
+            )),
             'activity_counts': activity_counts,
             'hourly_distribution': hourly_distribution,
-            'total_worked_hours': worked_hours.aggregate(
-                total=Sum('worked_hours')
-            )
+            'total_worked_hours': _total_worked(worked_hours)
         })
 
     @action(detail=False, methods=['get'])
     def employee_stats(self, request):
-        """Get detailed statistics for specific employee(s)"""
+        """
+        Get detailed statistics for specific employee(s), a page of employees
+        at a time (page, page_size). The query count does not depend on the
+        page size, see stats.employee_stats.
+        """
         employee_id = request.query_params.get('employee')
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
 
         # Base queryset for employees
-        employees = Employee.objects.all()
+        employees = Employee.objects.only('employee_id', 'username').order_by('employee_id')
         if not (request.user.is_superuser or request.user.is_staff):
             employees = employees.filter(employee_id=request.user.employee_id)
         elif employee_id:
             employees = employees.filter(employee_id=employee_id)
 
-        stats = []
-        for emp in employees:
-            # Get attendance records
-            activities = EmployeeActivity.objects.filter(emp=emp)
-            if start_date:
-                activities = activities.filter(timestamp__date__gte=start_date)
-            if end_date:
-                activities = activities.filter(timestamp__date__lte=end_date)
-
-            # Get worked hours
-            worked_hours = WorkedHours.objects.filter(emp=emp)
-            if start_date:
-                worked_hours = worked_hours.filter(work_date__gte=start_date)
-            if end_date:
-                worked_hours = worked_hours.filter(work_date__lte=end_date)
-
-            # Get leave records
-            leaves = LeaveRequest.objects.filter(employee=emp)
-            if start_date:
-                leaves = leaves.filter(start_date__gte=start_date)
-            if end_date:
-                leaves = leaves.filter(end_date__lte=end_date)
-
-            stats.append({
-                'employee_id': emp.employee_id,
-                'username': emp.username,
-                'attendance': activities.values('timestamp', 'activity'),
-                'worked_hours': worked_hours.values('work_date', 'worked_hours'),
-                'total_worked_hours': worked_hours.aggregate(total=Sum('worked_hours')),
-                'leaves': leaves.values(
-                    'start_date', 
-                    'end_date', 
-                    'leave_type__name',
-                    'status'
-                ),
-                'check_in_distribution': activities.filter(
-                    activity='check-in'
-                ).annotate(
-                    hour=TruncHour('timestamp')
-                ).values('hour').annotate(
-                    count=Count('id')
-                ).order_by('hour')
-            })
-
-        return Response(stats)
+        paginator = EmployeeStatsPagination()
+        page = paginator.paginate_queryset(employees, request, view=self)
+        return paginator.get_paginated_response(stats.employee_stats(page, start_date, end_date))
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream the filtered activities as a file, with the same filters as the list.
+
+        Parameters:
+            export_format: 'csv' (default), 'ndjson' or 'arrow' (Arrow IPC stream, needs pyarrow)
+
+        Features:
+            - Rows are streamed in keyset chunks, memory stays flat
+            - Compressed on the fly when the client sends Accept-Encoding: gzip
+        """
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in exports.available_formats():
+            return Response({
+                'error': f'export_format must be one of: {", ".join(exports.available_formats())}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return exports.export_response(request, 'attendance-logs', export_format, exports.ACTIVITY, self.get_queryset())
 
 class WorkedHoursViewSet(viewsets.ReadOnlyModelViewSet):
     """
@@ -1183,11 +1402,13 @@ class WorkedHoursViewSet(viewsets.ReadOnlyModelViewSet):
         GET /worked-hours/daily_hours/ - Day-wise breakdown
         GET /worked-hours/date_wise/ - Date specific records
         GET /worked-hours/total_hours/ - Total hours calculation
+        GET /worked-hours/export/ - Stream records as CSV/NDJSON
         
     Features:
         - Daily hours tracking
         - Total hours calculation
         - Multiple session support
+        - Keyset pagination of the list, latest date first (cursor, page_size)
         
     Filters:
         - By date range
@@ -1196,6 +1417,7 @@ class WorkedHoursViewSet(viewsets.ReadOnlyModelViewSet):
     """
     permission_classes = [IsAuthenticated]
     serializer_class = WorkedHoursSerializer
+    pagination_class = WorkedHoursPagination
 
     def get_queryset(self):
         queryset = WorkedHours.objects.all()
@@ -1214,11 +1436,8 @@ class WorkedHoursViewSet(viewsets.ReadOnlyModelViewSet):
         if employee_id:
             queryset = queryset.filter(emp__employee_id=employee_id)
         if date:  # Exact date match
-            queryset = queryset.filter(work_date=date)
-        if start_date:
-            queryset = queryset.filter(work_date__gte=start_date)
-        if end_date:
-            queryset = queryset.filter(work_date__lte=end_date)
+            queryset = queryset.filter(work_date=date_ranges.parse_day(date))
+        queryset = date_ranges.date_range(queryset, start_date, end_date)
 
         return queryset.select_related('emp')
 
@@ -1227,12 +1446,12 @@ class WorkedHoursViewSet(viewsets.ReadOnlyModelViewSet):
         """Get day-wise worked hours"""
         queryset = self.get_queryset()
         return Response({
-            'daily_hours': queryset.values(
+            'daily_hours': _worked_rows(queryset.values(
                 'work_date', 
                 'emp__employee_id', 
                 'emp__username', 
-                'worked_hours'
-            ).order_by('-work_date'),
+                'worked_minutes'
+            ).order_by('-work_date')),
             'total_days': queryset.count()
         })
 
@@ -1248,19 +1467,39 @@ class WorkedHoursViewSet(viewsets.ReadOnlyModelViewSet):
         queryset = self.get_queryset().filter(work_date=date)
         return Response({
             'date': date,
-            'records': queryset.values(
+            'records': _worked_rows(queryset.values(
                 'emp__employee_id',
                 'emp__username',
-                'worked_hours'
-            ).order_by('emp__employee_id')
+                'worked_minutes'
+            ).order_by('emp__employee_id'))
         })
 
     @action(detail=False, methods=['get'])
     def total_hours(self, request):
         """Get total worked hours for employee(s)"""
-        queryset = self.get_queryset()
-        total = queryset.aggregate(total=Sum('worked_hours'))
+        total = self.get_queryset().aggregate(total=Sum('worked_minutes'))['total'] or 0
         
         return Response({
-            'total_hours': str(total['total'] or 0)
+            'total_minutes': total,
+            'total_hours': format_minutes(total)
         })
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream the filtered worked hours records as a file, with the same filters as the list.
+
+        Parameters:
+            export_format: 'csv' (default), 'ndjson' or 'arrow' (Arrow IPC stream, needs pyarrow)
+
+        Features:
+            - Rows are streamed in keyset chunks, memory stays flat
+            - Compressed on the fly when the client sends Accept-Encoding: gzip
+        """
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in exports.available_formats():
+            return Response({
+                'error': f'export_format must be one of: {", ".join(exports.available_formats())}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return exports.export_response(request, 'worked-hours', export_format, exports.WORKED_HOURS, self.get_queryset())
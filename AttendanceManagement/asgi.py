@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'AttendanceManagement.settings')
+# Route the hot attendance endpoints to the native async views
+os.environ.setdefault('ATTENDANCE_ASGI', '1')
 
 application = get_asgi_application()
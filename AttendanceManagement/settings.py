@@ -91,6 +91,16 @@ DATABASES = {
 
 AUTH_PASSWORD_VALIDATORS = []
 
+# Hasher policy: new passwords use the first hasher; passwords stored with any
+# other listed hasher, or another PBKDF2 iteration count, still verify and are
+# rehashed on the next successful login
+PASSWORD_HASHERS = [
+    'Attendance.hashers.ConfiguredPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+PASSWORD_PBKDF2_ITERATIONS = 1000000
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
@@ -123,7 +133,7 @@ SESSION_ENGINE = None
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'Attendance.authentication.RevocableJWTAuthentication',
     ),
     'DEFAULT_RENDERER_CLASSES': (
         'rest_framework.renderers.JSONRenderer',
@@ -193,3 +203,75 @@ MIGRATION_MODULES = {
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Cache used for cross-worker version stamps (geofence). Point this at a shared
+# backend (Redis/Memcached) when running several workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Geofence cache: seconds between version checks, and hard reload interval
+GEOFENCE_CHECK_SECONDS = 5
+GEOFENCE_MAX_AGE_SECONDS = 300
+
+# Signed rotating QR codes (verified without a qr_details lookup). The stored
+# qr_details codes keep working when this is enabled.
+QR_SIGNED_CODES = False
+QR_SIGNING_KEY = None  # Defaults to SECRET_KEY
+QR_ROTATION_SECONDS = 30
+QR_ALLOWED_SKEW_WINDOWS = 1
+
+# Seconds a worker serves the current stored QR code from the cache before
+# re-reading qr_details (bounds how long other workers show a replaced code)
+QR_CURRENT_CODE_CACHE_SECONDS = 5
+
+# Largest number of scans accepted by one offline batch upload
+ATTENDANCE_BATCH_MAX_SCANS = 1000
+
+# auto_attend ping tracker: hysteresis band around the office radius, time a
+# transition must persist before it is written, and how long tracked state is
+# trusted before re-reading employee_presence
+AUTO_ATTEND_HYSTERESIS_METERS = 25
+AUTO_ATTEND_MIN_DWELL_SECONDS = 30
+AUTO_ATTEND_STATE_TTL_SECONDS = 60
+
+# Serve auto_attend, attend and presence from the native async views. Set by
+# asgi.py; WSGI deployments keep the sync DRF views.
+ATTENDANCE_ASYNC_VIEWS = os.environ.get('ATTENDANCE_ASGI') == '1'
+
+# Write-behind attendance journal. When set to a directory, accepted scans are
+# appended to a per-process journal there, acknowledged once fsynced, and
+# written to the database by a background flusher. None writes through.
+ATTENDANCE_JOURNAL_DIR = None
+ATTENDANCE_JOURNAL_FLUSH_SECONDS = 1
+ATTENDANCE_JOURNAL_BATCH_SIZE = 500
+ATTENDANCE_JOURNAL_COMPACT_BYTES = 1024 * 1024  # Truncate fully flushed journals past this size
+
+# Hours credited by close_open_sessions for a session that was never checked out
+ATTENDANCE_MISSING_CHECKOUT_HOURS = 2
+
+# How long responses to requests carrying an Idempotency-Key are kept for replay
+IDEMPOTENCY_KEY_TTL_SECONDS = 24 * 60 * 60
+
+# In-memory token revocation list (RevocableJWTAuthentication): seconds between
+# incremental reads of newly blacklisted tokens, and Bloom filter sizing
+TOKEN_REVOCATION_REFRESH_SECONDS = 5
+TOKEN_REVOCATION_BLOOM_CAPACITY = 100000
+TOKEN_REVOCATION_BLOOM_ERROR_RATE = 0.001
+
+# Seconds an authenticated principal (employee flags read by permission checks)
+# is served from the cache before the employee row is read again
+PRINCIPAL_CACHE_SECONDS = 30
+
+# What token_blacklist_outstandingtoken.token stores for issued tokens: 'full'
+# (the encoded token) or 'hash' (its SHA-256; revocation only needs the JTI)
+OUTSTANDING_TOKEN_STORAGE = 'full'
+
+# Opt-in pool verifying login passwords in worker processes (0 verifies in the
+# request worker), verifications allowed to queue before logins answer 503,
+# and seconds a login waits for its verification
+LOGIN_PASSWORD_POOL_WORKERS = 0
+LOGIN_PASSWORD_POOL_MAX_PENDING = 64
+LOGIN_PASSWORD_POOL_TIMEOUT_SECONDS = 10
@@ -5,4 +5,6 @@ pip install djangorestframework-simplejwt
 pip install djangorestframework-simplejwt[token_blacklist]
 pip install django-cors-headers
 pip install mysql-connector-python
-pip install qrcode
\ No newline at end of file
+pip install qrcode
+pip install numpy
+pip install pyarrow  # Optional: Parquet/Arrow exports
\ No newline at end of file